@@ -1,22 +1,23 @@
 from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.core.token_utils import create_token
 from app.schemas.auth import EmailVerificationRequest, UserLogin, UserRegister
 from app.schemas.users import UserResponse
-from app.services.auth_service import get_current_user, login, register, resend_verification_code, verify_email, verify_refresh_token
+from app.services.auth_service import get_current_user, login, logout, register, resend_verification_code, verify_email, verify_refresh_token
 from app.utils.response import success_response
 router = APIRouter()
 
 # Đăng ký tài khoản người dùng mới.
 @router.post("/register")
-def auth_register(user_in: UserRegister, db: Session = Depends(get_db)):
-    return success_response(register(db, user_in))
+async def auth_register(user_in: UserRegister, db: AsyncSession = Depends(get_async_db)):
+    return success_response(await register(db, user_in))
 
 # Đăng nhập tài khoản.
 @router.post("/login")
-def login_route(user_in: UserLogin, db: Session = Depends(get_db), request: Request = None):
-    result = login(db, user_in , request)
+async def login_route(user_in: UserLogin, db: AsyncSession = Depends(get_async_db), request: Request = None):
+    result = await login(db, user_in , request)
     return success_response(result)
 
 # Xác nhận email với mã OTP
@@ -35,8 +36,13 @@ def get_user_info(current_user:UserResponse = Depends(get_current_user)):
     return success_response(current_user)
 
 @router.post("/refresh-token")
-def refresh_access_token(token: str, db: Session = Depends(get_db)):
-    # Xác minh refresh token
-    token_data = verify_refresh_token(token, db)
+def refresh_access_token(token: str, db: Session = Depends(get_db), request: Request = None):
+    # Xác minh refresh token (token cũ bị đánh dấu đã dùng, trả về refresh token mới)
+    token_data = verify_refresh_token(token, db, request)
     # Trả về theo format chung
-    return success_response(token_data)
\ No newline at end of file
+    return success_response(token_data)
+
+# Đăng xuất: thu hồi refresh token và các access token cùng họ
+@router.post("/logout")
+def logout_route(token: str, db: Session = Depends(get_db)):
+    return success_response(logout(db, token))
\ No newline at end of file
@@ -1,17 +1,32 @@
-from fastapi import APIRouter, Depends
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from app.core.database import get_db
-from app.services.tickets_service import get_all_bookings, get_booking_by_code
+from app.core.query_budget import query_budget
+from app.models.tickets import TicketStatusEnum
+from app.services.tickets_service import get_bookings_page, get_booking_by_code
 from app.utils.response import success_response
 
 router = APIRouter()
 
 
 @router.get('/bookings')
-def list_bookings(db: Session = Depends(get_db)):
-    return success_response(get_all_bookings(db))
+@query_budget(3)
+def list_bookings(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    show_date: Optional[date] = Query(None, alias='date'),
+    showtime_id: Optional[int] = None,
+    status: Optional[TicketStatusEnum] = None,
+    db: Session = Depends(get_db),
+):
+    return success_response(get_bookings_page(
+        db, limit=limit, cursor=cursor, show_date=show_date, showtime_id=showtime_id, ticket_status=status
+    ))
 
 
 @router.get('/bookings/{booking_code}')
+@query_budget(3)
 def get_booking(booking_code: str, db: Session = Depends(get_db)):
     return success_response(get_booking_by_code(db, booking_code))
@@ -12,8 +12,12 @@ router = APIRouter()
 
 
 @router.get("/combos")
-def list_combos(skip: int = 0, limit: int = 10, search_query: Optional[str] = None, db: Session = Depends(get_db)):
-    return success_response(get_all_combos(db, skip, limit, search_query))
+def list_combos(
+    skip: int = 0, limit: int = 10, search_query: Optional[str] = None,
+    cursor: Optional[str] = None, count: str = "exact", db: Session = Depends(get_db),
+):
+    # cursor: next_cursor của trang trước (keyset); count: exact | estimated | none
+    return success_response(get_all_combos(db, skip, limit, search_query, cursor, count))
 
 
 @router.get("/combos/{combo_id}")
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, Query
+from app.core.loop_monitor import loop_monitor
+from app.core.password_hasher import password_hasher
+from app.core.pool_metrics import get_pool_stats, reset_pool_stats
+from app.core.principal_cache import principal_cache
+from app.core.token_revocation import revoked_token_families
+from app.core.security import require_permission
+from app.utils.response import success_response
+
+router = APIRouter()
+
+
+@router.get('/loop-lag')
+async def get_loop_lag(top: int = Query(10, ge=1, le=100), current_user=Depends(require_permission("report_view"))):
+    """Độ trễ event loop và các route/vị trí code chặn loop nhiều nhất"""
+    return success_response(loop_monitor.stats(top))
+
+
+@router.post('/loop-lag/reset')
+async def reset_loop_lag(current_user=Depends(require_permission("system_config"))):
+    loop_monitor.reset()
+    return success_response({"reset": True})
+
+
+@router.get('/db-pool')
+async def get_db_pool(current_user=Depends(require_permission("report_view"))):
+    """Thống kê connection pool: thời gian chờ checkout, số connection đang dùng, overflow"""
+    return success_response(get_pool_stats())
+
+
+@router.post('/db-pool/reset')
+async def reset_db_pool(current_user=Depends(require_permission("system_config"))):
+    reset_pool_stats()
+    return success_response({"reset": True})
+
+
+@router.get('/password-hasher')
+async def get_password_hasher(current_user=Depends(require_permission("report_view"))):
+    """Nhóm thread băm mật khẩu: số việc đang chạy/đang chờ, số yêu cầu bị từ chối, thời gian chờ"""
+    return success_response(password_hasher.stats())
+
+
+@router.post('/password-hasher/reset')
+async def reset_password_hasher(current_user=Depends(require_permission("system_config"))):
+    password_hasher.reset()
+    return success_response({"reset": True})
+
+
+@router.get('/auth-cache')
+async def get_auth_cache(current_user=Depends(require_permission("report_view"))):
+    """Principal cache và tập họ token bị thu hồi (Bloom filter)"""
+    return success_response({
+        "principals": principal_cache.stats(),
+        "revoked_token_families": revoked_token_families.stats(),
+    })
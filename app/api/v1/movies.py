@@ -19,11 +19,13 @@ def list_movies(
     limit: int = 10,
     search_query: Optional[str] = None,
     status: Optional[str] = None,
+    cursor: Optional[str] = None,  # next_cursor của trang trước (keyset, bỏ qua skip)
+    count: str = "exact",  # exact | estimated | none
     # _ = Depends(get_current_active_user)
 ):
     return success_response(
         get_all_movies(
-            db, skip=skip, limit=limit, search_query=search_query, status=status
+            db, skip=skip, limit=limit, search_query=search_query, status=status, cursor=cursor, count=count
         )
     )
 
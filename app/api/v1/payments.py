@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
 from app.services.payments_service import PaymentService
 from app.schemas.payments import PaymentRequest
 from app.utils.response import success_response
@@ -15,12 +15,12 @@ payment_service = PaymentService()
 async def create_vnpay_payment(
     payment_request: PaymentRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_active_user),
 ):
     try:
         client_ip = request.client.host
-        payment = payment_service.create_payment(db, payment_request, client_ip, user_id=current_user.user_id)
+        payment = await payment_service.create_payment(db, payment_request, client_ip, user_id=current_user.user_id)
         return success_response(payment)
     
     except ValueError as e:
@@ -32,21 +32,15 @@ async def create_vnpay_payment(
 @router.get("/vnpay/return")
 async def vnpay_return_callback(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Handle VNPay return callback (when user returns from VNPay)
+    Dùng chung pipeline chốt thanh toán với IPN: request đến sau chỉ đọc kết quả đã chốt
     """
     try:
-        # Get query parameters
-        query_params = dict(request.query_params)
-
-        # Process return callback
-        payment_result = payment_service.handle_vnpay_callback(db, query_params)
-
-        # Update payment status and process ticket creation
-        result = payment_service.update_payment_status(db, payment_result.order_id, payment_result)
-
+        result = await payment_service.finalize_vnpay_payment(db, dict(request.query_params))
+        result.pop("ipn_code", None)
         return result
     except HTTPException:
         raise
@@ -54,10 +48,21 @@ async def vnpay_return_callback(
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# Thông điệp theo mã phản hồi IPN của VNPay
+IPN_MESSAGES = {
+    '00': 'Confirm Success',
+    '01': 'Order not found',
+    '02': 'Order already confirmed',
+    '04': 'Invalid amount',
+    '97': 'Invalid signature',
+    '99': 'Unknow error',
+}
+
+
 @router.post("/vnpay/ipn")
 async def vnpay_ipn_callback(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Handle VNPay IPN (Instant Payment Notification) callback
@@ -65,34 +70,15 @@ async def vnpay_ipn_callback(
     """
     try:
         # Get query parameters (VNPay sends data as query parameters)
-        query_params = dict(request.query_params)
-        
-        # Process IPN callback
-        payment_result = payment_service.handle_vnpay_callback(query_params)
-        
-        # Update payment status and process ticket creation
-        result = payment_service.update_payment_status(db, payment_result.order_id, payment_result)
-        
-        # Return response to VNPay
-        if payment_result.success:
-            return JSONResponse(
-                content={'RspCode': '00', 'Message': 'Confirm Success'},
-                status_code=200
-            )
-        else:
-            return JSONResponse(
-                content={'RspCode': '99', 'Message': 'Unknow error'},
-                status_code=200
-            )
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        # Always return success to VNPay to avoid retry
-        return JSONResponse(
-            content={'RspCode': '99', 'Message': 'Unknow error'},
-            status_code=200
-        )
+        result = await payment_service.finalize_vnpay_payment(db, dict(request.query_params))
+        rsp_code = result["ipn_code"]
+    except Exception:
+        # Lỗi chưa chốt được đơn: trả 99 để VNPay gửi lại IPN
+        rsp_code = '99'
+    return JSONResponse(
+        content={'RspCode': rsp_code, 'Message': IPN_MESSAGES[rsp_code]},
+        status_code=200
+    )
 
 
 # TODO: Implement query và refund endpoints sau khi cần thiết
@@ -101,14 +87,14 @@ async def vnpay_ipn_callback(
 @router.get("/payment-status/{order_id}")
 async def get_payment_status(
     order_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get payment status for an order
     """
     try:
         # Get payment status from database
-        payment = payment_service.get_payment_by_order_id(db, order_id)
+        payment = await payment_service.get_payment_by_order_id(db, order_id)
         
         if not payment:
             raise HTTPException(status_code=404, detail="Payment not found")
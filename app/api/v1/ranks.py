@@ -10,8 +10,12 @@ from app.utils.response import success_response
 router = APIRouter()
 # ==================== RANKS ROUTES ====================
 @router.get("/ranks")
-def list_ranks(skip: int = 0, limit: int = 10, search_query: Optional[str] = None, db: Session = Depends(get_db)):
-    return success_response(get_all_ranks(db, skip, limit, search_query))
+def list_ranks(
+    skip: int = 0, limit: int = 10, search_query: Optional[str] = None,
+    cursor: Optional[str] = None, count: str = "exact", db: Session = Depends(get_db),
+):
+    # cursor: next_cursor của trang trước (keyset); count: exact | estimated | none
+    return success_response(get_all_ranks(db, skip, limit, search_query, cursor, count))
 
 @router.get("/ranks/{rank_id}")
 def detail_rank(rank_id: int, db: Session = Depends(get_db)):
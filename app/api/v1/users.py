@@ -10,8 +10,12 @@ router = APIRouter()
 
 # Lấy danh sách tất cả người dùng
 @router.get("/users")
-def list_users(skip: int = 0, limit: int = 10, search_query: Optional[str] = None, db: Session = Depends(get_db)):
-    return success_response(get_all_users(db, skip, limit, search_query))
+def list_users(
+    skip: int = 0, limit: int = 10, search_query: Optional[str] = None,
+    cursor: Optional[str] = None, count: str = "exact", db: Session = Depends(get_db),
+):
+    # cursor: next_cursor của trang trước (keyset); count: exact | estimated | none
+    return success_response(get_all_users(db, skip, limit, search_query, cursor, count))
 
 # Lấy chi tiết một người dùng theo ID
 @router.get("/users/{user_id}")
@@ -1,12 +1,12 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from sqlalchemy.orm import Session
-import json
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 import asyncio
 
-from app.core.database import get_db
+from app.core.database import get_async_db
+from app.core.seat_occupancy import seat_occupancy
+from app.core.websocket_frames import PONG_FRAME, DecodeError, decode_frame, encode_frame
 from app.core.websocket_manager import websocket_manager
-from app.services.reservations_service import get_reserved_seats
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -16,7 +16,9 @@ async def websocket_endpoint(
     websocket: WebSocket, 
     showtime_id: int,
     session_id: str = Query(None),
-    db: Session = Depends(get_db)
+    since_seq: int = Query(None),
+    stream_id: str = Query(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Endpoint WebSocket chính cho cập nhật trạng thái ghế theo thời gian thực"""
     
@@ -28,8 +30,13 @@ async def websocket_endpoint(
         return
     
     try:
-        # Gửi dữ liệu ban đầu khi client kết nối
-        await send_initial_data(websocket, showtime_id, db)
+        # Client kết nối lại: chỉ gửi các delta bị lỡ nếu bộ đệm còn bao phủ since_seq,
+        # ngược lại gửi dữ liệu ban đầu (snapshot)
+        resumed = False
+        if since_seq is not None and stream_id:
+            resumed = await websocket_manager.resume(websocket, showtime_id, since_seq, stream_id)
+        if not resumed:
+            await send_initial_data(websocket, showtime_id, db)
         
         # Vòng lặp nhận tin nhắn từ client
         await handle_client_messages(websocket)
@@ -43,32 +50,23 @@ async def websocket_endpoint(
         await websocket_manager.disconnect(websocket)
 
 
-async def send_initial_data(websocket: WebSocket, showtime_id: int, db: Session):
+async def send_initial_data(websocket: WebSocket, showtime_id: int, db: AsyncSession):
     """Gửi dữ liệu ban đầu cho client khi kết nối"""
     try:
         if showtime_id <= 0:
             await send_error(websocket, showtime_id, "Invalid showtime ID")
             return
         
-        # Lấy danh sách ghế đã được đặt
-        reserved_seats = get_reserved_seats(showtime_id, db)
-        
-        initial_data = {
-            "type": "initial_data",
-            "showtime_id": showtime_id,
-            "data": {
-                "reserved_seats": [
-                    {
-                        "seat_id": seat.seat_id,
-                        "status": seat.status,
-                        "expires_at": seat.expires_at.isoformat() if seat.expires_at else None,
-                        "user_session": seat.session_id
-                    } for seat in reserved_seats
-                ]
-            }
-        }
+        # Lấy danh sách ghế đã được đặt từ bộ nhớ đệm (chỉ truy vấn DB khi chưa nạp)
+        seq = websocket_manager.event_log.current_seq(showtime_id)
+        occupancy = await seat_occupancy.get_or_load(showtime_id, db)
+        if occupancy is None:
+            await send_error(websocket, showtime_id, "Showtime not found")
+            return
+        reserved_seats = occupancy.snapshot()
+        initial_data = websocket_manager.build_snapshot_message(showtime_id, reserved_seats, seq)
         
-        await websocket.send_text(json.dumps(initial_data))
+        await websocket_manager.send_personal_message(encode_frame(initial_data), websocket)
         logger.info(f"📤 Sent initial data: {len(reserved_seats)} reserved seats")
         
     except Exception as e:
@@ -86,7 +84,7 @@ async def send_error(websocket: WebSocket, showtime_id: int, error_message: str)
                 "message": error_message
             }
         }
-        await websocket.send_text(json.dumps(error_data))
+        await websocket_manager.send_personal_message(encode_frame(error_data), websocket)
     except Exception as e:
         logger.error(f"❌ Failed to send error message: {e}")
 
@@ -101,19 +99,19 @@ async def handle_client_messages(websocket: WebSocket):
                 timeout=60.0  # 60 giây timeout
             )
             
-            message = json.loads(data)
+            message = decode_frame(data)
             message_type = message.get("type")
             
             # Xử lý các loại tin nhắn
             if message_type == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                await websocket_manager.send_personal_message(PONG_FRAME, websocket)
                 
             elif message_type == "heartbeat":
                 # Heartbeat - giữ kết nối sống
-                await websocket.send_text(json.dumps({
+                await websocket_manager.send_personal_message(encode_frame({
                     "type": "heartbeat_ack",
                     "timestamp": message.get("timestamp")
-                }))
+                }), websocket)
                 
             else:
                 logger.debug(f"📨 Received message type: {message_type}")
@@ -123,7 +121,7 @@ async def handle_client_messages(websocket: WebSocket):
         raise WebSocketDisconnect()
     except WebSocketDisconnect:
         raise
-    except json.JSONDecodeError as e:
+    except DecodeError as e:
         logger.error(f"❌ Invalid JSON received: {e}")
     except Exception as e:
         logger.error(f"❌ Error handling message: {e}", exc_info=True)
@@ -1,68 +1,152 @@
 """
 Background Tasks - Các tác vụ chạy nền cho hệ thống realtime
-File này quản lý các tác vụ chạy nền, chủ yếu để dọn dẹp ghế hết hạn và gửi thông báo WebSocket
+File này quản lý các tác vụ chạy nền, chủ yếu để dọn dẹp ghế hết hạn và gửi thông báo WebSocket.
+Thay vì quét định kỳ 30 giây, tác vụ dọn dẹp dùng một min-heap các thời điểm hết hạn
+và ngủ đúng đến hạn tiếp theo.
 """
 
 import asyncio
+import heapq
 import logging
-from sqlalchemy.orm import Session
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
 
-from app.core.database import SessionLocal
-from app.services.reservations_service import delete_expired_reservations
+from app.core.config import settings
+from app.core.database import BackgroundSessionLocal
+from app.core.token_revocation import revoked_token_families
+from app.services.reservations_service import delete_expired_reservations, get_pending_expiry_deadlines
 
 logger = logging.getLogger(__name__)
 
+# Khoảng thời gian tối đa giữa hai lần quét, để bắt các reservation do worker khác tạo
+SAFETY_SWEEP_INTERVAL = 60
+
 
 class BackgroundTasks:
     """Lớp quản lý các tác vụ chạy nền cho hệ thống đặt vé realtime"""
-    
+
     def __init__(self):
         self.running = False  # Trạng thái chạy của tác vụ nền
         self.task = None      # Task asyncio đang chạy
+        self.revocation_task = None  # Task đồng bộ các họ token bị thu hồi
+        self._deadlines: List[float] = []  # Min-heap thời điểm hết hạn (epoch seconds)
+        self._wakeup: Optional[asyncio.Event] = None  # Đánh thức khi có hạn sớm hơn
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+
+    def schedule_expiry(self, expires_at: datetime):
+        """Đăng ký thời điểm hết hạn của reservation mới (an toàn khi gọi từ thread khác)"""
+        if not self.running or self._loop is None:
+            return
+        deadline = expires_at.timestamp()
+        if threading.get_ident() == self._loop_thread_id:
+            self._push_deadline(deadline)
+        else:
+            self._loop.call_soon_threadsafe(self._push_deadline, deadline)
+
+    def _push_deadline(self, deadline: float):
+        """Thêm hạn vào heap và đánh thức vòng lặp nếu đây là hạn sớm nhất"""
+        is_earliest = not self._deadlines or deadline < self._deadlines[0]
+        heapq.heappush(self._deadlines, deadline)
+        if is_earliest and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _rebuild_deadlines(self):
+        """Dựng lại heap từ database khi khởi động"""
+        try:
+            async with BackgroundSessionLocal() as db:
+                deadlines = await get_pending_expiry_deadlines(db)
+            # Giữ lại các hạn đã được đăng ký trong lúc chờ database
+            self._deadlines.extend(expires_at.timestamp() for expires_at in deadlines)
+            heapq.heapify(self._deadlines)
+            logger.info(f"⏰ Đã nạp {len(deadlines)} thời điểm hết hạn giữ ghế")
+        except Exception as e:
+            logger.error(f"❌ Lỗi khi nạp thời điểm hết hạn: {e}")
+
+    async def _release_due_reservations(self) -> int:
+        """Giải phóng toàn bộ ghế đã đến hạn bằng một câu DELETE ... RETURNING"""
+        # Tạo session database mới cho mỗi lần dọn dẹp (tự đóng connection khi xong)
+        async with BackgroundSessionLocal() as db:
+            # Gọi service để xóa ghế hết hạn (service sẽ tự động gửi WebSocket theo từng suất chiếu)
+            return await delete_expired_reservations(db)
 
     async def cleanup_expired_reservations(self):
-        """Tác vụ nền: Dọn dẹp các ghế đặt chỗ hết hạn và gửi thông báo WebSocket realtime"""
+        """Tác vụ nền: Ngủ đến hạn gần nhất trong heap, giải phóng ghế hết hạn và gửi thông báo WebSocket realtime"""
+        await self._rebuild_deadlines()
+        last_sweep = 0.0
         while self.running:
             try:
-                # Tạo session database mới cho mỗi lần dọn dẹp
-                db: Session = SessionLocal()
-                try:
-                    # Gọi service để xóa ghế hết hạn (service sẽ tự động gửi WebSocket)
-                    deleted_count = await delete_expired_reservations(db)
-                    if deleted_count > 0:
-                        logger.info(f"🧹 Đã dọn dẹp {deleted_count} ghế hết hạn (realtime notification sent)")
-                except Exception as e:
-                    logger.error(f"❌ Lỗi khi dọn dẹp ghế hết hạn: {e}")
-                finally:
-                    db.close()  # Đảm bảo đóng connection
-                
-                # Chờ 30 giây trước lần dọn dẹp tiếp theo
-                await asyncio.sleep(30)
-                
+                now = time.time()
+                due = False
+                # Lấy ra tất cả các hạn đã tới
+                while self._deadlines and self._deadlines[0] <= now:
+                    heapq.heappop(self._deadlines)
+                    due = True
+
+                if due or now - last_sweep >= SAFETY_SWEEP_INTERVAL:
+                    last_sweep = now
+                    try:
+                        deleted_count = await self._release_due_reservations()
+                        if deleted_count > 0:
+                            logger.info(f"🧹 Đã dọn dẹp {deleted_count} ghế hết hạn (realtime notification sent)")
+                    except Exception as e:
+                        logger.error(f"❌ Lỗi khi dọn dẹp ghế hết hạn: {e}")
+
+                # Ngủ đến hạn tiếp theo (hoặc đến lần quét an toàn), thức dậy sớm nếu có hạn mới sớm hơn
+                timeout = SAFETY_SWEEP_INTERVAL - (time.time() - last_sweep)
+                if self._deadlines:
+                    timeout = min(timeout, self._deadlines[0] - time.time())
+                self._wakeup.clear()
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+
             except Exception as e:
                 logger.error(f"❌ Lỗi không mong muốn trong tác vụ dọn dẹp: {e}")
                 await asyncio.sleep(60)  # Chờ lâu hơn khi có lỗi
 
+    async def sync_token_revocations(self):
+        """Tác vụ nền: định kỳ nạp các họ refresh token bị thu hồi (kể cả do worker khác thu hồi)"""
+        while self.running:
+            try:
+                async with BackgroundSessionLocal() as db:
+                    synced = await revoked_token_families.sync(db)
+                if synced:
+                    logger.info(f"🔒 Đã nạp {synced} họ token bị thu hồi")
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi đồng bộ token bị thu hồi: {e}")
+            await asyncio.sleep(settings.TOKEN_REVOCATION_SYNC_INTERVAL)
+
     def start(self):
         """Khởi động tác vụ dọn dẹp nền"""
         if not self.running:
             self.running = True
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._wakeup = asyncio.Event()
             # Tạo task asyncio để chạy đồng thời với server chính
             self.task = asyncio.create_task(self.cleanup_expired_reservations())
-            logger.info("🚀 Tác vụ dọn dẹp nền đã khởi động (30s interval)")
+            self.revocation_task = asyncio.create_task(self.sync_token_revocations())
+            logger.info("🚀 Tác vụ dọn dẹp nền đã khởi động (deadline heap)")
 
     async def stop(self):
         """Dừng tác vụ dọn dẹp nền"""
         if self.running:
             self.running = False
-            if self.task:
-                self.task.cancel()  # Hủy task
-                try:
-                    await self.task
-                except asyncio.CancelledError:
-                    pass  # Task đã được hủy thành công
+            for task in (self.task, self.revocation_task):
+                if task:
+                    task.cancel()  # Hủy task
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass  # Task đã được hủy thành công
+            self._deadlines = []
             logger.info("🛑 Tác vụ dọn dẹp nền đã dừng")
 
 
 # Instance toàn cục để sử dụng trong toàn bộ ứng dụng
-background_tasks = BackgroundTasks()
\ No newline at end of file
+background_tasks = BackgroundTasks()
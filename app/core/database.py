@@ -1,19 +1,108 @@
+from typing import Optional, Tuple
+from uuid import uuid4
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from app.core.config import settings
+from app.core.pool_metrics import instrument_engine, timed_pool_class
+
+# Tham số query string chỉ libpq/psycopg2 hiểu, asyncpg.connect() báo TypeError nếu nhận
+LIBPQ_ONLY_QUERY_KEYS = ("sslmode", "channel_binding")
+# Giá trị sslmode mà tham số ssl của asyncpg chấp nhận
+ASYNCPG_SSL_MODES = ("disable", "allow", "prefer", "require", "verify-ca", "verify-full")
+
+
+def _pool_options(base_pool, name: str, pool_size: int, max_overflow: int) -> dict:
+    """Tham số pool cho create_engine theo settings (pool_size, overflow, timeout, recycle)"""
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+        # PgBouncer đã gộp connection, giữ thêm pool phía ứng dụng chỉ chiếm slot của PgBouncer
+        return {"poolclass": timed_pool_class(NullPool, name)}
+    return {
+        "poolclass": timed_pool_class(base_pool, name),
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _async_connect_args(ssl_mode: Optional[str] = None) -> dict:
+    """Tham số kết nối asyncpg: chế độ SSL lấy từ sslmode của DATABASE_URL (nếu có).
+    Ở transaction mode, mỗi transaction có thể chạy trên backend khác nhau nên prepared statement
+    của asyncpg không dùng lại được: tắt cache và đặt tên statement ngẫu nhiên để tránh trùng tên"""
+    connect_args = {}
+    if ssl_mode:
+        connect_args["ssl"] = ssl_mode
+    if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+        connect_args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        })
+    return connect_args
 
 
 # Tạo engine kết nối tới database
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_pre_ping=True,
+    **_pool_options(QueuePool, "main", settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
 )
+instrument_engine(engine, "main")
 # Tạo class SessionLocal để tạo các phiên làm việc với database
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Tạo class Base để các model ORM kế thừa
 Base = declarative_base()
 
+
+def _async_database_url() -> Tuple[str, Optional[str]]:
+    """URL cho engine bất đồng bộ và chế độ SSL: dùng ASYNC_DATABASE_URL nếu có, ngược lại đổi driver
+    của DATABASE_URL sang asyncpg. asyncpg.connect() không nhận tham số libpq trong query string
+    (sslmode, channel_binding) nên bỏ chúng khỏi URL, sslmode chuyển thành connect_args["ssl"]."""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL, None
+    url = make_url(settings.DATABASE_URL)
+    ssl_mode = url.query.get("sslmode")
+    if isinstance(ssl_mode, tuple):
+        ssl_mode = ssl_mode[-1]
+    if ssl_mode is not None and ssl_mode not in ASYNCPG_SSL_MODES:
+        raise RuntimeError(
+            f"sslmode={ssl_mode} trong DATABASE_URL không dùng được với asyncpg, hãy đặt ASYNC_DATABASE_URL"
+        )
+    url = url.difference_update_query(LIBPQ_ONLY_QUERY_KEYS).set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False), ssl_mode
+
+
+ASYNC_DATABASE_URL, ASYNC_SSL_MODE = _async_database_url()
+
+
+# Engine bất đồng bộ (asyncpg) cho các endpoint async, không chặn event loop khi chờ database
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=_async_connect_args(ASYNC_SSL_MODE),
+    **_pool_options(AsyncAdaptedQueuePool, "async", settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+)
+instrument_engine(async_engine, "async")
+# expire_on_commit=False: truy cập thuộc tính sau commit không phát sinh truy vấn ngầm (không hỗ trợ với AsyncSession)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Engine nhỏ riêng cho tác vụ nền: dọn ghế hết hạn không phải xếp hàng chung pool với request
+background_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=_async_connect_args(ASYNC_SSL_MODE),
+    **_pool_options(
+        AsyncAdaptedQueuePool, "background", settings.DB_BACKGROUND_POOL_SIZE, settings.DB_BACKGROUND_MAX_OVERFLOW
+    ),
+)
+instrument_engine(background_engine, "background")
+BackgroundSessionLocal = async_sessionmaker(
+    background_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -21,4 +110,8 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Test in test_db_connection.py
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+Email Queue - Hàng đợi gửi email chạy nền
+Request chỉ đưa email vào hàng đợi rồi trả về ngay. Một nhóm worker thread lấy email
+ra, dựng nội dung (QR, template) và gửi qua kết nối SMTP đã đăng nhập sẵn của worker,
+thay vì mở kết nối + STARTTLS + login cho từng email.
+"""
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+from typing import Callable, List, Optional
+
+from email.message import Message
+
+from app.core.config import settings
+from app.services.email_service import EmailService, email_service
+
+logger = logging.getLogger(__name__)
+
+# Lỗi kết nối (cùng các OSError khác): đóng kết nối hiện tại, mở lại và thử gửi lại
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+
+
+class EmailJob:
+    """Một email chờ gửi: hàm dựng nội dung và địa chỉ nhận"""
+
+    __slots__ = ("to_email", "build", "args")
+
+    def __init__(self, to_email: str, build: Callable[..., Message], args: tuple):
+        self.to_email = to_email
+        self.build = build
+        self.args = args
+
+
+class EmailQueue:
+    """Hàng đợi email với nhóm worker giữ kết nối SMTP dùng lại"""
+
+    def __init__(
+        self,
+        service: EmailService,
+        workers: int,
+        maxsize: int,
+        max_retries: int,
+        idle_timeout: float,
+    ):
+        self.service = service
+        self.workers = workers
+        self.max_retries = max_retries
+        self.idle_timeout = idle_timeout
+        self.queue: "queue.Queue[Optional[EmailJob]]" = queue.Queue(maxsize=maxsize)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        # Thống kê
+        self.sent_count = 0
+        self.failed_count = 0
+        self.connections_opened = 0
+
+    def start(self):
+        """Khởi động các worker gửi email (gọi nhiều lần không sao)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"email-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"📧 Email queue started with {self.workers} workers")
+
+    def stop(self, timeout: float = 10.0):
+        """Gửi nốt các email đang chờ rồi dừng worker"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self.queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if threads:
+            logger.info(f"🛑 Email queue stopped (sent={self.sent_count}, failed={self.failed_count})")
+
+    def enqueue(self, to_email: str, build: Callable[..., Message], *args) -> bool:
+        """Đưa email vào hàng đợi. Trả về False nếu thiếu địa chỉ hoặc hàng đợi đầy"""
+        if not to_email:
+            logger.warning("📧 Missing recipient, email not queued")
+            return False
+        if not self._threads:
+            self.start()
+        try:
+            self.queue.put_nowait(EmailJob(to_email, build, args))
+            return True
+        except queue.Full:
+            logger.error(f"❌ Email queue full, dropping email to {to_email}")
+            return False
+
+    def queue_verification_email(self, to_email: str, verification_code: str) -> bool:
+        return self.enqueue(to_email, self.service.build_verification_email, to_email, verification_code)
+
+    def queue_booking_confirmation_email(self, to_email: str, booking_details: dict) -> bool:
+        return self.enqueue(to_email, self.service.build_booking_confirmation_email, to_email, booking_details)
+
+    def queue_ticket_email(self, to_email: str, ticket_info: dict) -> bool:
+        return self.enqueue(to_email, self.service.build_ticket_email, to_email, ticket_info)
+
+    def _worker(self):
+        """Worker: giữ một kết nối SMTP, đóng lại khi rảnh quá idle_timeout"""
+        server: Optional[smtplib.SMTP] = None
+        while True:
+            try:
+                job = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                server = self._close(server)
+                continue
+            if job is None:
+                self._close(server)
+                return
+            try:
+                server = self._process(job, server)
+            finally:
+                self.queue.task_done()
+
+    def _process(self, job: EmailJob, server: Optional[smtplib.SMTP]) -> Optional[smtplib.SMTP]:
+        """Dựng và gửi một email, mở lại kết nối khi bị ngắt. Trả về kết nối để dùng tiếp"""
+        try:
+            msg = job.build(*job.args)
+        except Exception as e:
+            self.failed_count += 1
+            logger.error(f"❌ Failed to build email to {job.to_email}: {e}")
+            return server
+
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                if server is None:
+                    server = self.service.open_connection()
+                    self.connections_opened += 1
+                self.service.deliver(msg, job.to_email, server)
+                self.sent_count += 1
+                return server
+            except Exception as e:
+                # SMTPException kế thừa OSError nên phải tách lỗi kết nối khỏi lỗi từ phía server
+                if isinstance(e, smtplib.SMTPException) and not isinstance(e, _CONNECTION_ERRORS):
+                    # Server từ chối email này (người nhận không hợp lệ, sai đăng nhập...), không thử lại
+                    logger.error(f"❌ SMTP rejected email to {job.to_email}: {e}")
+                    break
+                server = self._close(server)
+                logger.warning(f"⚠️ SMTP connection error (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(min(2 ** (attempt - 1), 10))
+
+        self.failed_count += 1
+        logger.error(f"❌ Giving up sending email to {job.to_email}")
+        return server
+
+    @staticmethod
+    def _close(server: Optional[smtplib.SMTP]) -> None:
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+        return None
+
+
+# Instance toàn cục để sử dụng trong toàn bộ ứng dụng
+email_queue = EmailQueue(
+    email_service,
+    workers=settings.EMAIL_WORKERS,
+    maxsize=settings.EMAIL_QUEUE_SIZE,
+    max_retries=settings.EMAIL_MAX_RETRIES,
+    idle_timeout=settings.EMAIL_SMTP_IDLE_TIMEOUT,
+)
@@ -0,0 +1,226 @@
+"""
+Loop Monitor - Đo độ trễ lập lịch của event loop và bắt các lệnh gọi chặn loop
+Một coroutine nhịp (heartbeat) ngủ đều đặn và ghi lại độ trễ so với thời điểm dự kiến.
+Một watchdog thread theo dõi nhịp đó: khi loop không chạy nhịp quá ngưỡng, watchdog
+chụp stack của thread đang chạy loop và tìm route đang xử lý (qua biến `scope` của ASGI)
+để biết endpoint nào đang chặn loop (sync DB, smtplib, qrcode, bcrypt...).
+Chỉ bật khi LOOP_MONITOR_ENABLED=true.
+"""
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Biên các bucket histogram độ trễ (ms)
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Số khung stack giữ lại cho mỗi mẫu
+STACK_DEPTH = 25
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def _route_from_frame(frame) -> Optional[str]:
+    """Tìm route đang xử lý bằng cách dò biến `scope` của ASGI trong các khung stack"""
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get("path", "?")
+            return f"{scope.get('method', 'WS')} {path}"
+        frame = frame.f_back
+    return None
+
+
+class StallRecord:
+    """Thống kê các lần chặn loop theo (route, vị trí code)"""
+
+    __slots__ = ("route", "location", "count", "total_ms", "max_ms", "stack")
+
+    def __init__(self, route: str, location: str, stack: List[str]):
+        self.route = route
+        self.location = location
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.stack = stack
+
+    def to_dict(self) -> dict:
+        return {
+            "route": self.route,
+            "location": self.location,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 1),
+            "max_ms": round(self.max_ms, 1),
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    """Theo dõi độ trễ event loop và các callback chạy quá ngưỡng"""
+
+    def __init__(self, interval: float, stall_threshold: float, sample_size: int = 2048):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._lock = threading.Lock()
+        # Mẫu độ trễ gần đây (ms) và histogram tích lũy
+        self._samples: Deque[float] = deque(maxlen=sample_size)
+        self._buckets = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self._max_lag_ms = 0.0
+        # Stack chụp được trong lúc loop đang bị chặn, chờ nhịp tiếp theo đo thời lượng
+        self._pending: Optional[Tuple[str, str, List[str]]] = None
+        self._stalls: Dict[Tuple[str, str], StallRecord] = {}
+
+    def start(self):
+        """Khởi động heartbeat trên loop hiện tại và watchdog thread"""
+        if self.running:
+            return
+        self.running = True
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self.task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        logger.info(
+            f"🩺 Loop monitor started (interval={self.interval * 1000:.0f}ms, "
+            f"threshold={self.stall_threshold * 1000:.0f}ms)"
+        )
+
+    async def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        logger.info("🛑 Loop monitor stopped")
+
+    async def _heartbeat(self):
+        """Ngủ đều đặn và ghi lại độ trễ thức dậy so với dự kiến"""
+        while self.running:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            self._record_lag(max(0.0, (now - expected) * 1000))
+
+    def _record_lag(self, lag_ms: float):
+        with self._lock:
+            self._samples.append(lag_ms)
+            self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+            for i, bound in enumerate(LAG_BUCKETS_MS):
+                if lag_ms <= bound:
+                    self._buckets[i] += 1
+                    break
+            else:
+                self._buckets[-1] += 1
+
+            # Gán thời lượng chặn cho stack đã chụp trong lúc loop bị chặn
+            if self._pending is not None:
+                route, location, stack = self._pending
+                self._pending = None
+                record = self._stalls.get((route, location))
+                if record is None:
+                    record = StallRecord(route, location, stack)
+                    self._stalls[(route, location)] = record
+                record.count += 1
+                record.total_ms += lag_ms
+                record.max_ms = max(record.max_ms, lag_ms)
+                record.stack = stack
+
+        if lag_ms >= self.stall_threshold * 1000:
+            logger.warning(f"🐌 Event loop blocked for {lag_ms:.0f}ms")
+
+    def _watch(self):
+        """Watchdog thread: chụp stack của loop khi nhịp bị trễ quá ngưỡng (mỗi lần chặn chụp một lần)"""
+        captured_beat = None
+        while self.running:
+            time.sleep(self.stall_threshold / 2)
+            last_beat = self._last_beat
+            overdue = time.monotonic() - last_beat - self.interval
+            if overdue < self.stall_threshold or captured_beat == last_beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            captured_beat = last_beat
+            stack = [
+                f"{summary.filename}:{summary.lineno} {summary.name}"
+                for summary in traceback.extract_stack(frame, limit=STACK_DEPTH)
+            ]
+            route = _route_from_frame(frame) or "(no request)"
+            location = stack[-1] if stack else "?"
+            with self._lock:
+                self._pending = (route, location, stack)
+
+    def stats(self, top: int = 10) -> dict:
+        """Histogram độ trễ, các phân vị và các vị trí chặn loop nhiều nhất"""
+        with self._lock:
+            samples = sorted(self._samples)
+            buckets = list(self._buckets)
+            all_stalls = list(self._stalls.values())
+            max_lag = self._max_lag_ms
+
+        stalls = sorted(all_stalls, key=lambda r: r.total_ms, reverse=True)[:top]
+        # Tổng thời gian chặn loop theo route
+        by_route: Dict[str, dict] = {}
+        for record in all_stalls:
+            entry = by_route.setdefault(record.route, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += record.count
+            entry["total_ms"] += record.total_ms
+            entry["max_ms"] = max(entry["max_ms"], record.max_ms)
+
+        labels = [f"<={bound}ms" for bound in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}ms"]
+        return {
+            "enabled": self.running,
+            "interval_ms": self.interval * 1000,
+            "stall_threshold_ms": self.stall_threshold * 1000,
+            "lag_ms": {
+                "samples": len(samples),
+                "p50": round(_percentile(samples, 50), 2),
+                "p90": round(_percentile(samples, 90), 2),
+                "p99": round(_percentile(samples, 99), 2),
+                "max": round(max_lag, 2),
+            },
+            "histogram": dict(zip(labels, buckets)),
+            "by_route": {
+                route: {"count": v["count"], "total_ms": round(v["total_ms"], 1), "max_ms": round(v["max_ms"], 1)}
+                for route, v in sorted(by_route.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:top]
+            },
+            "worst_offenders": [record.to_dict() for record in stalls],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._buckets = [0] * (len(LAG_BUCKETS_MS) + 1)
+            self._max_lag_ms = 0.0
+            self._pending = None
+            self._stalls.clear()
+
+
+# Instance toàn cục, chỉ chạy khi LOOP_MONITOR_ENABLED=true
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000,
+    stall_threshold=settings.LOOP_MONITOR_STALL_THRESHOLD_MS / 1000,
+)
@@ -1,7 +1,16 @@
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
+from app.core.config import settings
+from app.core.query_budget import QueryBudgetMiddleware
 
 def setup_middleware(app: FastAPI):
+    # Đếm số câu SQL / thời gian database mỗi request (Server-Timing, cảnh báo N+1, ngân sách route)
+    app.add_middleware(
+        QueryBudgetMiddleware,
+        mode=settings.QUERY_BUDGET_MODE,
+        repeat_threshold=settings.QUERY_REPEAT_THRESHOLD,
+    )
+
     # CORS chỉ định rõ domain frontend và local development
     allow_origins = [
         "https://ryon.website",
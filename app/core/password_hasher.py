@@ -0,0 +1,184 @@
+"""
+Password Hasher - Băm và kiểm tra mật khẩu bcrypt trên nhóm thread riêng có giới hạn
+bcrypt tốn ~250ms CPU mỗi lần và nhả GIL trong lúc băm, nên chạy trên thread là đủ song song.
+Số lần băm chạy cùng lúc bị giới hạn bởi PASSWORD_HASH_WORKERS để một đợt đăng nhập dồn dập
+không chiếm hết CPU của các request khác (sơ đồ ghế, WebSocket). Khi số yêu cầu đang chờ vượt
+PASSWORD_HASH_QUEUE_SIZE, trả về 503 ngay thay vì để request treo.
+Route đăng nhập/đăng ký là async def và dùng API *_async: request chờ bcrypt trên event loop
+chứ không giữ thread của threadpool (mặc định 40 thread) mà các route def khác cần.
+API đồng bộ chỉ dành cho thao tác ít gặp (quản trị tạo người dùng): mỗi lần gọi giữ một thread
+của threadpool tới khi băm xong.
+Hash có cost khác BCRYPT_ROUNDS được băm lại khi người dùng đăng nhập thành công.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Số mẫu thời gian chờ/thời gian băm gần nhất dùng để tính phân vị
+SAMPLE_SIZE = 1024
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def build_crypt_context(rounds: int) -> CryptContext:
+    """CryptContext bcrypt với cost cố định: hash có cost khác bị coi là cần băm lại"""
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+class PasswordHasher:
+    """Nhóm thread băm mật khẩu với giới hạn số việc chạy song song và độ dài hàng đợi"""
+
+    def __init__(self, context: CryptContext, workers: int, max_queue: int):
+        self.context = context
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=SAMPLE_SIZE)
+        self._runs: Deque[float] = deque(maxlen=SAMPLE_SIZE)
+        # Thống kê
+        self.pending = 0  # đang chờ + đang băm
+        self.running = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hasher")
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            if self.pending - self.running >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Hệ thống đang bận, vui lòng thử lại sau giây lát",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        submitted_at = time.perf_counter()
+
+        def job():
+            started_at = time.perf_counter()
+            with self._lock:
+                self.running += 1
+                self._waits.append((started_at - submitted_at) * 1000)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.pending -= 1
+                    self.completed += 1
+                    self._runs.append((time.perf_counter() - started_at) * 1000)
+
+        try:
+            return self._get_executor().submit(job)
+        except RuntimeError:
+            # Executor đã shutdown: trả lại chỗ trong hàng đợi
+            with self._lock:
+                self.pending -= 1
+            raise
+
+    # ---- API đồng bộ (cho route def chạy trong threadpool) ----
+    def hash(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._submit(self.context.verify, password, password_hash).result()
+
+    def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """(đúng mật khẩu, hash mới nếu hash hiện tại dùng cost khác BCRYPT_ROUNDS)"""
+        return self._count_rehash(
+            self._submit(self.context.verify_and_update, password, password_hash).result()
+        )
+
+    def _count_rehash(self, result: Tuple[bool, Optional[str]]) -> Tuple[bool, Optional[str]]:
+        if result[1] is not None:
+            with self._lock:
+                self.rehashed += 1
+        return result
+
+    # ---- API bất đồng bộ (cho route async def: chờ trên event loop, không giữ thread của threadpool) ----
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    async def verify_async(self, password: str, password_hash: str) -> bool:
+        return await asyncio.wrap_future(self._submit(self.context.verify, password, password_hash))
+
+    async def verify_and_update_async(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        return self._count_rehash(
+            await asyncio.wrap_future(self._submit(self.context.verify_and_update, password, password_hash))
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            runs = sorted(self._runs)
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self.pending - self.running,
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "wait_ms": {
+                    "p50": round(_percentile(waits, 50), 2),
+                    "p99": round(_percentile(waits, 99), 2),
+                    "max": round(waits[-1], 2) if waits else 0.0,
+                },
+                "hash_ms": {
+                    "p50": round(_percentile(runs, 50), 2),
+                    "p99": round(_percentile(runs, 99), 2),
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._waits.clear()
+            self._runs.clear()
+            self.peak_pending = self.pending
+            self.completed = self.rejected = self.rehashed = 0
+
+
+# Instance toàn cục để sử dụng trong toàn bộ ứng dụng
+password_hasher = PasswordHasher(
+    context=build_crypt_context(settings.BCRYPT_ROUNDS),
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_QUEUE_SIZE,
+)
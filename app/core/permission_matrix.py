@@ -0,0 +1,165 @@
+"""
+Permission Matrix - Ma trận vai trò -> quyền dạng bitset giữ trong bộ nhớ
+Mỗi quyền là một bit (vị trí bit = permission_id, ổn định giữa các worker), mỗi vai trò là
+một số nguyên OR các bit quyền của nó. Kiểm tra quyền chỉ còn một phép AND trên mask đã tính
+sẵn, không truy vấn role_permissions. Ma trận được nạp bằng ba câu SELECT nhỏ, nạp lại ngay
+khi roles_service thay đổi vai trò/quyền và định kỳ sau PERMISSION_MATRIX_TTL giây (để thấy
+thay đổi do worker khác thực hiện).
+"""
+
+from typing import Dict, Iterable, List, Optional
+import logging
+import threading
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.permissions import Permission, role_permissions
+from app.models.role import Role
+from app.schemas.roles import PermissionResponse
+
+logger = logging.getLogger(__name__)
+
+
+class _MatrixState:
+    """Một bản chụp ma trận; thay nguyên khối khi nạp lại nên đọc không cần khóa"""
+
+    __slots__ = ("permission_bits", "permissions", "roles", "role_masks", "name_masks", "loaded_at")
+
+    def __init__(self):
+        self.permission_bits: Dict[str, int] = {}  # permission_name -> bit
+        self.permissions: Dict[int, PermissionResponse] = {}  # permission_id -> quyền
+        self.roles: Dict[int, dict] = {}  # role_id -> thông tin vai trò
+        self.role_masks: Dict[int, int] = {}  # role_id -> mask
+        self.name_masks: Dict[str, int] = {}  # role_name -> mask (OR nếu trùng tên)
+        self.loaded_at = 0.0
+
+
+class PermissionMatrix:
+    """Ma trận vai trò -> quyền, an toàn khi dùng từ nhiều thread"""
+
+    # Ba câu SELECT nạp ma trận, dùng chung cho Session và AsyncSession
+    _PERMISSIONS_STMT = select(Permission)
+    _ROLES_STMT = select(
+        Role.role_id, Role.role_name, Role.description, Role.created_at, Role.updated_at
+    ).order_by(Role.role_id)
+    _ROLE_PERMISSIONS_STMT = select(role_permissions.c.role_id, role_permissions.c.permission_id)
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = _MatrixState()
+        self._stale = True
+
+    def load(self, db: Session):
+        """Nạp lại toàn bộ ma trận từ database"""
+        self._install(
+            db.execute(self._PERMISSIONS_STMT).scalars().all(),
+            db.execute(self._ROLES_STMT).mappings().all(),
+            db.execute(self._ROLE_PERMISSIONS_STMT).all(),
+        )
+
+    async def load_async(self, db: AsyncSession):
+        """Như load, cho route async dùng AsyncSession"""
+        self._install(
+            (await db.execute(self._PERMISSIONS_STMT)).scalars().all(),
+            (await db.execute(self._ROLES_STMT)).mappings().all(),
+            (await db.execute(self._ROLE_PERMISSIONS_STMT)).all(),
+        )
+
+    def _install(self, permissions, roles, role_permission_pairs):
+        """Dựng bản chụp mới từ kết quả ba câu SELECT rồi thay nguyên khối"""
+        state = _MatrixState()
+        for permission in permissions:
+            state.permission_bits[permission.permission_name] = 1 << permission.permission_id
+            state.permissions[permission.permission_id] = PermissionResponse.model_validate(permission)
+        for role in roles:
+            state.roles[role["role_id"]] = dict(role)
+            state.role_masks[role["role_id"]] = 0
+        for role_id, permission_id in role_permission_pairs:
+            if role_id in state.role_masks:
+                state.role_masks[role_id] |= 1 << permission_id
+        for role_id, role in state.roles.items():
+            state.name_masks[role["role_name"]] = state.name_masks.get(role["role_name"], 0) | state.role_masks[role_id]
+        state.loaded_at = time.monotonic()
+        with self._lock:
+            self._state = state
+            self._stale = False
+        logger.info(f"🔐 Permission matrix loaded: {len(state.roles)} roles, {len(state.permissions)} permissions")
+
+    def invalidate(self):
+        """Đánh dấu cần nạp lại ở lần dùng tiếp theo (gọi sau khi vai trò/quyền thay đổi)"""
+        with self._lock:
+            self._stale = True
+
+    def _needs_load(self) -> bool:
+        return self._stale or time.monotonic() - self._state.loaded_at > self.ttl
+
+    def ensure_loaded(self, db: Session):
+        if self._needs_load():
+            self.load(db)
+
+    async def ensure_loaded_async(self, db: AsyncSession):
+        if self._needs_load():
+            await self.load_async(db)
+
+    # ---- Kiểm tra quyền ----
+    def permission_mask(self, permission_names: Iterable[str]) -> Optional[int]:
+        """Mask của các quyền; None nếu có quyền không tồn tại"""
+        state = self._state
+        mask = 0
+        for name in permission_names:
+            bit = state.permission_bits.get(name)
+            if bit is None:
+                return None
+            mask |= bit
+        return mask
+
+    def roles_mask(self, role_names: Iterable[str]) -> int:
+        state = self._state
+        mask = 0
+        for name in role_names:
+            mask |= state.name_masks.get(name, 0)
+        return mask
+
+    def role_ids_mask(self, role_ids: Iterable[int]) -> int:
+        state = self._state
+        mask = 0
+        for role_id in role_ids:
+            mask |= state.role_masks.get(role_id, 0)
+        return mask
+
+    def allows(self, role_names: Iterable[str], required_mask: int) -> bool:
+        return self.roles_mask(role_names) & required_mask == required_mask
+
+    # ---- Tra cứu ----
+    def role_names(self, role_ids: Iterable[int]) -> List[str]:
+        state = self._state
+        return [state.roles[role_id]["role_name"] for role_id in role_ids if role_id in state.roles]
+
+    def permission_names(self, mask: int) -> List[str]:
+        state = self._state
+        return [
+            permission.permission_name
+            for permission_id, permission in sorted(state.permissions.items())
+            if mask >> permission_id & 1
+        ]
+
+    def role_permissions(self, role_id: int) -> List[PermissionResponse]:
+        state = self._state
+        mask = state.role_masks.get(role_id, 0)
+        return [
+            permission
+            for permission_id, permission in sorted(state.permissions.items())
+            if mask >> permission_id & 1
+        ]
+
+    def roles(self) -> List[dict]:
+        return list(self._state.roles.values())
+
+
+# Instance toàn cục để sử dụng trong toàn bộ ứng dụng
+permission_matrix = PermissionMatrix(ttl=settings.PERMISSION_MATRIX_TTL)
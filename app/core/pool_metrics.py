@@ -0,0 +1,149 @@
+"""
+Pool Metrics - Thống kê connection pool của các engine SQLAlchemy
+Đo thời gian chờ lấy connection (checkout), số connection đang dùng, overflow và số lần
+hết thời gian chờ. Thời gian chờ được đo bằng lớp pool con bọc `_do_get`, các sự kiện
+checkout/checkin của pool dùng để đếm connection đang được sử dụng.
+"""
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Type
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool
+
+# Số mẫu thời gian chờ gần nhất dùng để tính phân vị
+WAIT_SAMPLE_SIZE = 1024
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+class PoolMetrics:
+    """Bộ đếm cho một pool, an toàn khi dùng từ nhiều thread"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine: Optional[Engine] = None
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+        self.checkouts = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.max_wait_ms = 0.0
+        self.total_wait_ms = 0.0
+
+    def record_wait(self, wait_ms: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.acquired += 1
+            self._waits.append(wait_ms)
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def on_checkout(self, *args):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def on_checkin(self, *args):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def on_connect(self, *args):
+        with self._lock:
+            self.connects += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            data = {
+                "checkouts": self.checkouts,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "connects": self.connects,
+                "timeouts": self.timeouts,
+                "wait_ms": {
+                    "samples": len(waits),
+                    "avg": round(self.total_wait_ms / self.acquired, 3) if self.acquired else 0.0,
+                    "p50": round(_percentile(waits, 50), 3),
+                    "p99": round(_percentile(waits, 99), 3),
+                    "max": round(self.max_wait_ms, 3),
+                },
+            }
+
+        # Đọc pool từ engine mỗi lần vì dispose() thay pool mới
+        pool = self.engine.pool if self.engine is not None else None
+        data["pool_class"] = type(pool).__name__ if pool is not None else None
+        # NullPool (chế độ PgBouncer) không có size/overflow
+        if pool is not None and hasattr(pool, "overflow"):
+            data.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": getattr(pool, "_max_overflow", None),
+                "timeout": pool.timeout(),
+            })
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._waits.clear()
+            self.checkouts = self.acquired = self.timeouts = self.connects = 0
+            self.peak_in_use = self.in_use
+            self.max_wait_ms = self.total_wait_ms = 0.0
+
+
+# Metrics theo tên engine ("main", "async", "background")
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+def timed_pool_class(base: Type[Pool], name: str) -> Type[Pool]:
+    """Tạo lớp pool con đo thời gian chờ lấy connection cho engine `name`
+    (metrics gắn ở mức lớp nên vẫn giữ nguyên khi pool được tạo lại lúc dispose)"""
+    metrics = pool_metrics.setdefault(name, PoolMetrics(name))
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = base._do_get(self)
+        except PoolTimeoutError:
+            metrics.record_wait(0.0, timed_out=True)
+            raise
+        metrics.record_wait((time.perf_counter() - start) * 1000)
+        return conn
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
+
+
+def instrument_engine(engine, name: str) -> PoolMetrics:
+    """Gắn các listener checkout/checkin/connect vào pool của engine (sync hoặc async)"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    metrics = pool_metrics.setdefault(name, PoolMetrics(name))
+    metrics.engine = sync_engine
+    event.listen(sync_engine, "checkout", metrics.on_checkout)
+    event.listen(sync_engine, "checkin", metrics.on_checkin)
+    event.listen(sync_engine, "connect", metrics.on_connect)
+    return metrics
+
+
+def get_pool_stats() -> Dict[str, dict]:
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+
+def reset_pool_stats():
+    for metrics in pool_metrics.values():
+        metrics.reset()
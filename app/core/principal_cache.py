@@ -0,0 +1,134 @@
+"""
+Principal Cache - Bộ nhớ đệm người dùng đã xác thực theo access token
+Khóa theo `jti` của token (token cũ không có jti thì dùng SHA-256 của token), mỗi mục sống
+tối đa PRINCIPAL_CACHE_TTL giây và không bao giờ quá thời điểm hết hạn của token.
+Khi thông tin, trạng thái hoặc vai trò của người dùng thay đổi, service gọi invalidate_user
+để xóa các mục của người đó và ghi lại thời điểm thay đổi: token cấp trước thời điểm này
+không còn được tin theo claims (chế độ TRUST_TOKEN_CLAIMS) mà phải đọc lại từ database.
+Việc invalidate chỉ có tác dụng trong tiến trình xử lý thay đổi. Worker khác thấy thay đổi sau
+tối đa PRINCIPAL_CACHE_TTL giây với đường đọc database, nhưng ở chế độ TRUST_TOKEN_CLAIMS vẫn
+tin status/roles trong token tới khi token hết hạn (ACCESS_TOKEN_EXPIRE_MINUTES).
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+import hashlib
+import threading
+import time
+
+from app.core.config import settings
+
+# Số principal tối đa giữ trong cache (LRU)
+MAX_CACHED_PRINCIPALS = 10000
+
+
+class PrincipalCache:
+    """Cache principal theo token, an toàn khi dùng từ nhiều thread (dependency sync chạy trong threadpool)"""
+
+    def __init__(self, ttl: float, max_entries: int = MAX_CACHED_PRINCIPALS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (user_id, principal, thời điểm hết hạn theo time.time())
+        self._entries: "OrderedDict[str, Tuple[int, Any, float]]" = OrderedDict()
+        # user_id -> các key đang cache của người dùng đó
+        self._by_user: Dict[int, Set[str]] = {}
+        # user_id -> thời điểm (epoch) thay đổi gần nhất; token có iat trước đó không được tin theo claims
+        self._changed_at: Dict[int, float] = {}
+        # Thời điểm clear() gần nhất, áp dụng cho mọi người dùng
+        self._cleared_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(token: str, payload: dict) -> str:
+        jti = payload.get("jti")
+        if jti:
+            return f"jti:{jti}"
+        return "sha256:" + hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, principal, expires_at = entry
+            if expires_at <= now:
+                self._remove(key, user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return principal
+
+    def put(self, key: str, user_id: int, principal: Any, token_exp: Optional[float] = None):
+        """Lưu principal, hết hạn sau TTL hoặc khi token hết hạn (lấy mốc sớm hơn)"""
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+        if self.ttl <= 0 or expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[key] = (user_id, principal, expires_at)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, (old_user_id, _, _) = self._entries.popitem(last=False)
+                self._discard_index(old_key, old_user_id)
+
+    def _discard_index(self, key: str, user_id: int):
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def _remove(self, key: str, user_id: int):
+        self._entries.pop(key, None)
+        self._discard_index(key, user_id)
+
+    # ---- Invalidate cache ----
+    def invalidate_user(self, user_id: int):
+        """Gọi sau khi thông tin/trạng thái/vai trò của người dùng thay đổi"""
+        now = time.time()
+        with self._lock:
+            # Mốc cũ hơn thời gian sống của access token không còn tác dụng
+            horizon = now - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+            for changed_user_id in [uid for uid, at in self._changed_at.items() if at < horizon]:
+                del self._changed_at[changed_user_id]
+            self._changed_at[user_id] = now
+            for key in self._by_user.pop(user_id, set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Gọi khi vai trò/quyền thay đổi ảnh hưởng tới nhiều người dùng"""
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._changed_at.clear()
+            # Mọi token cấp trước thời điểm này phải đọc lại từ database
+            self._cleared_at = time.time()
+
+    def is_stale(self, user_id: int, issued_at: Optional[float]) -> bool:
+        """Token được cấp trước lần thay đổi gần nhất của người dùng (hoặc lần clear toàn bộ)"""
+        if issued_at is None:
+            return True
+        with self._lock:
+            changed_at = max(self._changed_at.get(user_id, 0.0), self._cleared_at)
+        return issued_at < changed_at
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "users": len(self._by_user),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl": self.ttl,
+            }
+
+
+# Instance toàn cục để sử dụng trong toàn bộ ứng dụng
+principal_cache = PrincipalCache(ttl=settings.PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,156 @@
+"""
+Query Budget - Đếm số câu SQL và tổng thời gian database cho từng request
+Dựa trên sự kiện before/after_cursor_execute của SQLAlchemy (áp dụng cho mọi engine, kể cả
+engine async vì SQLAlchemy chạy các sự kiện này trong cùng context của request).
+Middleware thêm header Server-Timing, cảnh báo các câu SQL cùng dạng lặp lại nhiều lần (N+1)
+và ở chế độ enforce trả về lỗi 500 khi route vượt ngân sách đã khai báo bằng @query_budget.
+"""
+
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+import json
+import logging
+import re
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.utils.response import error_response
+
+logger = logging.getLogger(__name__)
+
+# Các dạng placeholder: $1 (asyncpg), %(name)s (psycopg2), ? và số literal
+_PLACEHOLDER_RE = re.compile(r"\$\d+|%\(\w+\)s|\?|\b\d+\b")
+# Danh sách placeholder trong IN (...) có độ dài thay đổi theo số phần tử
+_PLACEHOLDER_LIST_RE = re.compile(r"\?(\s*,\s*\?)+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Chuẩn hóa câu SQL về dạng chung (bỏ giá trị tham số) để so sánh các câu lặp lại"""
+    shape = _PLACEHOLDER_RE.sub("?", statement)
+    shape = _PLACEHOLDER_LIST_RE.sub("?...", shape)
+    return _WHITESPACE_RE.sub(" ", shape).strip()
+
+
+class RequestQueryStats:
+    """Số câu SQL, tổng thời gian và số lần lặp theo dạng câu SQL của một request"""
+
+    __slots__ = ("count", "duration_ms", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+        self.shapes: Dict[str, int] = {}
+
+    def record(self, statement: str, duration_ms: float):
+        self.count += 1
+        self.duration_ms += duration_ms
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+_request_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def query_budget(max_queries: int) -> Callable:
+    """Khai báo số câu SQL tối đa cho một endpoint (đặt dưới decorator của router)
+
+        @router.get('/bookings')
+        @query_budget(3)
+        def list_bookings(...): ...
+    """
+    def decorator(func: Callable) -> Callable:
+        func.__query_budget__ = max_queries
+        return func
+    return decorator
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    stats.record(statement, (time.perf_counter() - starts.pop()) * 1000)
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware: đo SQL theo request, thêm Server-Timing và kiểm tra ngân sách của route"""
+
+    def __init__(self, app, mode: str, repeat_threshold: int):
+        self.app = app
+        self.mode = mode
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.mode == "off":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _request_stats.set(stats)
+        replaced = False
+
+        async def send_wrapper(message):
+            nonlocal replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                budget = getattr(scope.get("endpoint"), "__query_budget__", None)
+                route = f"{scope['method']} {getattr(scope.get('route'), 'path', scope['path'])}"
+                self._report(route, stats, budget)
+                if budget is not None and stats.count > budget and self.mode == "enforce":
+                    replaced = True
+                    await self._send_budget_error(send, route, stats, budget)
+                    return
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", self._server_timing(stats).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+
+    def _report(self, route: str, stats: RequestQueryStats, budget: Optional[int]):
+        for shape, n in stats.repeated(self.repeat_threshold).items():
+            logger.warning(f"🔁 {route}: statement executed {n} times (possible N+1): {shape[:200]}")
+        if budget is not None and stats.count > budget:
+            logger.warning(f"⚠️ {route}: {stats.count} queries exceeds budget of {budget}")
+
+    def _server_timing(self, stats: RequestQueryStats) -> str:
+        value = f'db;dur={stats.duration_ms:.2f};desc="{stats.count} queries"'
+        repeated = stats.repeated(self.repeat_threshold)
+        if repeated:
+            value += f', db-repeat;desc="{len(repeated)} repeated statements (max {max(repeated.values())}x)"'
+        return value
+
+    async def _send_budget_error(self, send, route: str, stats: RequestQueryStats, budget: int):
+        body = json.dumps(error_response(
+            f"{route} executed {stats.count} queries, budget is {budget}", "QUERY_BUDGET_EXCEEDED"
+        )).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 500,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"server-timing", self._server_timing(stats).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
@@ -0,0 +1,235 @@
+"""
+Seat Event Bus - Kênh pub/sub sự kiện ghế giữa các worker uvicorn
+WebSocketManager chỉ giữ kết nối của tiến trình hiện tại. Khi chạy nhiều worker,
+mỗi sự kiện ghế được phát lên bus để các worker khác phát lại cho socket của chính họ.
+
+Các backend:
+- inprocess: một tiến trình duy nhất (mặc định)
+- postgres: LISTEN/NOTIFY trên database hiện có
+- unix: datagram Unix socket giữa các worker trên cùng một máy
+"""
+
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+from app.core.websocket_frames import DecodeError, decode_frame, encode_frame
+
+logger = logging.getLogger(__name__)
+
+SeatEventHandler = Callable[[dict], Awaitable[None]]
+
+
+class SeatEventBus(ABC):
+    """Giao diện chung của các backend pub/sub sự kiện ghế"""
+
+    def __init__(self):
+        # Định danh worker, dùng để bỏ qua sự kiện do chính worker này phát
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handler: Optional[SeatEventHandler] = None
+
+    async def start(self, handler: SeatEventHandler):
+        self._handler = handler
+
+    @abstractmethod
+    async def publish(self, event: dict):
+        """Phát sự kiện ghế tới các worker khác"""
+
+    async def stop(self):
+        self._handler = None
+
+    def _dispatch(self, payload):
+        """Giải mã payload nhận được và chuyển cho handler trên event loop"""
+        if self._handler is None:
+            return
+        try:
+            event = decode_frame(payload)
+        except (TypeError, DecodeError) as e:
+            logger.error(f"❌ Invalid seat event payload: {e}")
+            return
+        if event.get("origin") == self.node_id:
+            return
+        asyncio.get_running_loop().create_task(self._handler(event))
+
+
+class InProcessSeatEventBus(SeatEventBus):
+    """Backend một tiến trình: mọi kết nối đã nằm trong cùng WebSocketManager nên không cần phát đi đâu"""
+
+    async def publish(self, event: dict):
+        return None
+
+
+class PostgresSeatEventBus(SeatEventBus):
+    """Backend dùng LISTEN/NOTIFY của Postgres (payload tối đa ~8000 byte)"""
+
+    RECONNECT_DELAY = 5
+
+    def __init__(self, database_url: str, channel: str):
+        super().__init__()
+        from sqlalchemy.engine import make_url
+
+        # psycopg2 nhận URL dạng postgresql:// (bỏ phần +driver của SQLAlchemy)
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self._conn = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: SeatEventHandler):
+        await super().start(handler)
+        self._loop = asyncio.get_running_loop()
+        await self._listen()
+
+    async def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        conn = await self._loop.run_in_executor(None, psycopg2.connect, self.dsn)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN "{self.channel}"')
+        self._conn = conn
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+        logger.info(f"📡 Seat event bus listening on Postgres channel '{self.channel}'")
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except Exception as e:
+            logger.error(f"❌ Seat event bus connection lost: {e}")
+            self._close_listener()
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+            return
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            self._dispatch(notify.payload)
+
+    async def _reconnect(self):
+        while self._handler is not None:
+            await asyncio.sleep(self.RECONNECT_DELAY)
+            try:
+                await self._listen()
+                return
+            except Exception as e:
+                logger.error(f"❌ Seat event bus reconnect failed: {e}")
+
+    def _close_listener(self):
+        if self._conn is not None:
+            try:
+                self._loop.remove_reader(self._conn.fileno())
+            except Exception:
+                pass
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _notify(self, payload: str):
+        from sqlalchemy import text
+        from app.core.database import engine
+
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+            conn.commit()
+
+    async def publish(self, event: dict):
+        payload = encode_frame(event)
+        await asyncio.get_running_loop().run_in_executor(None, self._notify, payload)
+
+    async def stop(self):
+        await super().stop()
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self._close_listener()
+
+
+class UnixSocketSeatEventBus(SeatEventBus):
+    """Backend datagram Unix socket: mỗi worker bind một socket trong thư mục chung và gửi tới các socket còn lại"""
+
+    def __init__(self, socket_dir: str):
+        super().__init__()
+        self.socket_dir = socket_dir
+        self.path = os.path.join(socket_dir, f"worker-{os.getpid()}.sock")
+        self._sock: Optional[socket.socket] = None
+
+    async def start(self, handler: SeatEventHandler):
+        await super().start(handler)
+        os.makedirs(self.socket_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+        logger.info(f"📡 Seat event bus listening on {self.path}")
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._dispatch(data)
+
+    def _peer_paths(self) -> List[str]:
+        try:
+            names = os.listdir(self.socket_dir)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.socket_dir, name)
+            for name in names
+            if name.endswith(".sock") and os.path.join(self.socket_dir, name) != self.path
+        ]
+
+    async def publish(self, event: dict):
+        if self._sock is None:
+            return
+        data = encode_frame(event).encode("utf-8")
+        for peer in self._peer_paths():
+            try:
+                self._sock.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker đã dừng nhưng còn sót file socket
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                logger.warning(f"⚠️ Seat event dropped, peer buffer full: {peer}")
+
+    async def stop(self):
+        await super().stop()
+        if self._sock is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            except Exception:
+                pass
+            self._sock.close()
+            self._sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def create_seat_event_bus(backend: str) -> SeatEventBus:
+    """Tạo backend pub/sub theo cấu hình SEAT_EVENT_BUS"""
+    from app.core.config import settings
+
+    if backend == "postgres":
+        if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+            # LISTEN giữ trạng thái trên session, PgBouncer transaction mode không hỗ trợ
+            logger.warning("⚠️ SEAT_EVENT_BUS=postgres needs a direct Postgres connection, LISTEN does not work through PgBouncer transaction mode")
+        return PostgresSeatEventBus(settings.DATABASE_URL, settings.SEAT_EVENT_BUS_CHANNEL)
+    if backend == "unix":
+        return UnixSocketSeatEventBus(settings.SEAT_EVENT_BUS_SOCKET_DIR)
+    if backend != "inprocess":
+        logger.warning(f"⚠️ Unknown SEAT_EVENT_BUS '{backend}', falling back to inprocess")
+    return InProcessSeatEventBus()
@@ -0,0 +1,68 @@
+"""
+Seat Event Log - Số thứ tự và bộ đệm vòng các sự kiện ghế gần đây theo từng suất chiếu
+Mỗi sự kiện ghế được gán một số thứ tự tăng dần trong suất chiếu. Client kết nối lại
+với ?since_seq=N&stream_id=... sẽ chỉ nhận các delta bị lỡ nếu bộ đệm còn bao phủ N,
+ngược lại nhận snapshot đầy đủ.
+
+Số thứ tự chỉ có ý nghĩa trong một worker và một lần khởi động (stream_id), nên client
+kết nối lại vào worker khác hoặc sau khi khởi động lại sẽ nhận snapshot.
+"""
+
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+import os
+import uuid
+
+from app.core.websocket_frames import add_seq
+from app.core.websocket_outbox import SeatEvent
+
+# Số suất chiếu tối đa giữ bộ đệm sự kiện (LRU), bộ đếm số thứ tự không bị xóa
+MAX_BUFFERED_SHOWTIMES = 256
+
+
+class SeatEventLog:
+    """Bộ đệm vòng các sự kiện ghế gần đây của từng suất chiếu"""
+
+    def __init__(self, buffer_size: int, max_showtimes: int = MAX_BUFFERED_SHOWTIMES):
+        self.buffer_size = buffer_size
+        self.max_showtimes = max_showtimes
+        # Định danh luồng sự kiện của worker này, đổi sau mỗi lần khởi động
+        self.stream_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._seq: Dict[int, int] = {}
+        self._buffers: "OrderedDict[int, Deque[SeatEvent]]" = OrderedDict()
+
+    def current_seq(self, showtime_id: int) -> int:
+        """Số thứ tự của sự kiện ghế mới nhất (0 nếu chưa có)"""
+        return self._seq.get(showtime_id, 0)
+
+    def append(self, showtime_id: int, kind: str, seat_ids: List[int], frame: str,
+               user_session: Optional[str] = None) -> SeatEvent:
+        """Gán số thứ tự tiếp theo cho sự kiện và lưu vào bộ đệm"""
+        seq = self._seq.get(showtime_id, 0) + 1
+        self._seq[showtime_id] = seq
+        event = SeatEvent(kind, seat_ids, add_seq(frame, seq), user_session, seq)
+
+        buffer = self._buffers.get(showtime_id)
+        if buffer is None:
+            buffer = deque(maxlen=self.buffer_size)
+            self._buffers[showtime_id] = buffer
+            while len(self._buffers) > self.max_showtimes:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(showtime_id)
+        buffer.append(event)
+        return event
+
+    def since(self, showtime_id: int, since_seq: int) -> Optional[List[SeatEvent]]:
+        """Các sự kiện sau since_seq, hoặc None nếu bộ đệm không còn bao phủ (cần snapshot)"""
+        current = self.current_seq(showtime_id)
+        if since_seq < 0 or since_seq > current:
+            return None
+        if since_seq == current:
+            return []
+        buffer = self._buffers.get(showtime_id)
+        if not buffer or buffer[0].seq > since_seq + 1:
+            return None
+        # Các số thứ tự trong bộ đệm liên tiếp nhau nên có thể tính vị trí trực tiếp
+        start = since_seq + 1 - buffer[0].seq
+        return list(buffer)[start:]
@@ -0,0 +1,195 @@
+"""
+Seat Occupancy - Bộ nhớ đệm trạng thái ghế theo từng suất chiếu
+Mỗi suất chiếu giữ một mảng array('b') trạng thái ghế, đánh chỉ số theo vị trí ghế
+trong danh sách ghế của phòng, cùng thời điểm hết hạn của các ghế đang giữ chỗ.
+Dữ liệu được nạp từ database một lần, sau đó cập nhật tăng dần qua các hook
+của websocket_manager (giữ chỗ, hủy, hết hạn, xác nhận).
+"""
+
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+import logging
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.seat_reservations import SeatReservations
+from app.models.seats import Seats
+from app.models.showtimes import Showtimes
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái ghế lưu trong mảng array('b')
+SEAT_FREE = 0
+SEAT_PENDING = 1
+SEAT_CONFIRMED = 2
+
+_STATUS_CODES = {"pending": SEAT_PENDING, "confirmed": SEAT_CONFIRMED}
+_STATUS_NAMES = {SEAT_PENDING: "pending", SEAT_CONFIRMED: "confirmed"}
+
+# Số suất chiếu tối đa giữ trong bộ nhớ (LRU)
+MAX_CACHED_SHOWTIMES = 256
+
+
+class ShowtimeOccupancy:
+    """Trạng thái ghế của một suất chiếu, đánh chỉ số theo vị trí ghế trong phòng"""
+
+    __slots__ = ("showtime_id", "seat_ids", "index", "states", "expires", "sessions")
+
+    def __init__(self, showtime_id: int, seat_ids: List[int]):
+        self.showtime_id = showtime_id
+        self.seat_ids = seat_ids
+        self.index: Dict[int, int] = {seat_id: i for i, seat_id in enumerate(seat_ids)}
+        self.states = array("b", bytes(len(seat_ids)))
+        # Thời điểm hết hạn (epoch seconds), 0 nếu không có
+        self.expires = array("d", bytes(8 * len(seat_ids)))
+        # Chỉ lưu session cho các ghế đang bị giữ/đã xác nhận
+        self.sessions: Dict[int, Optional[str]] = {}
+
+    def _set(self, seat_ids: Iterable[int], state: int, expires_at: float = 0.0, session_id: Optional[str] = None):
+        for seat_id in seat_ids:
+            i = self.index.get(seat_id)
+            if i is None:
+                continue
+            self.states[i] = state
+            if state == SEAT_FREE:
+                self.expires[i] = 0.0
+                self.sessions.pop(i, None)
+            else:
+                if expires_at:
+                    self.expires[i] = expires_at
+                if session_id is not None or state == SEAT_PENDING:
+                    self.sessions[i] = session_id
+
+    def mark_pending(self, seat_ids: Iterable[int], expires_at: float, session_id: Optional[str]):
+        self._set(seat_ids, SEAT_PENDING, expires_at, session_id)
+
+    def mark_confirmed(self, seat_ids: Iterable[int]):
+        self._set(seat_ids, SEAT_CONFIRMED)
+
+    def release(self, seat_ids: Iterable[int]):
+        self._set(seat_ids, SEAT_FREE)
+
+    def snapshot(self, now: Optional[float] = None) -> List[dict]:
+        """Danh sách ghế đang bị giữ/đã xác nhận theo định dạng initial_data"""
+        now = time.time() if now is None else now
+        states = self.states
+        expires = self.expires
+        result = []
+        for i, state in enumerate(states):
+            if state == SEAT_FREE:
+                continue
+            # Ghế pending đã quá hạn coi như trống, chờ tác vụ dọn dẹp xóa khỏi DB
+            if state == SEAT_PENDING and expires[i] and expires[i] <= now:
+                continue
+            result.append({
+                "seat_id": self.seat_ids[i],
+                "status": _STATUS_NAMES[state],
+                "expires_at": datetime.fromtimestamp(expires[i], timezone.utc).isoformat() if expires[i] else None,
+                "user_session": self.sessions.get(i),
+            })
+        return result
+
+
+class SeatOccupancyCache:
+    """Bộ nhớ đệm LRU các ShowtimeOccupancy, dùng chung trong một tiến trình"""
+
+    def __init__(self, max_showtimes: int = MAX_CACHED_SHOWTIMES):
+        self.max_showtimes = max_showtimes
+        self._entries: "OrderedDict[int, ShowtimeOccupancy]" = OrderedDict()
+        # Số lần cập nhật theo suất chiếu, để bỏ kết quả nạp đã cũ nếu có cập nhật xen vào
+        self._versions: Dict[int, int] = {}
+
+    def get(self, showtime_id: int) -> Optional[ShowtimeOccupancy]:
+        entry = self._entries.get(showtime_id)
+        if entry is not None:
+            self._entries.move_to_end(showtime_id)
+        return entry
+
+    async def get_or_load(self, showtime_id: int, db: AsyncSession) -> Optional[ShowtimeOccupancy]:
+        """Lấy trạng thái ghế từ bộ nhớ, nạp từ database nếu chưa có. Trả về None nếu không có suất chiếu"""
+        entry = self.get(showtime_id)
+        if entry is None:
+            entry = await self.load(showtime_id, db)
+        return entry
+
+    async def load(self, showtime_id: int, db: AsyncSession) -> Optional[ShowtimeOccupancy]:
+        """Nạp danh sách ghế của phòng và các reservation hiện tại của suất chiếu"""
+        version = self._versions.get(showtime_id, 0)
+        seat_rows = (await db.execute(
+            select(Showtimes.showtime_id, Seats.seat_id)
+            .outerjoin(Seats, Seats.room_id == Showtimes.room_id)
+            .where(Showtimes.showtime_id == showtime_id)
+            .order_by(Seats.row_number, Seats.column_number, Seats.seat_id)
+        )).all()
+        if not seat_rows:
+            return None
+        entry = ShowtimeOccupancy(showtime_id, [row.seat_id for row in seat_rows if row.seat_id is not None])
+
+        reservations = (await db.execute(
+            select(
+                SeatReservations.seat_id,
+                SeatReservations.status,
+                SeatReservations.expires_at,
+                SeatReservations.session_id,
+            ).where(
+                SeatReservations.showtime_id == showtime_id,
+                SeatReservations.status.in_(["confirmed", "pending"])
+            )
+        )).all()
+        for reservation in reservations:
+            i = entry.index.get(reservation.seat_id)
+            if i is None:
+                continue
+            entry.states[i] = _STATUS_CODES[reservation.status]
+            if reservation.expires_at is not None:
+                entry.expires[i] = reservation.expires_at.timestamp()
+            entry.sessions[i] = reservation.session_id
+
+        # Có sự kiện ghế xen vào trong lúc chờ database: vẫn trả kết quả nhưng không lưu,
+        # lần nạp sau sẽ đọc trạng thái mới nhất
+        if self._versions.get(showtime_id, 0) == version:
+            self._store(showtime_id, entry)
+        logger.debug(f"🪑 Loaded occupancy for showtime={showtime_id}: {len(entry.seat_ids)} seats")
+        return entry
+
+    def _store(self, showtime_id: int, entry: ShowtimeOccupancy):
+        self._entries[showtime_id] = entry
+        self._entries.move_to_end(showtime_id)
+        while len(self._entries) > self.max_showtimes:
+            self._entries.popitem(last=False)
+
+    # Các hàm cập nhật tăng dần: bỏ qua nếu suất chiếu chưa được nạp,
+    # lần nạp sau sẽ đọc trạng thái mới nhất từ database.
+    def _touch(self, showtime_id: int) -> Optional[ShowtimeOccupancy]:
+        self._versions[showtime_id] = self._versions.get(showtime_id, 0) + 1
+        return self._entries.get(showtime_id)
+
+    def mark_pending(self, showtime_id: int, seat_ids: Iterable[int], expires_at: datetime, session_id: Optional[str]):
+        entry = self._touch(showtime_id)
+        if entry is not None:
+            entry.mark_pending(seat_ids, expires_at.timestamp(), session_id)
+
+    def mark_confirmed(self, showtime_id: int, seat_ids: Iterable[int]):
+        entry = self._touch(showtime_id)
+        if entry is not None:
+            entry.mark_confirmed(seat_ids)
+
+    def release(self, showtime_id: int, seat_ids: Iterable[int]):
+        entry = self._touch(showtime_id)
+        if entry is not None:
+            entry.release(seat_ids)
+
+    def invalidate(self, showtime_id: Optional[int] = None):
+        """Xóa bộ nhớ đệm của một suất chiếu (hoặc tất cả)"""
+        if showtime_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(showtime_id, None)
+
+
+# Instance toàn cục dùng chung cho WebSocket manager và các service
+seat_occupancy = SeatOccupancyCache()
@@ -1,6 +1,10 @@
 from fastapi import Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from app.core.database import get_db
+from app.core.permission_matrix import permission_matrix
 from app.models.users import UserStatusEnum, Users
-from app.services.auth_service import get_current_user
+from app.schemas.auth import TokenPrincipal
+from app.services.auth_service import get_current_principal, get_current_user
 
 # Hàm get_current_active_user vẫn ở đây
 def get_current_active_user(current_user = Depends(get_current_user)): 
@@ -9,3 +13,24 @@ def get_current_active_user(current_user = Depends(get_current_user)):
             status_code=status.HTTP_403_FORBIDDEN, detail="Tài khoản chưa được xác minh"
         )
     return current_user
+
+
+def require_permission(*permission_names: str):
+    """Dependency kiểm tra người dùng có đủ các quyền (theo vai trò) bằng một phép AND trên bitmask.
+    Vai trò lấy từ get_current_principal: khi TRUST_TOKEN_CLAIMS bật, vai trò bị gỡ ở worker khác vẫn
+    được chấp nhận tới khi access token hết hạn.
+
+        @router.get('/reports', dependencies=[Depends(require_permission("report_view"))])
+    """
+    def dependency(
+        principal: TokenPrincipal = Depends(get_current_principal), db: Session = Depends(get_db)
+    ) -> TokenPrincipal:
+        # Chỉ truy vấn khi ma trận chưa nạp hoặc đã quá PERMISSION_MATRIX_TTL
+        permission_matrix.ensure_loaded(db)
+        required_mask = permission_matrix.permission_mask(permission_names)
+        if required_mask is None or not permission_matrix.allows(principal.roles, required_mask):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Không có quyền thực hiện thao tác này"
+            )
+        return principal
+    return dependency
@@ -0,0 +1,140 @@
+"""
+Token Revocation - Tập các họ refresh token đã bị thu hồi, kiểm tra O(1) cho mọi request
+Access token và refresh token mang claim `fid` (họ token tạo từ một lần đăng nhập). Khi một họ
+bị thu hồi (đăng xuất, phát hiện refresh token bị dùng lại), mọi token của họ đó bị từ chối.
+Bloom filter trả lời nhanh "chắc chắn chưa bị thu hồi" cho gần như toàn bộ request; chỉ khi
+Bloom filter báo có mới tra tập chính xác (loại bỏ dương tính giả, biết thời điểm hết hạn).
+Bảng refresh_tokens là nguồn dữ liệu gốc: tác vụ nền đồng bộ định kỳ các họ mới bị thu hồi
+(kể cả do worker khác thu hồi).
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.refresh_tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+# Đọc lùi lại một khoảng khi đồng bộ để không bỏ sót transaction commit chậm hơn revoked_at của nó
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Bloom filter trên bytearray, k vị trí bit lấy từ một digest blake2b (double hashing)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationSet:
+    """Các họ token đã bị thu hồi: Bloom filter + dict family_id -> thời điểm hết hạn (epoch)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._exact: Dict[str, float] = {}
+        self._bloom = BloomFilter(capacity, error_rate)
+        # Mốc revoked_at đã đồng bộ từ database
+        self._synced_until: Optional[datetime] = None
+        self.checks = 0
+        self.bloom_hits = 0
+
+    def revoke(self, family_id: str, expires_at: float):
+        """Thêm họ token bị thu hồi, giữ đến khi mọi token của họ đó hết hạn"""
+        with self._lock:
+            self._exact[family_id] = max(expires_at, self._exact.get(family_id, 0.0))
+            self._bloom.add(family_id)
+            if len(self._exact) > self.capacity:
+                self._prune_locked()
+
+    def is_revoked(self, family_id: str) -> bool:
+        self.checks += 1
+        # Đọc không cần khóa: bytearray/dict chỉ bị thay nguyên khối khi prune
+        if family_id not in self._bloom:
+            return False
+        self.bloom_hits += 1
+        expires_at = self._exact.get(family_id)
+        return expires_at is not None and expires_at > time.time()
+
+    def _prune_locked(self):
+        """Bỏ các họ đã hết hạn và dựng lại Bloom filter (Bloom filter không xóa được phần tử)"""
+        now = time.time()
+        exact = {family_id: exp for family_id, exp in self._exact.items() if exp > now}
+        if len(exact) == len(self._exact) and len(exact) <= self.capacity:
+            return
+        self._exact = exact
+        if len(exact) > self.capacity:
+            self.capacity = len(exact) * 2
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for family_id in self._exact:
+            bloom.add(family_id)
+        self._bloom = bloom
+
+    def prune(self):
+        with self._lock:
+            self._prune_locked()
+
+    async def sync(self, db: AsyncSession) -> int:
+        """Nạp các họ token bị thu hồi từ lần đồng bộ trước (lần đầu: tất cả họ còn hạn)"""
+        stmt = (
+            select(RefreshToken.family_id, func.max(RefreshToken.expires_at), func.max(RefreshToken.revoked_at))
+            .where(RefreshToken.revoked_at.is_not(None))
+            .group_by(RefreshToken.family_id)
+            .having(func.max(RefreshToken.expires_at) > func.now())
+        )
+        if self._synced_until is not None:
+            stmt = stmt.where(RefreshToken.revoked_at > self._synced_until - SYNC_OVERLAP)
+        rows = (await db.execute(stmt)).all()
+        for family_id, expires_at, revoked_at in rows:
+            self.revoke(family_id, expires_at.timestamp())
+            if self._synced_until is None or revoked_at > self._synced_until:
+                self._synced_until = revoked_at
+        if self._synced_until is None:
+            self._synced_until = datetime.now(timezone.utc)
+        self.prune()
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "revoked_families": len(self._exact),
+                "bloom_bits": self._bloom.size,
+                "bloom_hashes": self._bloom.hash_count,
+                "checks": self.checks,
+                "bloom_hits": self.bloom_hits,
+                "synced_until": self._synced_until.isoformat() if self._synced_until else None,
+            }
+
+
+# Instance toàn cục để sử dụng trong toàn bộ ứng dụng
+revoked_token_families = RevocationSet(
+    capacity=settings.TOKEN_REVOCATION_CAPACITY,
+    error_rate=settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE,
+)
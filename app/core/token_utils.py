@@ -1,14 +1,19 @@
 # Nơi chứa các hàm tạo và refresh token
 
 from jose import jwt
+import uuid
 from datetime import datetime, timedelta, timezone
 from app.core.config import settings
 
 def create_token(data: dict, expires_delta: timedelta, token_type: str) -> str:
     """Tạo token JWT với dữ liệu, thời gian hết hạn và loại token."""
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + expires_delta
-    to_encode.update({"exp": expire, "type": token_type})
+    now = datetime.now(timezone.utc)
+    expire = now + expires_delta
+    # jti: khóa cache principal / refresh token trong database (có thể truyền sẵn trong data),
+    # iat: so với thời điểm người dùng thay đổi gần nhất
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    to_encode.update({"exp": expire, "iat": now, "type": token_type})
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
     )
@@ -0,0 +1,47 @@
+"""
+WebSocket Frames - Lớp mã hóa frame JSON cho WebSocket
+Mỗi sự kiện chỉ được serialize đúng một lần, chuỗi kết quả được dùng chung cho mọi
+kết nối nhận tin. Dùng orjson nếu đã cài (nhanh hơn nhiều khi phát sóng dồn dập),
+ngược lại dùng thư viện json chuẩn. Các frame hằng số như pong được tạo sẵn.
+"""
+
+from typing import Any, Union
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+
+if orjson is not None:
+    def encode_frame(message: Any) -> str:
+        """Serialize tin nhắn thành frame JSON (text)"""
+        return orjson.dumps(message).decode("utf-8")
+
+    def decode_frame(data: Union[str, bytes]) -> Any:
+        """Giải mã frame JSON nhận được từ client hoặc từ bus"""
+        return orjson.loads(data)
+
+    DecodeError = orjson.JSONDecodeError
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def encode_frame(message: Any) -> str:
+        """Serialize tin nhắn thành frame JSON (text)"""
+        return _encoder.encode(message)
+
+    def decode_frame(data: Union[str, bytes]) -> Any:
+        """Giải mã frame JSON nhận được từ client hoặc từ bus"""
+        return json.loads(data)
+
+    DecodeError = json.JSONDecodeError
+
+
+def add_seq(frame: str, seq: int) -> str:
+    """Chèn trường seq vào đầu một frame object đã serialize, không cần serialize lại"""
+    return f'{{"seq":{seq},{frame[1:]}' if frame != "{}" else f'{{"seq":{seq}}}'
+
+
+# Các frame hằng số, tạo một lần khi import
+PONG_FRAME = encode_frame({"type": "pong"})
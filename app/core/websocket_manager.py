@@ -1,9 +1,24 @@
-from typing import Dict, List, Set
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
-import json
 import logging
 import asyncio
 
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.seat_event_bus import SeatEventBus, create_seat_event_bus
+from app.core.seat_event_log import SeatEventLog
+from app.core.seat_occupancy import seat_occupancy
+from app.core.websocket_frames import encode_frame
+from app.core.websocket_outbox import (
+    ConnectionOutbox,
+    SeatEvent,
+    encode_seat_delta,
+    SEAT_CONFIRMED,
+    SEAT_RELEASED,
+    SEAT_RESERVED,
+)
+
 logger = logging.getLogger(__name__)
 
 class WebSocketManager:
@@ -14,8 +29,14 @@ class WebSocketManager:
         self.active_connections: Dict[int, Set[WebSocket]] = {}
         # Dictionary ánh xạ kết nối WebSocket với showtime_id và session_id
         self.connection_info: Dict[WebSocket, Dict] = {}
+        # Hàng đợi gửi tin riêng của từng kết nối
+        self.outboxes: Dict[WebSocket, ConnectionOutbox] = {}
         # Lock để tránh race condition
         self._lock = asyncio.Lock()
+        # Bus pub/sub để phát sự kiện ghế tới các worker khác
+        self.event_bus: SeatEventBus = create_seat_event_bus(settings.SEAT_EVENT_BUS)
+        # Số thứ tự và bộ đệm sự kiện ghế gần đây để client kết nối lại nhận delta
+        self.event_log = SeatEventLog(settings.WS_REPLAY_BUFFER_SIZE)
 
     async def connect(self, websocket: WebSocket, showtime_id: int, session_id: str = None):
         """Chấp nhận kết nối WebSocket mới cho một suất chiếu cụ thể"""
@@ -34,6 +55,19 @@ class WebSocketManager:
                     "session_id": session_id,
                     "connected_at": asyncio.get_event_loop().time()
                 }
+
+                # Tạo hàng đợi gửi tin và writer task cho kết nối
+                outbox = ConnectionOutbox(
+                    websocket,
+                    showtime_id,
+                    build_snapshot=self.build_snapshot_frame,
+                    on_dead=self._drop_connection,
+                    maxsize=settings.WS_OUTBOUND_QUEUE_SIZE,
+                    coalesce_window=settings.WS_COALESCE_WINDOW_MS / 1000,
+                    send_timeout=settings.WS_SEND_TIMEOUT,
+                )
+                self.outboxes[websocket] = outbox
+                outbox.start()
                 
             logger.info(
                 f"✅ WebSocket connected: showtime={showtime_id}, "
@@ -46,7 +80,9 @@ class WebSocketManager:
 
     async def disconnect(self, websocket: WebSocket):
         """Xóa kết nối WebSocket khi client ngắt kết nối"""
+        outbox = None
         async with self._lock:
+            outbox = self.outboxes.pop(websocket, None)
             if websocket in self.connection_info:
                 info = self.connection_info[websocket]
                 showtime_id = info["showtime_id"]
@@ -67,29 +103,30 @@ class WebSocketManager:
                     f"session={session_id}"
                 )
 
+        # Dừng writer task bên ngoài lock
+        if outbox is not None:
+            await outbox.close()
+
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        """Gửi tin nhắn riêng tư đến một client cụ thể"""
+        """Gửi tin nhắn riêng tư đến một client cụ thể (qua hàng đợi của kết nối)"""
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            outbox.push_frame(message)
+            return
         try:
             await websocket.send_text(message)
         except Exception as e:
             logger.error(f"❌ Error sending personal message: {e}")
             await self.disconnect(websocket)
 
-    async def broadcast_to_showtime(
-        self, 
-        message: dict, 
-        showtime_id: int, 
+    def _target_outboxes(
+        self,
+        showtime_id: int,
         exclude_websocket: WebSocket = None,
         only_session: str = None
-    ):
-        """Phát sóng tin nhắn đến tất cả client đang xem một suất chiếu cụ thể"""
-        if showtime_id not in self.active_connections:
-            return
-        
-        message_str = json.dumps(message)
-        disconnected_connections = []
-        sent_count = 0
-        
+    ) -> List[ConnectionOutbox]:
+        """Lấy hàng đợi của các kết nối nhận tin trong một suất chiếu"""
+        targets = []
         # Duyệt qua tất cả kết nối trong suất chiếu
         for connection in list(self.active_connections.get(showtime_id, set())):
             # Bỏ qua kết nối được loại trừ
@@ -101,19 +138,106 @@ class WebSocketManager:
                 info = self.connection_info.get(connection, {})
                 if info.get("session_id") != only_session:
                     continue
-                
-            try:
-                await connection.send_text(message_str)
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"❌ Error broadcasting to connection: {e}")
-                disconnected_connections.append(connection)
+
+            outbox = self.outboxes.get(connection)
+            if outbox is not None:
+                targets.append(outbox)
+        return targets
+
+    async def broadcast_to_showtime(
+        self, 
+        message: dict, 
+        showtime_id: int, 
+        exclude_websocket: WebSocket = None,
+        only_session: str = None
+    ):
+        """Phát sóng tin nhắn đến tất cả client đang xem một suất chiếu cụ thể"""
+        if showtime_id not in self.active_connections:
+            return
         
-        # Dọn dẹp các kết nối bị lỗi
-        for connection in disconnected_connections:
-            await self.disconnect(connection)
+        # Serialize một lần, mọi kết nối dùng chung cùng một frame
+        message_str = encode_frame(message)
+        # Chỉ đưa vào hàng đợi, writer task của từng kết nối sẽ gửi độc lập
+        targets = self._target_outboxes(showtime_id, exclude_websocket, only_session)
+        for outbox in targets:
+            outbox.push_frame(message_str)
         
-        logger.debug(f"📢 Broadcast sent to {sent_count} connections")
+        logger.debug(f"📢 Broadcast queued for {len(targets)} connections")
+
+    async def _broadcast_seat_event(
+        self,
+        event: SeatEvent,
+        showtime_id: int,
+        exclude_websocket: WebSocket = None
+    ):
+        """Phát sóng sự kiện ghế, cho phép gộp với các sự kiện ghế khác trong cùng cửa sổ thời gian"""
+        if showtime_id not in self.active_connections:
+            return
+
+        targets = self._target_outboxes(showtime_id, exclude_websocket)
+        for outbox in targets:
+            outbox.push_seat_event(event)
+
+        logger.debug(f"📢 Seat event '{event.kind}' seq={event.seq} queued for {len(targets)} connections")
+
+    async def build_snapshot_frame(self, showtime_id: int) -> Optional[str]:
+        """Tạo frame initial_data chứa toàn bộ trạng thái ghế hiện tại của suất chiếu"""
+        # Lấy số thứ tự trước khi chờ database: sự kiện xen vào sẽ có seq lớn hơn snapshot
+        seq = self.event_log.current_seq(showtime_id)
+        occupancy = seat_occupancy.get(showtime_id)
+        if occupancy is None:
+            async with AsyncSessionLocal() as db:
+                occupancy = await seat_occupancy.get_or_load(showtime_id, db)
+        if occupancy is None:
+            return None
+        return encode_frame(self.build_snapshot_message(showtime_id, occupancy.snapshot(), seq))
+
+    def build_snapshot_message(self, showtime_id: int, reserved_seats: List[dict], seq: int = None) -> dict:
+        """Tin initial_data kèm số thứ tự hiện tại để client có thể kết nối lại bằng since_seq"""
+        return build_initial_data_message(
+            showtime_id,
+            reserved_seats,
+            seq=self.event_log.current_seq(showtime_id) if seq is None else seq,
+            stream_id=self.event_log.stream_id
+        )
+
+    async def resume(self, websocket: WebSocket, showtime_id: int, since_seq: int, stream_id: str) -> bool:
+        """Gửi lại các delta bị lỡ từ since_seq. Trả về False nếu cần gửi snapshot thay thế"""
+        if stream_id != self.event_log.stream_id:
+            return False
+        events = self.event_log.since(showtime_id, since_seq)
+        if events is None:
+            return False
+
+        if len(events) == 1:
+            await self.send_personal_message(events[0].frame, websocket)
+        elif events:
+            await self.send_personal_message(encode_seat_delta(showtime_id, events), websocket)
+        await self.send_personal_message(encode_frame({
+            "type": "resumed",
+            "showtime_id": showtime_id,
+            "seq": self.event_log.current_seq(showtime_id),
+            "stream_id": self.event_log.stream_id,
+            "replayed": len(events)
+        }), websocket)
+        logger.info(f"⏩ Resumed showtime={showtime_id} from seq={since_seq}: {len(events)} missed events")
+        return True
+
+    async def _drop_connection(self, websocket: WebSocket, slow: bool):
+        """Ngắt kết nối bị lỗi hoặc quá chậm (client sẽ tự kết nối lại và nhận snapshot)"""
+        if slow:
+            info = self.connection_info.get(websocket, {})
+            logger.warning(f"🐢 Dropping slow WebSocket consumer: showtime={info.get('showtime_id')}")
+        await self.disconnect(websocket)
+        if slow:
+            await self._close_quietly(websocket)
+
+    async def _close_quietly(self, websocket: WebSocket):
+        """Đóng kết nối của client chậm, không chờ quá thời gian gửi cho phép"""
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=settings.WS_SEND_TIMEOUT)
+        except Exception:
+            pass
 
     async def send_seat_update(
         self, 
@@ -134,11 +258,15 @@ class WebSocketManager:
         showtime_id: int, 
         seat_ids: List[int], 
         user_session: str, 
-        exclude_websocket: WebSocket = None
+        exclude_websocket: WebSocket = None,
+        expires_at: datetime = None
     ):
         """Thông báo rằng các ghế đã được đặt chỗ"""
-        from datetime import datetime
-        
+        from app.services.reservations_service import RESERVATION_HOLD_MINUTES
+
+        if expires_at is None:
+            expires_at = datetime.now(timezone.utc) + timedelta(minutes=RESERVATION_HOLD_MINUTES)
+
         message = {
             "type": "seats_reserved",
             "showtime_id": showtime_id,
@@ -148,7 +276,14 @@ class WebSocketManager:
                 "timestamp": datetime.now().isoformat()
             }
         }
-        await self.broadcast_to_showtime(message, showtime_id, exclude_websocket)
+        await self.publish_seat_event({
+            "kind": SEAT_RESERVED,
+            "showtime_id": showtime_id,
+            "seat_ids": seat_ids,
+            "user_session": user_session,
+            "expires_at": expires_at.isoformat(),
+            "message": message
+        }, exclude_websocket)
 
     async def send_seat_released(
         self, 
@@ -158,8 +293,6 @@ class WebSocketManager:
         reason: str = "user_cancelled"
     ):
         """Thông báo rằng các ghế đã được giải phóng"""
-        from datetime import datetime
-        
         message = {
             "type": "seat_released",
             "showtime_id": showtime_id,
@@ -169,7 +302,84 @@ class WebSocketManager:
         }
         
         logger.info(f"🔄 Broadcasting seat_released: showtime={showtime_id}, seats={seat_ids}")
-        await self.broadcast_to_showtime(message, showtime_id, exclude_websocket)
+        await self.publish_seat_event({
+            "kind": SEAT_RELEASED,
+            "showtime_id": showtime_id,
+            "seat_ids": seat_ids,
+            "message": message
+        }, exclude_websocket)
+
+    async def send_seat_confirmed(
+        self,
+        showtime_id: int,
+        seat_ids: List[int],
+        exclude_websocket: WebSocket = None
+    ):
+        """Thông báo rằng các ghế đã được thanh toán và xác nhận"""
+        message = {
+            "type": "seats_confirmed",
+            "showtime_id": showtime_id,
+            "data": {
+                "seat_ids": seat_ids,
+                "timestamp": datetime.now().isoformat()
+            }
+        }
+        await self.publish_seat_event({
+            "kind": SEAT_CONFIRMED,
+            "showtime_id": showtime_id,
+            "seat_ids": seat_ids,
+            "message": message
+        }, exclude_websocket)
+
+    # ================================
+    # BUS SỰ KIỆN GHẾ GIỮA CÁC WORKER
+    # ================================
+
+    async def publish_seat_event(self, event: dict, exclude_websocket: WebSocket = None):
+        """Áp dụng sự kiện ghế cho worker hiện tại rồi phát lên bus cho các worker khác"""
+        event["origin"] = self.event_bus.node_id
+        # Serialize tin nhắn một lần, các worker khác gửi lại nguyên frame này
+        event["frame"] = encode_frame(event.pop("message"))
+        await self._apply_seat_event(event, exclude_websocket)
+        try:
+            await self.event_bus.publish(event)
+        except Exception as e:
+            logger.error(f"❌ Failed to publish seat event to bus: {e}")
+
+    async def handle_bus_event(self, event: dict):
+        """Nhận sự kiện ghế từ worker khác và phát lại cho các socket của worker này"""
+        try:
+            await self._apply_seat_event(event)
+        except Exception as e:
+            logger.error(f"❌ Failed to apply seat event from bus: {e}")
+
+    async def _apply_seat_event(self, event: dict, exclude_websocket: WebSocket = None):
+        """Cập nhật bộ nhớ đệm trạng thái ghế và phát sóng tới các kết nối cục bộ"""
+        kind = event["kind"]
+        showtime_id = event["showtime_id"]
+        seat_ids = event["seat_ids"]
+        user_session = event.get("user_session")
+
+        # Cập nhật bộ nhớ đệm trạng thái ghế trước khi phát sóng
+        if kind == SEAT_RESERVED:
+            expires_at = datetime.fromisoformat(event["expires_at"])
+            seat_occupancy.mark_pending(showtime_id, seat_ids, expires_at, user_session)
+        elif kind == SEAT_RELEASED:
+            seat_occupancy.release(showtime_id, seat_ids)
+        else:
+            seat_occupancy.mark_confirmed(showtime_id, seat_ids)
+
+        # Gán số thứ tự và lưu vào bộ đệm kể cả khi chưa có kết nối nào
+        seat_event = self.event_log.append(showtime_id, kind, seat_ids, event["frame"], user_session)
+        await self._broadcast_seat_event(seat_event, showtime_id, exclude_websocket)
+
+    async def start_event_bus(self):
+        """Bắt đầu nhận sự kiện ghế từ các worker khác"""
+        await self.event_bus.start(self.handle_bus_event)
+
+    async def stop_event_bus(self):
+        """Dừng nhận sự kiện ghế từ bus"""
+        await self.event_bus.stop()
 
     def get_connection_count(self, showtime_id: int) -> int:
         """Lấy số lượng kết nối đang hoạt động cho một suất chiếu"""
@@ -187,5 +397,23 @@ class WebSocketManager:
             if conn in self.connection_info
         ]
 
+
+def build_initial_data_message(
+    showtime_id: int,
+    reserved_seats: List[dict],
+    seq: int = None,
+    stream_id: str = None
+) -> dict:
+    """Tin initial_data gửi cho client khi kết nối hoặc khi cần đồng bộ lại"""
+    return {
+        "type": "initial_data",
+        "showtime_id": showtime_id,
+        "seq": seq,
+        "stream_id": stream_id,
+        "data": {
+            "reserved_seats": reserved_seats
+        }
+    }
+
 # Instance toàn cục của WebSocket manager
 websocket_manager = WebSocketManager()
\ No newline at end of file
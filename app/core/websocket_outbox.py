@@ -0,0 +1,198 @@
+"""
+WebSocket Outbox - Hàng đợi gửi tin có giới hạn cho từng kết nối WebSocket
+Mỗi kết nối có một hàng đợi riêng và một writer task riêng để client chậm không làm
+chậm các client khác. Các sự kiện ghế (giữ chỗ, giải phóng, xác nhận) đến trong một
+khoảng thời gian ngắn được gộp thành một frame delta. Khi hàng đợi bị tràn, các tin
+đang chờ bị bỏ và client nhận lại toàn bộ trạng thái ghế (resync).
+Frame delta được ghi nhớ theo tập sự kiện, nên các kết nối gộp cùng một tập sự kiện
+dùng chung một chuỗi đã serialize.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+from fastapi import WebSocket
+
+from app.core.websocket_frames import encode_frame
+
+logger = logging.getLogger(__name__)
+
+# Loại sự kiện ghế
+SEAT_RESERVED = "reserved"
+SEAT_RELEASED = "released"
+SEAT_CONFIRMED = "confirmed"
+
+# Các marker đặt trong hàng đợi thay cho frame
+_FLUSH_SEATS = object()  # Gộp và gửi các sự kiện ghế đang chờ
+_RESYNC = object()       # Gửi lại toàn bộ trạng thái ghế
+
+# Số frame delta gần nhất được ghi nhớ
+_DELTA_CACHE_SIZE = 256
+_delta_frames: "OrderedDict[Tuple, str]" = OrderedDict()
+
+
+class SeatEvent:
+    """Một sự kiện ghế cùng frame gốc đã được serialize và số thứ tự trong suất chiếu"""
+
+    __slots__ = ("kind", "seat_ids", "user_session", "frame", "seq")
+
+    def __init__(self, kind: str, seat_ids: List[int], frame: str, user_session: Optional[str] = None,
+                 seq: Optional[int] = None):
+        self.kind = kind
+        self.seat_ids = seat_ids
+        self.user_session = user_session
+        self.frame = frame
+        self.seq = seq
+
+
+def build_seat_delta_message(showtime_id: int, events: List[SeatEvent]) -> dict:
+    """Gộp nhiều sự kiện ghế thành một tin delta, chỉ giữ trạng thái cuối cùng của mỗi ghế"""
+    final_state: Dict[int, SeatEvent] = {}
+    for event in events:
+        for seat_id in event.seat_ids:
+            final_state[seat_id] = event
+
+    reserved_by_session: Dict[Optional[str], List[int]] = {}
+    released: List[int] = []
+    confirmed: List[int] = []
+    for seat_id, event in final_state.items():
+        if event.kind == SEAT_RESERVED:
+            reserved_by_session.setdefault(event.user_session, []).append(seat_id)
+        elif event.kind == SEAT_RELEASED:
+            released.append(seat_id)
+        else:
+            confirmed.append(seat_id)
+
+    return {
+        "type": "seats_delta",
+        "showtime_id": showtime_id,
+        # Số thứ tự của sự kiện cuối cùng được gộp
+        "seq": events[-1].seq,
+        "data": {
+            "reserved": [
+                {"seat_ids": seat_ids, "user_session": user_session}
+                for user_session, seat_ids in reserved_by_session.items()
+            ],
+            "released": released,
+            "confirmed": confirmed,
+            "timestamp": datetime.now().isoformat()
+        }
+    }
+
+
+def encode_seat_delta(showtime_id: int, events: List[SeatEvent]) -> str:
+    """Frame delta đã serialize, dùng chung cho mọi kết nối gộp cùng các sự kiện"""
+    # SeatEvent được băm theo định danh, mỗi sự kiện chỉ tạo một lần cho mọi kết nối
+    key = (showtime_id, tuple(events))
+    frame = _delta_frames.get(key)
+    if frame is None:
+        frame = encode_frame(build_seat_delta_message(showtime_id, events))
+        _delta_frames[key] = frame
+        if len(_delta_frames) > _DELTA_CACHE_SIZE:
+            _delta_frames.popitem(last=False)
+    return frame
+
+
+class ConnectionOutbox:
+    """Hàng đợi gửi tin có giới hạn và writer task của một kết nối WebSocket"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        showtime_id: int,
+        build_snapshot: Callable[[int], Awaitable[Optional[str]]],
+        on_dead: Callable[[WebSocket, bool], Awaitable[None]],
+        maxsize: int,
+        coalesce_window: float,
+        send_timeout: float,
+    ):
+        self.websocket = websocket
+        self.showtime_id = showtime_id
+        self.build_snapshot = build_snapshot
+        self.on_dead = on_dead
+        self.coalesce_window = coalesce_window
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.task: Optional[asyncio.Task] = None
+        self.overflow_count = 0
+        self._seat_events: List[SeatEvent] = []
+        self._resync_pending = False
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+
+    def push_frame(self, frame: str):
+        """Đưa một frame vào hàng đợi, chuyển sang resync nếu hàng đợi đầy"""
+        if self._resync_pending:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._overflow()
+
+    def push_seat_event(self, event: SeatEvent):
+        """Thêm sự kiện ghế, các sự kiện trong cùng cửa sổ thời gian sẽ được gộp"""
+        if self._resync_pending:
+            # Snapshot sắp gửi đã bao gồm sự kiện này
+            return
+        if not self._seat_events:
+            try:
+                self.queue.put_nowait(_FLUSH_SEATS)
+            except asyncio.QueueFull:
+                self._overflow()
+                return
+        self._seat_events.append(event)
+
+    def _overflow(self):
+        """Bỏ toàn bộ tin đang chờ và lên lịch gửi lại trạng thái đầy đủ"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self._seat_events.clear()
+        self._resync_pending = True
+        self.overflow_count += 1
+        self.queue.put_nowait(_RESYNC)
+        logger.warning(f"📦 Outbound queue overflow, scheduling resync: showtime={self.showtime_id}")
+
+    async def _next_frame(self) -> Optional[str]:
+        item = await self.queue.get()
+        if item is _FLUSH_SEATS:
+            if self.coalesce_window > 0:
+                await asyncio.sleep(self.coalesce_window)
+            events, self._seat_events = self._seat_events, []
+            if not events:
+                return None
+            if len(events) == 1:
+                return events[0].frame
+            return encode_seat_delta(self.showtime_id, events)
+        if item is _RESYNC:
+            self._resync_pending = False
+            return await self.build_snapshot(self.showtime_id)
+        return item
+
+    async def _writer(self):
+        """Writer task: lấy frame từ hàng đợi và gửi với giới hạn thời gian"""
+        try:
+            while True:
+                frame = await self._next_frame()
+                if frame is None:
+                    continue
+                await asyncio.wait_for(self.websocket.send_text(frame), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            await self.on_dead(self.websocket, True)
+        except Exception as e:
+            logger.error(f"❌ Error sending to connection: {e}")
+            await self.on_dead(self.websocket, False)
+
+    async def close(self):
+        """Dừng writer task (trừ khi đang được gọi từ chính writer task)"""
+        if self.task and self.task is not asyncio.current_task() and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
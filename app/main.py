@@ -1,11 +1,17 @@
+import asyncio
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse, RedirectResponse
 import uvicorn
 from app.core.middleware import setup_middleware
 from app.utils.response import error_response
-from app.api.v1 import auth, movies, reservations, roles, rooms, seat_layouts, showtimes, theaters, tickets, users, promotions, combos, ranks, payments, websocket, bookings
+from app.api.v1 import auth, movies, reservations, roles, rooms, seat_layouts, showtimes, theaters, tickets, users, promotions, combos, ranks, payments, websocket, bookings, monitoring
 # from app.core.database import Base, engine
 from app.core.background_tasks import background_tasks
+from app.core.config import settings
+from app.core.email_queue import email_queue
+from app.core.loop_monitor import loop_monitor
+from app.core.password_hasher import password_hasher
+from app.core.websocket_manager import websocket_manager
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="Cinema Booking API", version="1.0.0")
@@ -14,12 +20,21 @@ setup_middleware(app)
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks when the application starts"""
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    await websocket_manager.start_event_bus()
     background_tasks.start()
+    email_queue.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Stop background tasks when the application shuts down"""
     await background_tasks.stop()
+    await websocket_manager.stop_event_bus()
+    # Gửi nốt các email đang chờ trước khi tắt
+    await asyncio.get_running_loop().run_in_executor(None, email_queue.stop)
+    await asyncio.get_running_loop().run_in_executor(None, password_hasher.shutdown)
+    await loop_monitor.stop()
 # Tạo bảng cơ sở dữ liệu
 # Base.metadata.create_all(bind=engine)
 
@@ -39,6 +54,7 @@ app.include_router(ranks.router, prefix="/api/v1", tags=["Ranks"])
 app.include_router(roles.router, prefix="/api/v1", tags=["Roles"])
 app.include_router(payments.router, prefix="/api/v1/payments", tags=["Payments"])
 app.include_router(websocket.router, prefix="/api/v1", tags=["WebSocket"])
+app.include_router(monitoring.router, prefix="/api/v1/monitoring", tags=["Monitoring"])
 
 @app.get("/")
 async def root():
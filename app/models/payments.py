@@ -27,7 +27,7 @@ class Payment(Base):
     }
     payment_id = Column(Integer, primary_key=True, index=True)
     order_id = Column(String(100), unique=True, index=True, nullable=False)
-    transaction_id = Column(String(100), index=True, nullable=True)
+    transaction_id = Column(Integer, index=True, nullable=True)
     amount = Column(Float, nullable=False)
     payment_method = Column(Enum(PaymentMethodEnum), nullable=False)
     payment_status = Column(Enum(PaymentStatusEnum), default=PaymentStatusEnum.PENDING)
@@ -61,5 +61,5 @@ class VNPayPayment(Payment):
     vnp_transaction_no = Column(String(100), nullable=True)
     vnp_bank_code = Column(String(20), nullable=True)
     vnp_card_type = Column(String(20), nullable=True)
-    vnp_pay_date = Column(String(20), nullable=True)
+    vnp_pay_date = Column(DateTime(timezone=True), nullable=True)
     vnp_response_code = Column(String(10), nullable=True)
\ No newline at end of file
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, func
+from app.core.database import Base
+
+
+class RefreshToken(Base):
+    """Refresh token đã cấp. Mỗi lần làm mới tạo token mới cùng họ (family_id) và đánh dấu
+    token cũ đã dùng; token đã dùng bị đưa lại lần nữa nghĩa là bị lộ, cả họ bị thu hồi."""
+    __tablename__ = "refresh_tokens"
+
+    token_id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(String(64), index=True, nullable=False)
+    parent_jti = Column(String(64), nullable=True)  # Token được xoay vòng ra token này
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), index=True, nullable=False)
+    issued_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True), nullable=True)  # Thời điểm đã đổi lấy token mới
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_reason = Column(String(50), nullable=True)  # logout | reuse
@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel, EmailStr
 
 
@@ -13,4 +14,11 @@ class UserLogin(BaseModel):
 
 class EmailVerificationRequest(BaseModel):
     email: EmailStr
-    verification_code: str
\ No newline at end of file
+    verification_code: str
+
+# Người dùng đã xác thực dựng từ claims của access token (không cần truy vấn database)
+class TokenPrincipal(BaseModel):
+    user_id: int
+    email: str
+    roles: List[str] = []
+    permissions: List[str] = []
@@ -1,4 +1,4 @@
-from typing import List, TypeVar, Generic
+from typing import List, Optional, TypeVar, Generic
 from pydantic import BaseModel
 
 # Định nghĩa TypeVar để biểu thị kiểu dữ liệu của các mục trong danh sách
@@ -6,7 +6,9 @@ T = TypeVar("T")
 
     # Schema tổng quát cho phản hồi phân trang.
 class PaginatedResponse(BaseModel, Generic[T]):
-    total: int
+    total: Optional[int] = None  # None khi count=none
+    total_estimated: bool = False  # total là số ước lượng (count=estimated)
     skip: int
     limit: int
+    next_cursor: Optional[str] = None  # Cursor keyset của trang tiếp theo, None khi là trang cuối
     items: List[T] # Trường dữ liệu chung cho danh sách các mục
\ No newline at end of file
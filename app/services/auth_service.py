@@ -1,40 +1,32 @@
 from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 import platform
 from fastapi import Depends, HTTPException, Request, status
 from jose import JWTError, jwt
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.password_hasher import password_hasher
+from app.core.permission_matrix import permission_matrix
+from app.core.principal_cache import principal_cache
+from app.core.token_revocation import revoked_token_families
 from app.core.token_utils import create_token
-from app.models import permissions
 from app.models.email_verifications import EmailVerification
 from app.models.role import Role, UserRole
 from app.models.users import Users, UserStatusEnum
 from app.models.ranks import Ranks
 
 # Thêm import cho model Role và UserRole
-from app.schemas.auth import EmailVerificationRequest, UserLogin, UserRegister
+from app.schemas.auth import EmailVerificationRequest, TokenPrincipal, UserLogin, UserRegister
 from app.schemas.users import UserResponse
-from app.services.email_service import EmailService
-from app.services.users_service import pwd_context
+from app.core.email_queue import email_queue
+from app.services.email_service import email_service
+from app.services.refresh_tokens_service import issue_refresh_token, revoke_family, rotate_refresh_token
 from fastapi.security import HTTPBearer, OAuth2PasswordBearer
 
-# --- Khởi tạo dịch vụ email và OAuth2 scheme ---
-smtp_host = getattr(settings, 'EMAIL_HOST', 'smtp.gmail.com')
-smtp_port = getattr(settings, 'EMAIL_PORT', 587)
-smtp_user = getattr(settings, 'EMAIL_USERNAME', None)
-smtp_pass = getattr(settings, 'EMAIL_PASSWORD', None)
-sender_name = getattr(settings, 'EMAIL_SENDER_NAME', 'CinePlus')
-
-email_service = EmailService(
-    smtp_server=smtp_host,
-    smtp_port=smtp_port,
-    username=smtp_user,
-    password=smtp_pass,
-    sender_name=sender_name,
-)
-
-
+# --- Khởi tạo OAuth2 scheme ---
 # oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
 security_scheme = HTTPBearer()
 
@@ -44,39 +36,46 @@ def create_access_token(data: dict) -> str:
     return create_token(data, access_token_expires, "access")
 
 
-def create_refresh_token(data: dict) -> str:
-    """Tạo token làm mới (refresh token)."""
-    refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    return create_token(data, refresh_token_expires, "refresh")
-
-
 # --- Hàm xác thực người dùng hiện tại ---
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(security_scheme)
-) -> Users:
-    """Dependency injection để lấy người dùng hiện tại từ access token."""
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Không thể xác thực thông tin đăng nhập",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(
-            token.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
-        email: str = payload.get("sub")
-        token_type: str = payload.get("type")
 
-        if email is None or token_type != "access":
-            raise credentials_exception
 
+def decode_access_token(token: str) -> dict:
+    """Giải mã access token, trả về payload (401 nếu token sai, hết hạn hoặc không phải access token)."""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    if payload.get("sub") is None or payload.get("type") != "access":
+        raise _credentials_exception()
+    # Họ token đã bị thu hồi (đăng xuất / refresh token bị dùng lại): Bloom filter + dict, không truy vấn database
+    family_id = payload.get("fid")
+    if family_id and revoked_token_families.is_revoked(family_id):
+        raise _credentials_exception()
+    return payload
+
+
+def get_current_user(
+    db: Session = Depends(get_db), token: str = Depends(security_scheme)
+) -> Users:
+    """Dependency injection để lấy người dùng hiện tại từ access token.
+    Người dùng đã xác thực được giữ trong principal_cache theo jti của token, nên các request
+    tiếp theo với cùng token không truy vấn database (session chỉ mở connection khi có truy vấn)."""
+    payload = decode_access_token(token.credentials)
+    cache_key = principal_cache.key_for(token.credentials, payload)
+    user = principal_cache.get(cache_key)
+    if user is not None:
+        return user
 
     user = (
         db.query(Users)
         .options(joinedload(Users.roles))  # Thêm joinedload để nạp trước thông tin vai trò
-        .filter(Users.email == email)
+        .filter(Users.email == payload["sub"])
         .first()
     )
     if user is None:
@@ -84,13 +83,52 @@ def get_current_user(
             status_code=status.HTTP_404_NOT_FOUND, detail="Người dùng không tồn tại"
         )
 
-    return UserResponse.from_orm(user)
+    user = UserResponse.from_orm(user)
+    principal_cache.put(cache_key, user.user_id, user, payload.get("exp"))
+    return user
+
+
+def get_current_principal(
+    db: Session = Depends(get_db), token: str = Depends(security_scheme)
+) -> TokenPrincipal:
+    """Dependency cho các route chỉ đọc, chỉ cần user_id/roles/permissions.
+    Khi TRUST_TOKEN_CLAIMS bật, dựng principal trực tiếp từ claims của token do login cấp,
+    trừ khi người dùng đã thay đổi (trạng thái, vai trò...) sau thời điểm cấp token. Mốc thay đổi chỉ
+    có trong worker đã xử lý thay đổi: worker khác vẫn tin claims cũ (kể cả tài khoản bị khóa, vai trò
+    bị gỡ) tới khi access token hết hạn, tối đa ACCESS_TOKEN_EXPIRE_MINUTES phút.
+    Các trường hợp còn lại đi qua get_current_user (có cache) và kiểm tra tài khoản đang hoạt động."""
+    payload = decode_access_token(token.credentials)
+    user_id = payload.get("user_id")
+    if (
+        settings.TRUST_TOKEN_CLAIMS
+        and user_id is not None
+        and payload.get("status") == UserStatusEnum.active.value
+        and not principal_cache.is_stale(user_id, payload.get("iat"))
+    ):
+        return TokenPrincipal(
+            user_id=user_id,
+            email=payload["sub"],
+            roles=payload.get("roles", []),
+            permissions=payload.get("permissions", []),
+        )
+
+    user = get_current_user(db, token)
+    if user.status != UserStatusEnum.active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Tài khoản chưa được xác minh"
+        )
+    return TokenPrincipal(
+        user_id=user.user_id,
+        email=user.email,
+        roles=[role.role_name for role in user.roles],
+        permissions=payload.get("permissions", []),
+    )
 
 
 # --- Hàm logic cho các chức năng ---
-def register(db: Session, user_in: UserRegister):
-    """Xử lý logic đăng ký người dùng mới."""
-    existing_user = db.query(Users).filter(Users.email == user_in.email).first()
+async def register(db: AsyncSession, user_in: UserRegister):
+    """Xử lý logic đăng ký người dùng mới (async: chờ bcrypt không giữ thread của threadpool)."""
+    existing_user = (await db.scalars(select(Users).where(Users.email == user_in.email))).first()
 
     if existing_user:
         if existing_user.status == UserStatusEnum.active:
@@ -102,9 +140,11 @@ def register(db: Session, user_in: UserRegister):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Tài khoản đã tồn tại nhưng chưa được kích hoạt. Vui lòng kiểm tra email hoặc yêu cầu gửi lại mã.",
             )
+    # Kết thúc transaction đọc trước khi chờ bcrypt để không giữ connection của pool
+    await db.commit()
 
     try:
-        hashed_password = pwd_context.hash(user_in.password)
+        hashed_password = await password_hasher.hash_async(user_in.password)
 
         # Lấy rank mặc định (ví dụ Bronze)
         # default_rank = db.query(Ranks).filter(Ranks.is_default == True).first()
@@ -121,8 +161,8 @@ def register(db: Session, user_in: UserRegister):
             is_verified=False,
         )
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
 
         print(f"New user rank_id after commit: {new_user.rank_id}")
 
@@ -138,7 +178,7 @@ def register(db: Session, user_in: UserRegister):
         db.add(verification)
 
         # Gán role mặc định
-        default_role = db.query(Role).filter(Role.role_name == "user").first()
+        default_role = (await db.scalars(select(Role).where(Role.role_name == "user"))).first()
         if not default_role:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -148,10 +188,10 @@ def register(db: Session, user_in: UserRegister):
         new_user_role = UserRole(user_id=new_user.user_id, role_id=default_role.role_id)
         db.add(new_user_role)
 
-        db.commit()
+        await db.commit()
 
-        # Gửi email xác nhận
-        if not email_service.send_verification_email(user_in.email, verification_code):
+        # Đưa email xác nhận vào hàng đợi gửi nền
+        if not email_queue.queue_verification_email(user_in.email, verification_code):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Không thể gửi email xác nhận. Vui lòng thử lại sau.",
@@ -161,21 +201,68 @@ def register(db: Session, user_in: UserRegister):
             "message": "Đăng ký thành công! Vui lòng kiểm tra email để xác minh tài khoản.",
             "email": user_in.email,
         }
+    except HTTPException:
+        # Giữ nguyên mã lỗi (503 khi hàng đợi băm mật khẩu đầy)
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Có lỗi xảy ra trong quá trình đăng ký: {str(e)}",
         )
 
 
-def login(db: Session, user_in: UserLogin, request: Request):
-    """Xử lý logic đăng nhập."""
-    user = db.query(Users).filter(Users.email == user_in.email).first()
+def access_token_claims(
+    db: Session, user: Users, family_id: str, ip: Optional[str] = None, role_ids: Optional[List[int]] = None
+) -> dict:
+    """Claims của access token: vai trò, quyền và họ token (dùng chung cho đăng nhập và làm mới).
+    Tên vai trò và quyền tra trong ma trận quyền, chỉ cần danh sách role_id của người dùng."""
+    if role_ids is None:
+        role_ids = [role_id for (role_id,) in db.query(UserRole.role_id).filter(UserRole.user_id == user.user_id)]
+    permission_matrix.ensure_loaded(db)
+    return _token_claims(user, family_id, ip, role_ids)
 
-    if not user or not pwd_context.verify(
-        user_in.password, getattr(user, "password_hash", "")
-    ):
+
+def _token_claims(user, family_id: str, ip: Optional[str], role_ids: List[int]) -> dict:
+    """Claims từ ma trận quyền đã nạp (không truy vấn database); user là Users hoặc dòng có
+    user_id/email/status"""
+    return {
+        "sub": user.email,
+        "user_id": user.user_id,
+        "status": user.status.value,
+        "roles": permission_matrix.role_names(role_ids),
+        "ip": ip,
+        "device": platform.system(),  # ví dụ: "Windows", "Linux", "Darwin"
+        "permissions": permission_matrix.permission_names(permission_matrix.role_ids_mask(role_ids)),
+        "fid": family_id,
+    }
+
+
+async def login(db: AsyncSession, user_in: UserLogin, request: Request):
+    """Xử lý logic đăng nhập (async: chờ bcrypt không giữ thread của threadpool)."""
+    # Một truy vấn: thông tin đăng nhập kèm danh sách role_id (tên vai trò/quyền tra trong ma trận quyền)
+    user = (await db.execute(
+        select(
+            Users.user_id,
+            Users.email,
+            Users.password_hash,
+            Users.is_verified,
+            Users.status,
+            func.array_remove(func.array_agg(UserRole.role_id), None).label("role_ids"),
+        )
+        .outerjoin(UserRole, UserRole.user_id == Users.user_id)
+        .where(Users.email == user_in.email)
+        .group_by(Users.user_id)
+    )).first()
+    # Kết thúc transaction đọc trước khi chờ bcrypt để không giữ connection của pool
+    await db.commit()
+
+    verified, new_hash = (
+        await password_hasher.verify_and_update_async(user_in.password, user.password_hash)
+        if user else (False, None)
+    )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email hoặc mật khẩu không trùng khớp",
@@ -186,38 +273,20 @@ def login(db: Session, user_in: UserLogin, request: Request):
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Tài khoản chưa được xác minh. Vui lòng kiểm tra email để kích hoạt.",
         )
-    # Lấy vai trò của người dùng và thêm vào payload token
-    user_roles_db = (
-        db.query(Role.role_name)
-        .join(UserRole)
-        .filter(UserRole.user_id == user.user_id)
-        .all()
-    )
-    roles_list = [role_name[0] for role_name in user_roles_db]
-    # danh sách quyền 
-    user_permissions_db = (
-        db.query(permissions.Permission.permission_name)
-        .join(permissions.role_permissions)
-        .join(Role)
-        .join(UserRole)
-        .filter(UserRole.user_id == user.user_id)
-        .all()
+    refresh_token, family_id = issue_refresh_token(db, user.user_id, user.email)
+    await permission_matrix.ensure_loaded_async(db)
+    access_token = create_access_token(
+        _token_claims(user, family_id, request.client.host if request and request.client else None, user.role_ids)
     )
 
-    # Tạo payload cho token
-    payload = {
-        "sub": user.email,
-        "user_id": user.user_id,
-        "roles": roles_list,
-        "ip": request.client.host,
-        "device": platform.system(),  # ví dụ: "Windows", "Linux", "Darwin"
-        "permissions": [perm[0] for perm in user_permissions_db],
-    }
-    access_token = create_access_token(payload)
-    refresh_token = create_refresh_token({"sub": user.email})
-    
     # Câp nhật lần đăng nhập cuối
-    user.last_login = datetime.now(timezone.utc)
+    # users.last_login là TIMESTAMP không múi giờ: asyncpg không nhận datetime có tzinfo, lưu giờ UTC naive
+    values = {"last_login": datetime.now(timezone.utc).replace(tzinfo=None)}
+    # Hash cũ dùng cost khác BCRYPT_ROUNDS: lưu hash mới đã tính trong lúc kiểm tra mật khẩu
+    if new_hash is not None and settings.PASSWORD_REHASH_ON_LOGIN:
+        values["password_hash"] = new_hash
+    await db.execute(update(Users).where(Users.user_id == user.user_id).values(**values))
+    await db.commit()
 
     return {
         "access_token": access_token,
@@ -226,8 +295,9 @@ def login(db: Session, user_in: UserLogin, request: Request):
     }
 
 
-def verify_refresh_token(token: str, db: Session) -> dict:
-    """Xác minh refresh token và tạo access token mới."""
+def verify_refresh_token(token: str, db: Session, request: Optional[Request] = None) -> dict:
+    """Xác minh refresh token, xoay vòng sang refresh token mới và tạo access token mới
+    với đầy đủ claims như khi đăng nhập."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Mã làm mới không hợp lệ hoặc đã hết hạn",
@@ -237,24 +307,47 @@ def verify_refresh_token(token: str, db: Session) -> dict:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
-        email: str = payload.get("sub")
-        token_type: str = payload.get("type")
+    except JWTError:
+        raise credentials_exception
+    if payload.get("sub") is None or payload.get("type") != "refresh":
+        raise credentials_exception
 
-        if email is None or token_type != "refresh":
-            raise credentials_exception
+    user_id, new_refresh_token, family_id = rotate_refresh_token(db, payload)
+    user = db.query(Users).filter(Users.user_id == user_id).first()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Không tìm thấy người dùng",
+        )
+
+    # Tạo access token mới
+    new_access_token = create_access_token(
+        access_token_claims(db, user, family_id, request.client.host if request and request.client else None)
+    )
+    db.commit()
+    return {
+        "access_token": new_access_token,
+        "refresh_token": new_refresh_token,
+        "token_type": "bearer",
+    }
 
-        user = db.query(Users).filter(Users.email == email).first()
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Không tìm thấy người dùng",
-            )
 
-        # Tạo access token mới
-        new_access_token = create_access_token({"sub": user.email})
-        return {"access_token": new_access_token, "token_type": "bearer"}
+def logout(db: Session, token: str) -> dict:
+    """Thu hồi cả họ token của refresh token (access token cùng họ bị từ chối ngay)."""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
     except JWTError:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Mã làm mới không hợp lệ hoặc đã hết hạn",
+        )
+    if payload.get("type") != "refresh" or not payload.get("fid"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Mã làm mới không hợp lệ",
+        )
+    revoke_family(db, payload["fid"], "logout")
+    return {"message": "Đăng xuất thành công"}
 
 
 def verify_email(db: Session, request: EmailVerificationRequest):
@@ -296,9 +389,11 @@ def verify_email(db: Session, request: EmailVerificationRequest):
 
         db.commit()
         db.refresh(user)
+        principal_cache.invalidate_user(user.user_id)
 
-        access_token = create_access_token({"sub": user.email})
-        refresh_token = create_refresh_token({"sub": user.email})
+        refresh_token, family_id = issue_refresh_token(db, user.user_id, user.email)
+        access_token = create_access_token(access_token_claims(db, user, family_id))
+        db.commit()
 
         return {
             "access_token": access_token,
@@ -344,8 +439,8 @@ def resend_verification_code(db: Session, email: str):
         db.add(verification)
         db.commit()
 
-        # Gửi email xác nhận
-        if not email_service.send_verification_email(email, verification_code):
+        # Đưa email xác nhận vào hàng đợi gửi nền
+        if not email_queue.queue_verification_email(email, verification_code):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Không thể gửi email xác nhận. Vui lòng thử lại.",
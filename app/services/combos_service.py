@@ -2,21 +2,24 @@ from typing import Optional
 from fastapi import HTTPException
 from sqlalchemy.orm import Session, joinedload
 from app.schemas.common import PaginatedResponse
+from app.utils.pagination import paginate
 from app.models.combos import Combo, ComboDish, ComboItem
 from app.schemas.combos import ComboCreate, ComboUpdate, ComboDishCreate, ComboDishUpdate
-from sqlalchemy import desc
 
 # ==================== COMBO CRUD ====================
 # Lấy tất cả combo kèm theo combo_items
-def get_all_combos(db: Session, skip: int = 0, limit: int = 10, search_query: str = None):
-    query = db.query(Combo).options(joinedload(Combo.combo_items).joinedload(ComboItem.dish)).order_by(desc(Combo.combo_id))
+def get_all_combos(
+    db: Session, skip: int = 0, limit: int = 10, search_query: str = None,
+    cursor: Optional[str] = None, count: str = "exact",
+):
+    query = db.query(Combo).options(joinedload(Combo.combo_items).joinedload(ComboItem.dish))
     if search_query:
         query = query.filter(Combo.combo_name.ilike(f"%{search_query}%"))
-    total = query.count()
-    combos = query.offset(skip).limit(limit).all()
-    for combo in combos:
+    # Combo mới nhất trước, keyset theo combo_id
+    page = paginate(query, Combo.combo_id, skip=skip, limit=limit, cursor=cursor, count=count, filters=(search_query,))
+    for combo in page["items"]:
         combo.combo_items  # load lazy
-    return {"items": combos, "total": total}
+    return page
 
 # Lấy combo theo ID, có kiểm tra tồn tại và load combo_items
 def get_combo_by_id(db: Session, combo_id: int):
@@ -11,34 +11,24 @@ from io import BytesIO
 import base64
 from email.utils import formataddr
 from datetime import datetime
+from email.message import Message
+from functools import lru_cache
+from string import Template
 
 # Cài đặt premailer nếu bạn muốn tự động inline CSS từ style tag
 # pip install premailer
 from premailer import transform
 
-class EmailService:
-    def __init__(self, smtp_server: str, smtp_port: int, username: str, password: str, sender_name: str = "CinePlus"):
-        self.smtp_server = smtp_server
-        self.smtp_port = smtp_port
-        self.username = username
-        self.password = password
-        self.sender_name = sender_name
+from app.core.config import settings
 
-    def generate_verification_code(self, length: int = 6) -> str:
-        """Tạo mã xác nhận ngẫu nhiên."""
-        return ''.join(random.choices(string.digits, k=length))
 
-    def send_verification_email(self, to_email: str, verification_code: str) -> bool:
-        """Gửi email xác nhận đến địa chỉ email đã chỉ định."""
-        try:
-            msg = MIMEMultipart('alternative') # Dùng 'alternative' để client chọn phiên bản phù hợp
+@lru_cache(maxsize=None)
+def inline_template(html_template: str) -> Template:
+    """Inline CSS của template một lần (premailer khá chậm), lần sau chỉ thay giá trị vào"""
+    return Template(transform(html_template))
 
-            msg['From'] = formataddr((self.sender_name, self.username))
-            msg['To'] = to_email
-            msg['Subject'] = "Xác nhận đăng ký tài khoản của bạn"
 
-            # Template HTML với các class Tailwind (cần được xử lý thành inline CSS)
-            html_template = f"""\
+VERIFICATION_EMAIL_TEMPLATE = """\
             <html>
             <head>
             </head>
@@ -54,49 +44,25 @@ class EmailService:
                             <p style="margin: 0 0 16px;">Chào bạn,</p>
                             <p style="margin: 0 0 16px;">Cảm ơn bạn đã đăng ký tài khoản. Mã xác nhận của bạn là:</p>
                             <div style="width: fit-content; margin: 20px auto; padding: 16px; background-color: #e5e7eb; border-radius: 6px; font-size: 24px; font-weight: bold; text-align: center; border: 1px solid #9ca3af;">
-                                {verification_code}
+                                ${verification_code}
                             </div>
                             <p style="margin: 0 0 16px; font-size: 14px; color: #4b5563;">Mã này sẽ hết hạn sau <strong>15 phút</strong>.</p>
                             <p style="margin: 0 0 16px; font-size: 14px; color: #4b5563;">Nếu bạn không yêu cầu mã này, vui lòng bỏ qua email này.</p>
-                            <p style="margin: 32px 0 0;">Trân trọng,<br>{self.sender_name}</p>
+                            <p style="margin: 32px 0 0;">Trân trọng,<br>${sender_name}</p>
                         </td>
                     </tr>
                     <tr>
                         <td style="text-align: center; font-size: 12px; color: #6b7280; padding: 16px; border-top: 1px solid #e5e7eb;">
                             <p style="margin: 0 0 8px;">Đây là email tự động, vui lòng không trả lời.</p>
-                            <p style="margin: 0;">&copy; {datetime.now().year} {self.sender_name}. All rights reserved.</p>
+                            <p style="margin: 0;">&copy; ${year} ${sender_name}. All rights reserved.</p>
                         </td>
                     </tr>
                 </table>
             </body>
             </html>
             """
-            html_body_inlined = transform(html_template)
-
-            msg.attach(MIMEText(html_body_inlined, 'html', 'utf-8'))
-
-            context = ssl.create_default_context()
-
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.username, self.password)
-                server.sendmail(self.username, to_email, msg.as_string())
-
-            return True
-
-        except Exception as e:
-            print(f"Lỗi khi gửi email xác nhận: {str(e)}")
-            return False
-
-    def send_booking_confirmation_email(self, to_email: str, booking_details: dict) -> bool:
-        """Gửi email xác nhận đặt chỗ với chi tiết đặt chỗ."""
-        try:
-            msg = MIMEMultipart('alternative')
-            msg['From'] = formataddr((self.sender_name, self.username))
-            msg['To'] = to_email
-            msg['Subject'] = "Xác nhận đặt vé thành công"
 
-            html_template_with_tailwind_booking = f"""\
+BOOKING_CONFIRMATION_EMAIL_TEMPLATE = """\
             <html>
             <head>
             </head>
@@ -110,13 +76,13 @@ class EmailService:
             <p class="mb-6">Cảm ơn bạn đã tin tưởng và đặt vé xem phim tại hệ thống của chúng tôi. Dưới đây là thông tin chi tiết về vé của bạn:</p>
             <div class="bg-gray-100 rounded-md p-6 mb-6 border border-gray-200">
             <ul class="list-none p-0">
-            <li class="mb-3"><strong class="text-red-600">Mã đặt vé:</strong> <span class="font-semibold">{booking_details.get('booking_id', 'N/A')}</span></li>
-            <li class="mb-3"><strong class="text-red-600">Họ và tên:</strong> <span class="font-semibold">{booking_details.get('customer_name', 'N/A')}</span></li>
-            <li class="mb-3"><strong class="text-red-600">Ngày chiếu:</strong> <span class="font-semibold">{booking_details.get('departure_date', 'N/A')}</span></li>
-            <li class="mb-3"><strong class="text-red-600">Phim:</strong> <span class="font-semibold">{booking_details.get('origin', 'N/A')}</span></li>
-            <li class="mb-3"><strong class="text-red-600">Rạp:</strong> <span class="font-semibold">{booking_details.get('destination', 'N/A')}</span></li>
-            <li class="mb-3"><strong class="text-red-600">Giờ chiếu:</strong> <span class="font-semibold">{booking_details.get('time', 'N/A')}</span></li>
-            <li class="mb-3"><strong class="text-red-600">Số lượng vé:</strong> <span class="font-semibold">{booking_details.get('ticket_count', 'N/A')}</span></li>
+            <li class="mb-3"><strong class="text-red-600">Mã đặt vé:</strong> <span class="font-semibold">${booking_id}</span></li>
+            <li class="mb-3"><strong class="text-red-600">Họ và tên:</strong> <span class="font-semibold">${customer_name}</span></li>
+            <li class="mb-3"><strong class="text-red-600">Ngày chiếu:</strong> <span class="font-semibold">${departure_date}</span></li>
+            <li class="mb-3"><strong class="text-red-600">Phim:</strong> <span class="font-semibold">${origin}</span></li>
+            <li class="mb-3"><strong class="text-red-600">Rạp:</strong> <span class="font-semibold">${destination}</span></li>
+            <li class="mb-3"><strong class="text-red-600">Giờ chiếu:</strong> <span class="font-semibold">${time}</span></li>
+            <li class="mb-3"><strong class="text-red-600">Số lượng vé:</strong> <span class="font-semibold">${ticket_count}</span></li>
             </ul>
             </div>
             <div class="text-center my-8">
@@ -127,20 +93,100 @@ class EmailService:
             <p class="mt-4 text-sm text-gray-600">Hoặc cung cấp mã đặt vé trên cho nhân viên.</p>
             </div>
             <p class="text-sm text-gray-600 mb-6">Xin vui lòng kiểm tra kỹ thông tin đặt vé. Nếu có bất kỳ sai sót hoặc thắc mắc, đừng ngần ngại liên hệ với chúng tôi.</p>
-            <p class="mt-8">Trân trọng,<br><strong class="text-red-600">{self.sender_name}</strong></p>
+            <p class="mt-8">Trân trọng,<br><strong class="text-red-600">${sender_name}</strong></p>
             </div>
             <div class="bg-gray-100 text-center text-xs text-gray-500 py-4 px-6 border-t border-gray-200 rounded-b-lg">
             <p class="mb-2">Đây là email tự động, vui lòng không phản hồi trực tiếp.</p>
-            <p>&copy; {datetime.now().year} <strong class="text-red-600">{self.sender_name}</strong>. Mọi quyền được bảo lưu.</p>
+            <p>&copy; ${year} <strong class="text-red-600">${sender_name}</strong>. Mọi quyền được bảo lưu.</p>
             </div>
             </div>
             </body>
             </html>
             """
 
-            html_body_inlined = transform(html_template_with_tailwind_booking)
 
-            plain_text_body = f"""\
+class EmailService:
+    def __init__(self, smtp_server: str, smtp_port: int, username: str, password: str, sender_name: str = "CinePlus",
+                 use_tls: bool = True):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.username = username
+        self.password = password
+        self.sender_name = sender_name
+        self.use_tls = use_tls
+
+    def open_connection(self) -> smtplib.SMTP:
+        """Mở kết nối SMTP đã STARTTLS và đăng nhập, có thể dùng lại cho nhiều email."""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            if self.use_tls:
+                server.starttls(context=ssl.create_default_context())
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def deliver(self, msg: Message, to_email: str, server: smtplib.SMTP = None):
+        """Gửi email đã dựng sẵn, qua kết nối có sẵn hoặc một kết nối mới."""
+        if server is not None:
+            server.sendmail(self.username, to_email, msg.as_string())
+            return
+        with self.open_connection() as new_server:
+            new_server.sendmail(self.username, to_email, msg.as_string())
+
+    def generate_verification_code(self, length: int = 6) -> str:
+        """Tạo mã xác nhận ngẫu nhiên."""
+        return ''.join(random.choices(string.digits, k=length))
+
+    def build_verification_email(self, to_email: str, verification_code: str) -> Message:
+        """Dựng email xác nhận (template đã inline CSS được dùng lại)."""
+        msg = MIMEMultipart('alternative') # Dùng 'alternative' để client chọn phiên bản phù hợp
+
+        msg['From'] = formataddr((self.sender_name, self.username))
+        msg['To'] = to_email
+        msg['Subject'] = "Xác nhận đăng ký tài khoản của bạn"
+
+        html_body_inlined = inline_template(VERIFICATION_EMAIL_TEMPLATE).safe_substitute(
+            verification_code=verification_code,
+            sender_name=self.sender_name,
+            year=datetime.now().year,
+        )
+
+        msg.attach(MIMEText(html_body_inlined, 'html', 'utf-8'))
+        return msg
+
+    def send_verification_email(self, to_email: str, verification_code: str) -> bool:
+        """Gửi email xác nhận đến địa chỉ email đã chỉ định."""
+        try:
+            self.deliver(self.build_verification_email(to_email, verification_code), to_email)
+            return True
+
+        except Exception as e:
+            print(f"Lỗi khi gửi email xác nhận: {str(e)}")
+            return False
+
+    def build_booking_confirmation_email(self, to_email: str, booking_details: dict) -> Message:
+        """Dựng email xác nhận đặt chỗ với chi tiết đặt chỗ."""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = formataddr((self.sender_name, self.username))
+        msg['To'] = to_email
+        msg['Subject'] = "Xác nhận đặt vé thành công"
+
+        html_body_inlined = inline_template(BOOKING_CONFIRMATION_EMAIL_TEMPLATE).safe_substitute(
+            booking_id=booking_details.get('booking_id', 'N/A'),
+            customer_name=booking_details.get('customer_name', 'N/A'),
+            departure_date=booking_details.get('departure_date', 'N/A'),
+            origin=booking_details.get('origin', 'N/A'),
+            destination=booking_details.get('destination', 'N/A'),
+            time=booking_details.get('time', 'N/A'),
+            ticket_count=booking_details.get('ticket_count', 'N/A'),
+            sender_name=self.sender_name,
+            year=datetime.now().year,
+        )
+
+        plain_text_body = f"""\
 Xác nhận Đặt Vé Thành Công
 --------------------------
 Chào bạn,
@@ -165,16 +211,14 @@ Trân trọng,
 © {datetime.now().year} {self.sender_name}. All rights reserved.
             """
 
-            msg.attach(MIMEText(plain_text_body, 'plain', 'utf-8'))
-            msg.attach(MIMEText(html_body_inlined, 'html', 'utf-8'))
-
-            context = ssl.create_default_context()
-
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.username, self.password)
-                server.sendmail(self.username, to_email, msg.as_string())
+        msg.attach(MIMEText(plain_text_body, 'plain', 'utf-8'))
+        msg.attach(MIMEText(html_body_inlined, 'html', 'utf-8'))
+        return msg
 
+    def send_booking_confirmation_email(self, to_email: str, booking_details: dict) -> bool:
+        """Gửi email xác nhận đặt chỗ với chi tiết đặt chỗ."""
+        try:
+            self.deliver(self.build_booking_confirmation_email(to_email, booking_details), to_email)
             return True
 
         except Exception as e:
@@ -223,15 +267,11 @@ Ghế: {seats_display}
         img.save(buf, format="PNG")
         return buf.getvalue()
 
-    def send_ticket_email(self, to_email: str, ticket_info: dict) -> bool:
+    def build_ticket_email(self, to_email: str, ticket_info: dict) -> Message:
         """
-        Gửi email kèm 1 mã QR duy nhất cho toàn bộ vé (danh sách ghế).
+        Dựng email kèm 1 mã QR duy nhất cho toàn bộ vé (danh sách ghế).
         QR này sẽ chứa toàn bộ thông tin khách hàng và danh sách ghế.
         """
-        if not to_email:
-            print("send_ticket_email: missing to_email, skip sending")
-            return False
-
         # Normalize seats into a list of seat codes (strings).
         # Accepts: ticket_info['seats'] as list[str] or list[dict], or single 'seat' string.
         seats_codes = []
@@ -249,69 +289,82 @@ Ghế: {seats_display}
         elif ticket_info.get('seat'):
             seats_codes = [str(ticket_info.get('seat'))]
 
-        try:
-            msg_root = MIMEMultipart('related')
-            msg_root['From'] = formataddr((self.sender_name, self.username))
-            msg_root['To'] = to_email
-            msg_root['Subject'] = f"Thông tin vé - {ticket_info.get('booking_id', '')}"
-
-            msg_alternative = MIMEMultipart('alternative')
-            msg_root.attach(msg_alternative)
-
-            # Plain summary text
-            seats_display = ', '.join(seats_codes) if seats_codes else ''
-            plain_lines = [
-                f"Mã đặt vé: {ticket_info.get('booking_id', '')}",
-                f"Khách hàng: {ticket_info.get('customer_name', '')}",
-                f"Phim: {ticket_info.get('movie_name', '')}",
-                f"Suất chiếu: {ticket_info.get('showtime', '')}",
-                f"Ghế: {seats_display}"
-            ]
-            plain_text = "\n".join(plain_lines)
-            msg_alternative.attach(MIMEText(plain_text, 'plain', 'utf-8'))
-
-            # Tạo 1 mã QR duy nhất cho toàn bộ vé (seats as list of strings)
-            qr_ticket_info = dict(ticket_info)
-            if seats_codes:
-                qr_ticket_info['seats'] = seats_codes
-            img_bytes = self.generate_ticket_qr_bytes(qr_ticket_info)
-
-            # HTML email
-            html_template = f"""
-            <html>
-            <body style="font-family: Arial, sans-serif;">
-                <h2>Thông tin vé xem phim</h2>
-                <p><strong>Mã đặt vé:</strong> {ticket_info.get('booking_id', '')}</p>
-                <p><strong>Khách hàng:</strong> {ticket_info.get('customer_name', '')}</p>
-                <p><strong>Phim:</strong> {ticket_info.get('movie_name', '')}</p>
-                <p><strong>Suất chiếu:</strong> {ticket_info.get('showtime', '')}</p>
-                <p><strong>Ghế:</strong> {seats_display}</p>
-                <div style="margin:18px 0; text-align:center;">
-                    <img src="cid:ticket_qr" alt="QR toàn bộ vé" style="width:180px; height:180px;"/>
-                </div>
-            </body>
-            </html>
-            """
-            msg_alternative.attach(MIMEText(html_template, 'html', 'utf-8'))
+        msg_root = MIMEMultipart('related')
+        msg_root['From'] = formataddr((self.sender_name, self.username))
+        msg_root['To'] = to_email
+        msg_root['Subject'] = f"Thông tin vé - {ticket_info.get('booking_id', '')}"
+
+        msg_alternative = MIMEMultipart('alternative')
+        msg_root.attach(msg_alternative)
+
+        # Plain summary text
+        seats_display = ', '.join(seats_codes) if seats_codes else ''
+        plain_lines = [
+            f"Mã đặt vé: {ticket_info.get('booking_id', '')}",
+            f"Khách hàng: {ticket_info.get('customer_name', '')}",
+            f"Phim: {ticket_info.get('movie_name', '')}",
+            f"Suất chiếu: {ticket_info.get('showtime', '')}",
+            f"Ghế: {seats_display}"
+        ]
+        plain_text = "\n".join(plain_lines)
+        msg_alternative.attach(MIMEText(plain_text, 'plain', 'utf-8'))
+
+        # Tạo 1 mã QR duy nhất cho toàn bộ vé (seats as list of strings)
+        qr_ticket_info = dict(ticket_info)
+        if seats_codes:
+            qr_ticket_info['seats'] = seats_codes
+        img_bytes = self.generate_ticket_qr_bytes(qr_ticket_info)
+
+        # HTML email
+        html_template = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif;">
+            <h2>Thông tin vé xem phim</h2>
+            <p><strong>Mã đặt vé:</strong> {ticket_info.get('booking_id', '')}</p>
+            <p><strong>Khách hàng:</strong> {ticket_info.get('customer_name', '')}</p>
+            <p><strong>Phim:</strong> {ticket_info.get('movie_name', '')}</p>
+            <p><strong>Suất chiếu:</strong> {ticket_info.get('showtime', '')}</p>
+            <p><strong>Ghế:</strong> {seats_display}</p>
+            <div style="margin:18px 0; text-align:center;">
+                <img src="cid:ticket_qr" alt="QR toàn bộ vé" style="width:180px; height:180px;"/>
+            </div>
+        </body>
+        </html>
+        """
+        msg_alternative.attach(MIMEText(html_template, 'html', 'utf-8'))
 
-            # Đính kèm QR code (inline và attachment)
-            mime_img = MIMEImage(img_bytes, _subtype='png')
-            mime_img.add_header('Content-ID', '<ticket_qr>')
-            mime_img.add_header('Content-Disposition', 'inline', filename='ticket_qr.png')
-            msg_root.attach(mime_img)
+        # Đính kèm QR code (inline và attachment)
+        mime_img = MIMEImage(img_bytes, _subtype='png')
+        mime_img.add_header('Content-ID', '<ticket_qr>')
+        mime_img.add_header('Content-Disposition', 'inline', filename='ticket_qr.png')
+        msg_root.attach(mime_img)
 
-            attachment = MIMEImage(img_bytes, _subtype='png')
-            attachment.add_header('Content-Disposition', 'attachment', filename='ticket_qr.png')
-            msg_root.attach(attachment)
+        attachment = MIMEImage(img_bytes, _subtype='png')
+        attachment.add_header('Content-Disposition', 'attachment', filename='ticket_qr.png')
+        msg_root.attach(attachment)
+        return msg_root
 
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.username, self.password)
-                server.sendmail(self.username, to_email, msg_root.as_string())
+    def send_ticket_email(self, to_email: str, ticket_info: dict) -> bool:
+        """Gửi email vé kèm mã QR."""
+        if not to_email:
+            print("send_ticket_email: missing to_email, skip sending")
+            return False
 
+        try:
+            self.deliver(self.build_ticket_email(to_email, ticket_info), to_email)
             return True
 
         except Exception as e:
             print(f"Lỗi khi gửi email vé: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+
+# Instance dùng chung, cấu hình từ settings
+email_service = EmailService(
+    smtp_server=settings.EMAIL_HOST,
+    smtp_port=settings.EMAIL_PORT,
+    username=settings.EMAIL_USERNAME,
+    password=settings.EMAIL_PASSWORD,
+    sender_name=settings.EMAIL_SENDER_NAME,
+    use_tls=settings.EMAIL_USE_TLS,
+)
@@ -1,9 +1,9 @@
 from typing import Optional
 from fastapi import HTTPException
-from sqlalchemy import desc
 from sqlalchemy.orm import Session
 from app.models.movies import Movies
 from app.schemas.common import PaginatedResponse
+from app.utils.pagination import paginate
 from app.schemas.movies import MovieCreate, MovieUpdate, MovieResponse
 
 
@@ -15,9 +15,11 @@ def get_all_movies(
     limit: int = 10,                 
     search_query: Optional[str] = None,
     status: Optional[str] = None,   
+    cursor: Optional[str] = None,
+    count: str = "exact",
 ): 
-    # Khởi tạo truy vấn cơ.
-    query = db.query(Movies).order_by(desc(Movies.movie_id))
+    # Khởi tạo truy vấn cơ (thứ tự mới nhất trước do paginate áp dụng).
+    query = db.query(Movies)
 
     # Nếu có từ khóa tìm kiếm 
     if search_query:
@@ -31,15 +33,15 @@ def get_all_movies(
         # Áp dụng bộ lọc để chỉ lấy các phim có trạng thái khớp
         query = query.filter(Movies.status == status)
 
-    # Đếm tổng số lượng bản ghi
-    total = query.count()
-
-    # Áp dụng phân trang (offset và limit) vào truy vấn đã lọc.
-    movies = query.offset(skip).limit(limit).all()
-    movies_response = [MovieResponse.from_orm(m) for m in movies]
+    # Phân trang keyset theo movie_id (có cursor) hoặc offset, đếm tổng theo chế độ count.
+    page = paginate(
+        query, Movies.movie_id, skip=skip, limit=limit, cursor=cursor, count=count,
+        filters=(search_query, status if status != "all" else None),
+    )
+    page["items"] = [MovieResponse.from_orm(m) for m in page["items"]]
 
     # Trả về đối tượng
-    return PaginatedResponse(total=total, skip=skip, limit=limit, items=movies_response)
+    return PaginatedResponse(**page)
 
 # Lấy phim theo id
 def get_movie_by_id(db: Session, movie_id: int):
@@ -0,0 +1,151 @@
+"""
+Pricing Service - Tính giá vé cho cả giỏ ghế (seat_id, showtime_id) trong một truy vấn
+Giữ bộ nhớ đệm hệ số giá theo loại ghế, giá cơ bản của suất chiếu và loại của từng ghế.
+Chỉ những ghế/suất chiếu chưa có trong cache (hoặc đã quá PRICING_CACHE_TTL) mới được
+nạp lại, cả nhóm bằng một câu SELECT. Dùng chung cho thanh toán và bán vé tại quầy.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import threading
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, Numeric, String, cast, null, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.seat_templates import SeatTypeEnum
+from app.models.seats import Seats
+from app.models.showtimes import Showtimes, StatusShowtimeEnum
+
+# Số ghế / suất chiếu tối đa giữ trong cache (LRU)
+MAX_CACHED_SEATS = 20000
+MAX_CACHED_SHOWTIMES = 2000
+
+CartItem = Tuple[int, int]  # (seat_id, showtime_id)
+
+
+class TicketPricing:
+    """Bảng giá có cache: hệ số theo loại ghế x giá cơ bản của suất chiếu"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._multipliers: Dict[SeatTypeEnum, float] = {}
+        # seat_id -> seat_type (loại ghế không đổi sau khi tạo phòng, sửa seat_templates chỉ áp dụng cho phòng mới)
+        self._seat_types: "OrderedDict[int, SeatTypeEnum]" = OrderedDict()
+        # showtime_id -> (giá cơ bản, trạng thái, thời điểm nạp)
+        self._showtimes: "OrderedDict[int, Tuple[float, StatusShowtimeEnum, float]]" = OrderedDict()
+        self.reload_multipliers()
+
+    # ---- Hệ số theo loại ghế ----
+    def reload_multipliers(self):
+        """Nạp lại hệ số giá theo loại ghế từ settings"""
+        with self._lock:
+            self._multipliers = {
+                SeatTypeEnum.regular: 1.0,
+                SeatTypeEnum.vip: settings.SEAT_PRICE_MULTIPLIER_VIP,
+                SeatTypeEnum.couple: settings.SEAT_PRICE_MULTIPLIER_COUPLE,
+            }
+
+    def set_multiplier(self, seat_type: SeatTypeEnum, multiplier: float):
+        with self._lock:
+            self._multipliers[seat_type] = multiplier
+
+    @property
+    def multipliers(self) -> Dict[str, float]:
+        return {seat_type.value: value for seat_type, value in self._multipliers.items()}
+
+    # ---- Invalidate cache ----
+    def invalidate_showtime(self, showtime_id: int):
+        """Gọi khi giá/trạng thái suất chiếu thay đổi hoặc suất chiếu bị xóa"""
+        with self._lock:
+            self._showtimes.pop(showtime_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._seat_types.clear()
+            self._showtimes.clear()
+
+    # ---- Tính giá ----
+    def _missing(self, items: List[CartItem]) -> Tuple[List[int], List[int]]:
+        """Các ghế/suất chiếu chưa có trong cache hoặc đã hết hạn"""
+        now = time.monotonic()
+        with self._lock:
+            seat_ids = {seat_id for seat_id, _ in items if seat_id not in self._seat_types}
+            showtime_ids = {
+                showtime_id for _, showtime_id in items
+                if showtime_id not in self._showtimes or now - self._showtimes[showtime_id][2] > self.ttl
+            }
+        return sorted(seat_ids), sorted(showtime_ids)
+
+    @staticmethod
+    def _load_statement(seat_ids: List[int], showtime_ids: List[int]):
+        """Một câu SELECT cho phần còn thiếu của giỏ: loại ghế UNION ALL giá/trạng thái suất chiếu"""
+        parts = []
+        if seat_ids:
+            parts.append(
+                select(
+                    Seats.seat_id, cast(Seats.seat_type, String),
+                    cast(null(), Integer), cast(null(), Numeric), cast(null(), String),
+                ).where(Seats.seat_id.in_(seat_ids))
+            )
+        if showtime_ids:
+            parts.append(
+                select(
+                    cast(null(), Integer), cast(null(), String),
+                    Showtimes.showtime_id, Showtimes.ticket_price, cast(Showtimes.status, String),
+                ).where(Showtimes.showtime_id.in_(showtime_ids))
+            )
+        return parts[0] if len(parts) == 1 else union_all(*parts)
+
+    def _store(self, rows):
+        now = time.monotonic()
+        with self._lock:
+            for seat_id, seat_type, showtime_id, ticket_price, showtime_status in rows:
+                if seat_id is not None:
+                    self._seat_types[seat_id] = SeatTypeEnum(seat_type)
+                    self._seat_types.move_to_end(seat_id)
+                if showtime_id is not None:
+                    self._showtimes[showtime_id] = (float(ticket_price), StatusShowtimeEnum(showtime_status), now)
+                    self._showtimes.move_to_end(showtime_id)
+            while len(self._seat_types) > MAX_CACHED_SEATS:
+                self._seat_types.popitem(last=False)
+            while len(self._showtimes) > MAX_CACHED_SHOWTIMES:
+                self._showtimes.popitem(last=False)
+
+    def _compute(self, items: List[CartItem], require_active: bool) -> List[int]:
+        prices = []
+        with self._lock:
+            for seat_id, showtime_id in items:
+                seat_type = self._seat_types.get(seat_id)
+                if seat_type is None:
+                    raise HTTPException(status_code=404, detail=f"Seat {seat_id} not found")
+                showtime = self._showtimes.get(showtime_id)
+                if showtime is None:
+                    raise HTTPException(status_code=404, detail=f"Showtime {showtime_id} not found")
+                base_price, showtime_status, _ = showtime
+                if require_active and showtime_status != StatusShowtimeEnum.active:
+                    raise HTTPException(status_code=400, detail=f"Showtime {showtime_id} is not active")
+                prices.append(int(base_price * self._multipliers.get(seat_type, 1.0)))
+        return prices
+
+    async def price_cart(self, db: AsyncSession, items: List[CartItem], require_active: bool = False) -> List[int]:
+        """Giá từng vé (VND, làm tròn xuống) theo đúng thứ tự của items"""
+        seat_ids, showtime_ids = self._missing(items)
+        if seat_ids or showtime_ids:
+            self._store((await db.execute(self._load_statement(seat_ids, showtime_ids))).all())
+        return self._compute(items, require_active)
+
+    def price_cart_sync(self, db: Session, items: List[CartItem], require_active: bool = False) -> List[int]:
+        """Như price_cart cho các service dùng Session đồng bộ"""
+        seat_ids, showtime_ids = self._missing(items)
+        if seat_ids or showtime_ids:
+            self._store(db.execute(self._load_statement(seat_ids, showtime_ids)).all())
+        return self._compute(items, require_active)
+
+
+# Instance toàn cục để sử dụng trong toàn bộ ứng dụng
+ticket_pricing = TicketPricing(ttl=settings.PRICING_CACHE_TTL)
@@ -4,15 +4,23 @@ from sqlalchemy.orm import Session
 from app.models.ranks import Ranks
 from app.schemas.ranks import RankCreate, RankUpdate, RankResponse
 from sqlalchemy import desc
+from app.utils.pagination import paginate
 
 # Lấy tất cả ranks với phân trang và tìm kiếm
-def get_all_ranks(db: Session, skip: int = 0, limit: int = 10, search_query: str = None):
+def get_all_ranks(
+    db: Session, skip: int = 0, limit: int = 10, search_query: str = None,
+    cursor: Optional[str] = None, count: str = "exact",
+):
     query = db.query(Ranks)
     if search_query:
         query = query.filter(Ranks.rank_name.ilike(f"%{search_query}%"))
-    total = query.count()
-    ranks = query.offset(skip).limit(limit).all()
-    return {"items": [RankResponse.from_orm(rank) for rank in ranks], "total": total}
+    # Sắp xếp theo mức chi tiêu yêu cầu tăng dần, keyset theo (spending_target, rank_id)
+    page = paginate(
+        query, Ranks.rank_id, Ranks.spending_target, descending=False,
+        skip=skip, limit=limit, cursor=cursor, count=count, filters=(search_query,),
+    )
+    page["items"] = [RankResponse.from_orm(rank) for rank in page["items"]]
+    return page
 
 # Lấy rank theo ID, có kiểm tra tồn tại 
 def get_rank_by_id(db: Session, rank_id: int):
@@ -0,0 +1,89 @@
+"""
+Refresh Tokens Service - Sổ đăng ký refresh token: cấp, xoay vòng và thu hồi theo họ token
+Mỗi lần đăng nhập mở một họ token (family_id). Mỗi lần làm mới, refresh token hiện tại bị đánh
+dấu đã dùng và một token mới cùng họ được cấp. Token đã dùng mà bị đưa lại lần nữa nghĩa là đã
+bị lộ: cả họ bị thu hồi, kể cả access token đang lưu hành của họ đó (claim `fid`).
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+import logging
+import uuid
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.token_revocation import revoked_token_families
+from app.core.token_utils import create_token
+from app.models.refresh_tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+
+def _invalid_refresh_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Mã làm mới không hợp lệ hoặc đã hết hạn",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def issue_refresh_token(
+    db: Session, user_id: int, email: str, family_id: Optional[str] = None, parent_jti: Optional[str] = None
+) -> Tuple[str, str]:
+    """Tạo refresh token và ghi vào sổ đăng ký (chưa commit). Trả về (token, family_id)."""
+    jti = uuid.uuid4().hex
+    family_id = family_id or uuid.uuid4().hex
+    expires_delta = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    token = create_token(
+        {"sub": email, "user_id": user_id, "fid": family_id, "jti": jti}, expires_delta, "refresh"
+    )
+    db.add(RefreshToken(
+        jti=jti,
+        family_id=family_id,
+        parent_jti=parent_jti,
+        user_id=user_id,
+        expires_at=datetime.now(timezone.utc) + expires_delta,
+    ))
+    return token, family_id
+
+
+def revoke_family(db: Session, family_id: str, reason: str):
+    """Thu hồi mọi refresh token của một họ, commit và thêm vào tập thu hồi trong bộ nhớ"""
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=func.now(), revoked_reason=reason)
+    )
+    db.commit()
+    expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    revoked_token_families.revoke(family_id, expires_at.timestamp())
+
+
+def rotate_refresh_token(db: Session, payload: dict) -> Tuple[int, str, str]:
+    """Đổi refresh token (payload đã giải mã) lấy token mới cùng họ (chưa commit).
+    Trả về (user_id, refresh token mới, family_id). Token đã dùng bị đưa lại: thu hồi cả họ."""
+    jti, family_id = payload.get("jti"), payload.get("fid")
+    # Token cấp trước khi có sổ đăng ký không có fid/jti: yêu cầu đăng nhập lại
+    if not jti or not family_id or revoked_token_families.is_revoked(family_id):
+        raise _invalid_refresh_token()
+
+    row = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.jti == jti)
+        .with_for_update()
+        .first()
+    )
+    if row is None or row.family_id != family_id or row.revoked_at is not None:
+        raise _invalid_refresh_token()
+
+    if row.used_at is not None:
+        logger.warning(f"🚨 Refresh token reuse detected for user {row.user_id}, revoking family {family_id}")
+        revoke_family(db, family_id, "reuse")
+        raise _invalid_refresh_token()
+
+    row.used_at = func.now()
+    token, _ = issue_refresh_token(db, row.user_id, payload["sub"], family_id, parent_jti=jti)
+    return row.user_id, token, family_id
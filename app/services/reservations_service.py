@@ -1,52 +1,59 @@
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from typing import List
-import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, and_, tuple_, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import List, Optional
 
+from app.core.config import settings
 from app.models.seat_reservations import SeatReservations
 from app.models.seats import Seats
 from app.models.showtimes import Showtimes
 from app.schemas.reservations import SeatReservationsCreate, SeatReservationsResponse
 
+# Thời gian giữ ghế tạm thời trước khi hết hạn (phút)
+RESERVATION_HOLD_MINUTES = 10
 
 #Lấy danh sách các ghế đã đặt
-def get_reserved_seats(showtime_id: int, db: Session):
+async def get_reserved_seats(showtime_id: int, db: AsyncSession):
     try:
-        showtime = db.query(Showtimes).filter(Showtimes.showtime_id == showtime_id).first()
+        showtime = await db.get(Showtimes, showtime_id)
         if not showtime:
             raise HTTPException(status_code=404, detail="Showtime not found")
         # Lấy danh sách các ghế đã đặt cho showtime cụ thể
-        reserved_seats = db.query(SeatReservations).filter(
-            SeatReservations.showtime_id == showtime_id,
-            SeatReservations.status.in_(["confirmed", "pending"])
-        ).all()
+        reserved_seats = (await db.scalars(
+            select(SeatReservations).where(
+                SeatReservations.showtime_id == showtime_id,
+                SeatReservations.status.in_(["confirmed", "pending"])
+            )
+        )).all()
         
         return [SeatReservationsResponse.from_orm(reservation) for reservation in reserved_seats]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 # Tạo một hàm để tạo đặt chỗ
-def create_reserved_seats(reservation_in : SeatReservationsCreate , db : Session):
+async def create_reserved_seats(reservation_in : SeatReservationsCreate , db : AsyncSession):
     try:
-        showtime = db.query(Showtimes).filter(Showtimes.showtime_id == reservation_in.showtime_id).first()
-        seat = db.query(Seats).filter(Seats.seat_id == reservation_in.seat_id).first()
+        showtime = await db.get(Showtimes, reservation_in.showtime_id)
+        seat = await db.get(Seats, reservation_in.seat_id)
         if not showtime:
             raise HTTPException(status_code=404 , detail="Showtime not found")
         if not seat:
             raise HTTPException(status_code=404 , detail="Seat not found")
-        existing_reservation = db.query(SeatReservations).filter(
-            SeatReservations.showtime_id == reservation_in.showtime_id,
-            SeatReservations.seat_id == reservation_in.seat_id,
-            or_(
-                SeatReservations.status == 'confirmed',
-                and_(
-                    SeatReservations.status == 'pending',
-                    SeatReservations.expires_at > datetime.now(timezone.utc)
+        existing_reservation = (await db.scalars(
+            select(SeatReservations).where(
+                SeatReservations.showtime_id == reservation_in.showtime_id,
+                SeatReservations.seat_id == reservation_in.seat_id,
+                or_(
+                    SeatReservations.status == 'confirmed',
+                    and_(
+                        SeatReservations.status == 'pending',
+                        SeatReservations.expires_at > datetime.now(timezone.utc)
+                    )
                 )
             )
-        ).first()
+        )).first()
         if existing_reservation:
             if existing_reservation.status == 'confirmed':
                 raise HTTPException(
@@ -60,7 +67,7 @@ def create_reserved_seats(reservation_in : SeatReservationsCreate , db : Session
                 )
             
         current_utc_time = datetime.now(timezone.utc)
-        calculated_expires_at = current_utc_time + timedelta(minutes=10)
+        calculated_expires_at = current_utc_time + timedelta(minutes=RESERVATION_HOLD_MINUTES)
 
         db_reservation = SeatReservations(
             seat_id=reservation_in.seat_id,
@@ -72,19 +79,18 @@ def create_reserved_seats(reservation_in : SeatReservationsCreate , db : Session
         )
 
         db.add(db_reservation)
-        db.commit()
-        db.refresh(db_reservation) 
+        await db.commit()
+        await db.refresh(db_reservation) 
+        _schedule_expiry(calculated_expires_at)
 
-        # Gửi thông báo WebSocket realtime (không chặn luong chính)
+        # Gửi thông báo WebSocket realtime (chỉ đưa vào hàng đợi của các kết nối, không chặn)
         try:
             from app.core.websocket_manager import websocket_manager
-            # Tạo task bất đồng bộ để thông báo ghế đã được đặt
-            asyncio.create_task(
-                websocket_manager.send_seat_reserved(
-                    showtime_id=reservation_in.showtime_id,  # Suất chiếu
-                    seat_ids=[reservation_in.seat_id],       # Danh sách ghế được đặt
-                    user_session=reservation_in.session_id or ""  # Session người đặt
-                )
+            await websocket_manager.send_seat_reserved(
+                showtime_id=reservation_in.showtime_id,  # Suất chiếu
+                seat_ids=[reservation_in.seat_id],       # Danh sách ghế được đặt
+                user_session=reservation_in.session_id or "",  # Session người đặt
+                expires_at=calculated_expires_at         # Thời điểm hết hạn giữ ghế
             )
         except Exception as ws_error:
             # Không làm thất bại việc đặt ghế nếu WebSocket gặp lỗi
@@ -95,106 +101,177 @@ def create_reserved_seats(reservation_in : SeatReservationsCreate , db : Session
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,detail= e)
 
 
+# Giữ nhiều ghế trong một lượt (batch hold engine)
+async def hold_seats_batch(reservations_in: List[SeatReservationsCreate], db: AsyncSession) -> List[SeatReservations]:
+    """
+    Giữ chỗ cho cả nhóm ghế với số round trip cố định, không phụ thuộc số ghế:
+    1. Kiểm tra suất chiếu (một truy vấn IN)
+    2. Kiểm tra ghế tồn tại (một truy vấn IN)
+    3. Kiểm tra xung đột (một truy vấn trên cặp (seat_id, showtime_id))
+    4. INSERT nhiều dòng ... ON CONFLICT DO NOTHING RETURNING
+    Tất cả hoặc không: nếu có ghế bị xung đột thì rollback và báo đúng các ghế đó.
+    Hàm không commit, caller chịu trách nhiệm commit/rollback.
+    """
+    if not reservations_in:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No seats to reserve")
+
+    # Loại bỏ ghế trùng lặp trong cùng request (giữ lần xuất hiện đầu tiên)
+    unique_reservations = {}
+    for reservation_in in reservations_in:
+        unique_reservations.setdefault((reservation_in.seat_id, reservation_in.showtime_id), reservation_in)
+    pairs = list(unique_reservations.keys())
+    seat_ids = {seat_id for seat_id, _ in pairs}
+    showtime_ids = {showtime_id for _, showtime_id in pairs}
+
+    found_showtimes = set((await db.scalars(
+        select(Showtimes.showtime_id).where(Showtimes.showtime_id.in_(showtime_ids))
+    )).all())
+    if found_showtimes != showtime_ids:
+        raise HTTPException(status_code=404, detail="Showtime not found")
+
+    found_seats = set((await db.scalars(
+        select(Seats.seat_id).where(Seats.seat_id.in_(seat_ids))
+    )).all())
+    missing_seats = sorted(seat_ids - found_seats)
+    if missing_seats:
+        raise HTTPException(status_code=404, detail=f"Seat not found: {missing_seats}")
+
+    # Lấy mọi reservation đang tồn tại trên các cặp ghế/suất chiếu được yêu cầu
+    current_utc_time = datetime.now(timezone.utc)
+    existing_rows = (await db.execute(
+        select(
+            SeatReservations.seat_id,
+            SeatReservations.showtime_id,
+            SeatReservations.status,
+            SeatReservations.expires_at,
+        ).where(tuple_(SeatReservations.seat_id, SeatReservations.showtime_id).in_(pairs))
+    )).all()
+
+    confirmed_seats, pending_seats, stale_pairs = [], [], []
+    for row in existing_rows:
+        if row.status == 'confirmed':
+            confirmed_seats.append(row.seat_id)
+        elif row.status == 'pending' and row.expires_at > current_utc_time:
+            pending_seats.append(row.seat_id)
+        else:
+            stale_pairs.append((row.seat_id, row.showtime_id))
+
+    if confirmed_seats or pending_seats:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=_format_conflict_detail(sorted(confirmed_seats), sorted(pending_seats)),
+        )
+
+    # Reservation hết hạn nhưng chưa được dọn vẫn giữ unique constraint -> xóa trước khi insert
+    if stale_pairs:
+        await db.execute(
+            delete(SeatReservations)
+            .where(tuple_(SeatReservations.seat_id, SeatReservations.showtime_id).in_(stale_pairs))
+            .execution_options(synchronize_session=False)
+        )
+
+    calculated_expires_at = current_utc_time + timedelta(minutes=RESERVATION_HOLD_MINUTES)
+    insert_stmt = (
+        pg_insert(SeatReservations)
+        .values([
+            {
+                "seat_id": reservation_in.seat_id,
+                "showtime_id": reservation_in.showtime_id,
+                "user_id": reservation_in.user_id,
+                "session_id": reservation_in.session_id,
+                "expires_at": calculated_expires_at,
+                "status": "pending",
+            }
+            for reservation_in in unique_reservations.values()
+        ])
+        .on_conflict_do_nothing(index_elements=[SeatReservations.seat_id, SeatReservations.showtime_id])
+        .returning(SeatReservations)
+    )
+    created_reservations = (await db.scalars(insert_stmt)).all()
+
+    # Có request khác giữ ghế xen vào giữa bước kiểm tra và INSERT
+    if len(created_reservations) != len(pairs):
+        inserted_pairs = {(r.seat_id, r.showtime_id) for r in created_reservations}
+        raced_seats = sorted(seat_id for seat_id, showtime_id in pairs if (seat_id, showtime_id) not in inserted_pairs)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=_format_conflict_detail([], raced_seats),
+        )
+
+    return created_reservations
+
+
+def _format_conflict_detail(confirmed_seats: List[int], pending_seats: List[int]) -> str:
+    """Tạo thông báo lỗi liệt kê chính xác các ghế bị xung đột"""
+    parts = []
+    if confirmed_seats:
+        parts.append(f"Seats {confirmed_seats} are already confirmed.")
+    if pending_seats:
+        parts.append(f"Seats {pending_seats} are temporarily reserved.")
+    return " ".join(parts)
+
+
 # Tạo nhiều reservations cùng lúc
-async def create_multiple_reserved_seats(reservations_in: List[SeatReservationsCreate], db: Session):
+async def create_multiple_reserved_seats(reservations_in: List[SeatReservationsCreate], db: AsyncSession):
     try:
-        created_reservations = []
-        seat_ids = []
-        showtime_id = None
-        user_session = None
-        
-        for reservation_in in reservations_in:
-            showtime = db.query(Showtimes).filter(Showtimes.showtime_id == reservation_in.showtime_id).first()
-            seat = db.query(Seats).filter(Seats.seat_id == reservation_in.seat_id).first()
-            
-            if not showtime:
-                raise HTTPException(status_code=404, detail="Showtime not found")
-            if not seat:
-                raise HTTPException(status_code=404, detail="Seat not found")
-                
-            # Check existing reservations
-            existing_reservation = db.query(SeatReservations).filter(
-                SeatReservations.showtime_id == reservation_in.showtime_id,
-                SeatReservations.seat_id == reservation_in.seat_id,
-                or_(
-                    SeatReservations.status == 'confirmed',
-                    and_(
-                        SeatReservations.status == 'pending',
-                        SeatReservations.expires_at > datetime.now(timezone.utc)
-                    )
-                )
-            ).first()
-            
-            if existing_reservation:
-                if existing_reservation.status == 'confirmed':
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail=f"Seat {reservation_in.seat_id} is already confirmed."
-                    )
-                elif existing_reservation.status == 'pending':
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail=f"Seat {reservation_in.seat_id} is temporarily reserved."
-                    )
-            
-            current_utc_time = datetime.now(timezone.utc)
-            calculated_expires_at = current_utc_time + timedelta(minutes=10)
-
-            db_reservation = SeatReservations(
-                seat_id=reservation_in.seat_id,
-                showtime_id=reservation_in.showtime_id,
-                user_id=reservation_in.user_id,
-                session_id=reservation_in.session_id,
-                expires_at=calculated_expires_at,
-                status="pending"
-            )
+        created_reservations = await hold_seats_batch(reservations_in, db)
+        # Chuyển sang response trước khi commit để không phải refresh từng object sau commit
+        responses = [SeatReservationsResponse.from_orm(res) for res in created_reservations]
+        await db.commit()
+        expires_at = responses[0].expires_at
+        _schedule_expiry(expires_at)
+
+        # Nhóm ghế theo suất chiếu để gửi một thông báo cho mỗi suất chiếu
+        showtime_seat_map = {}
+        for reservation in responses:
+            showtime_seat_map.setdefault(reservation.showtime_id, []).append(reservation.seat_id)
+        user_session = reservations_in[0].session_id or ""
 
-            db.add(db_reservation)
-            seat_ids.append(reservation_in.seat_id)
-            showtime_id = reservation_in.showtime_id
-            user_session = reservation_in.session_id or ""
-            
-        db.commit()
-        
         # Gửi thông báo WebSocket cho tất cả ghế được đặt cùng lúc
         try:
             from app.core.websocket_manager import websocket_manager
             # Thông báo realtime đến tất cả client đang xem suất chiếu này
-            await websocket_manager.send_seat_reserved(
-                showtime_id=showtime_id,    # Suất chiếu
-                seat_ids=seat_ids,          # Danh sách tất cả ghế vừa được đặt
-                user_session=user_session   # Session người đặt
-            )
+            for showtime_id, seat_ids in showtime_seat_map.items():
+                await websocket_manager.send_seat_reserved(
+                    showtime_id=showtime_id,    # Suất chiếu
+                    seat_ids=seat_ids,          # Danh sách tất cả ghế vừa được đặt
+                    user_session=user_session,  # Session người đặt
+                    expires_at=expires_at       # Thời điểm hết hạn giữ ghế
+                )
         except Exception as ws_error:
             print(f"Thông báo WebSocket đặt nhiều ghế thất bại: {ws_error}")
-        
-        # Refresh and return all created reservations
-        for reservation in created_reservations:
-            db.refresh(reservation)
-            
-        return [SeatReservationsResponse.from_orm(res) for res in created_reservations]
-        
+
+        return responses
+
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 # Giải phóng ghế (hủy reservation)
-async def cancel_seat_reservations(showtime_id: int, seat_ids: List[int], session_id: str, db: Session):
+async def cancel_seat_reservations(showtime_id: int, seat_ids: List[int], session_id: str, db: AsyncSession):
     try:
         # Validate showtime exists
-        showtime = db.query(Showtimes).filter(Showtimes.showtime_id == showtime_id).first()
+        showtime = await db.get(Showtimes, showtime_id)
         if not showtime:
             raise HTTPException(status_code=404, detail="Showtime not found")
         
-        # Find reservations to cancel (chỉ pending và của session này)
-        reservations_to_cancel = db.query(SeatReservations).filter(
-            SeatReservations.showtime_id == showtime_id,
-            SeatReservations.seat_id.in_(seat_ids),
-            SeatReservations.session_id == session_id,
-            SeatReservations.status == 'pending'
-        ).all()
+        # Xóa các reservation cần hủy (chỉ pending và của session này) trong một câu DELETE ... RETURNING
+        cancelled_seat_ids = list((await db.scalars(
+            delete(SeatReservations)
+            .where(
+                SeatReservations.showtime_id == showtime_id,
+                SeatReservations.seat_id.in_(seat_ids),
+                SeatReservations.session_id == session_id,
+                SeatReservations.status == 'pending'
+            )
+            .returning(SeatReservations.seat_id)
+            .execution_options(synchronize_session=False)
+        )).all())
         
-        if not reservations_to_cancel:
+        if not cancelled_seat_ids:
             # Trả về thành công nhưng không có gì để hủy
             return {
                 "success": True,
@@ -202,19 +279,12 @@ async def cancel_seat_reservations(showtime_id: int, seat_ids: List[int], sessio
                 "cancelled_seats": []
             }
         
-        cancelled_seat_ids = []
-        seat_codes = []
+        # Lấy seat_code để gửi về client (một truy vấn cho tất cả ghế)
+        seat_codes = list((await db.scalars(
+            select(Seats.seat_code).where(Seats.seat_id.in_(cancelled_seat_ids))
+        )).all())
         
-        for reservation in reservations_to_cancel:
-            # Lấy seat_code để gửi WebSocket
-            seat = db.query(Seats).filter(Seats.seat_id == reservation.seat_id).first()
-            if seat:
-                seat_codes.append(seat.seat_code)
-            
-            cancelled_seat_ids.append(reservation.seat_id)
-            db.delete(reservation)
-        
-        db.commit()
+        await db.commit()
         
         # Gửi thông báo WebSocket về việc giải phóng ghế
         try:
@@ -242,43 +312,84 @@ async def cancel_seat_reservations(showtime_id: int, seat_ids: List[int], sessio
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 #Xóa đặt chỗ tự động khi hết hạn  
-async def delete_expired_reservations(db: Session):
+async def delete_expired_reservations(db: AsyncSession, chunk_size: Optional[int] = None):
+    """
+    Xóa reservation hết hạn theo từng lô bằng DELETE ... RETURNING (không nạp ORM object).
+    Mỗi lô được commit riêng để không giữ lock lâu, và ghế trong lô được thông báo
+    WebSocket ngay theo từng suất chiếu.
+    """
+    chunk_size = chunk_size or settings.EXPIRED_RESERVATION_DELETE_CHUNK_SIZE
+    deleted_count = 0
     try:
         current_time = datetime.now(timezone.utc)
-        expired_reservations = db.query(SeatReservations).filter(
-            SeatReservations.status == 'pending',
-            SeatReservations.expires_at < current_time
-        ).all()
-
-        # Nhóm các ghế theo suất chiếu để gửi thông báo WebSocket hiệu quả
-        showtime_seat_map = {}
-        for reservation in expired_reservations:
-            showtime_id = reservation.showtime_id
-            # Tạo map: showtime_id -> danh sách seat_id hết hạn
-            if showtime_id not in showtime_seat_map:
-                showtime_seat_map[showtime_id] = []
-            showtime_seat_map[showtime_id].append(reservation.seat_id)
-            db.delete(reservation)  # Xóa reservation hết hạn
-
-        db.commit()
-        
-        # Gửi thông báo WebSocket cho các ghế được giải phóng do hết hạn
-        try:
-            from app.core.websocket_manager import websocket_manager
-            # Gửi thông báo cho từng suất chiếu
-            for showtime_id, seat_ids in showtime_seat_map.items():
-                await websocket_manager.send_seat_released(
-                    showtime_id=showtime_id,  # Suất chiếu
-                    seat_ids=seat_ids         # Danh sách ghế hết hạn được giải phóng
+        while True:
+            # Chọn một lô reservation hết hạn, bỏ qua các dòng đang bị lock bởi giao dịch khác
+            expired_ids = (
+                select(SeatReservations.reservation_id)
+                .where(
+                    SeatReservations.status == 'pending',
+                    SeatReservations.expires_at <= current_time
                 )
-        except Exception as ws_error:
-            print(f"Thông báo WebSocket ghế hết hạn thất bại: {ws_error}")
-            
-        return len(expired_reservations)
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            expired_rows = (await db.execute(
+                delete(SeatReservations)
+                .where(SeatReservations.reservation_id.in_(expired_ids))
+                .returning(SeatReservations.showtime_id, SeatReservations.seat_id)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+            deleted_count += len(expired_rows)
+
+            # Nhóm các ghế theo suất chiếu để gửi thông báo WebSocket hiệu quả
+            showtime_seat_map = {}
+            for showtime_id, seat_id in expired_rows:
+                # Tạo map: showtime_id -> danh sách seat_id hết hạn
+                showtime_seat_map.setdefault(showtime_id, []).append(seat_id)
+            await _notify_expired_seats(showtime_seat_map)
+
+            if len(expired_rows) < chunk_size:
+                break
+
+        return deleted_count
         
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
\ No newline at end of file
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+async def _notify_expired_seats(showtime_seat_map: dict):
+    """Gửi thông báo WebSocket cho các ghế được giải phóng do hết hạn"""
+    try:
+        from app.core.websocket_manager import websocket_manager
+        # Gửi thông báo cho từng suất chiếu
+        for showtime_id, seat_ids in showtime_seat_map.items():
+            await websocket_manager.send_seat_released(
+                showtime_id=showtime_id,  # Suất chiếu
+                seat_ids=seat_ids,        # Danh sách ghế hết hạn được giải phóng
+                reason="expired"
+            )
+    except Exception as ws_error:
+        print(f"Thông báo WebSocket ghế hết hạn thất bại: {ws_error}")
+
+
+# Lấy thời điểm hết hạn của các reservation đang giữ chỗ (dùng để dựng lại heap khi khởi động)
+async def get_pending_expiry_deadlines(db: AsyncSession) -> List[datetime]:
+    return list((await db.scalars(
+        select(SeatReservations.expires_at).where(SeatReservations.status == 'pending').distinct()
+    )).all())
+
+
+def _schedule_expiry(expires_at: datetime):
+    """Đăng ký thời điểm hết hạn với bộ lập lịch nền để giải phóng ghế đúng hạn"""
+    try:
+        from app.core.background_tasks import background_tasks
+        background_tasks.schedule_expiry(expires_at)
+    except Exception as e:
+        print(f"Không thể lập lịch giải phóng ghế: {e}")
@@ -1,7 +1,9 @@
 from fastapi import HTTPException
 from sqlalchemy import func
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 
+from app.core.permission_matrix import permission_matrix
+from app.core.principal_cache import principal_cache
 from app.models.permissions import Permission
 from app.models.role import Role, UserRole
 from app.schemas.roles import PermissionCreate, PermissionResponse, RoleCreate, RoleResponse
@@ -9,33 +11,20 @@ from app.schemas.roles import PermissionCreate, PermissionResponse, RoleCreate,
 
 # Danh sách vai trò
 def get_list_roles(db: Session):
-    roles = (
-        db.query(
-            Role,
-            func.count(UserRole.user_id).label("user_count"),
-            func.count(Permission.permission_id).label("permission_count")
-        )
-        .outerjoin(UserRole, Role.role_id == UserRole.role_id)
-        .outerjoin(Role.permissions)
-        .group_by(Role.role_id)
-        .options(joinedload(Role.permissions))
+    """Vai trò và quyền lấy từ ma trận quyền trong bộ nhớ, chỉ đếm số người dùng bằng một truy vấn"""
+    permission_matrix.ensure_loaded(db)
+    user_counts = dict(
+        db.query(UserRole.role_id, func.count(UserRole.user_id))
+        .group_by(UserRole.role_id)
         .all()
     )
     results = []
-    for role, user_count, permission_count in roles:
-        # Lấy danh sách permissions đã được tải sẵn
-        permissions_list = [
-            PermissionResponse.model_validate(p) for p in role.permissions
-        ]
-        
+    for role in permission_matrix.roles():
+        permissions_list = permission_matrix.role_permissions(role["role_id"])
         results.append({
-            "role_id": role.role_id,
-            "role_name": role.role_name,
-            "description": role.description,
-            "created_at": role.created_at,
-            "updated_at": role.updated_at,
-            "user_count": user_count,
-            "permission_count": permission_count,
+            **role,
+            "user_count": user_counts.get(role["role_id"], 0),
+            "permission_count": len(permissions_list),
             "permissions": permissions_list
         })
     return results
@@ -59,6 +48,7 @@ def create_role_with_permissions( data: RoleCreate, db: Session):
         db.add(db_role)
         db.commit()
         db.refresh(db_role)
+        permission_matrix.invalidate()
 
         return RoleResponse.from_orm(db_role)
 
@@ -73,6 +63,9 @@ def delete_role( role_id: int,db: Session):
             raise HTTPException(status_code=404, detail="Role not found")
         db.delete(role)
         db.commit()
+        # Người dùng giữ vai trò này mất quyền ngay: xóa toàn bộ principal đã cache
+        principal_cache.clear()
+        permission_matrix.invalidate()
         return True
     except Exception as e:
         db.rollback()
@@ -96,6 +89,7 @@ def create_permissions(db: Session, data: PermissionCreate):
         db.commit()
         # Làm mới đối tượng để lấy dữ liệu mới nhất từ DB
         db.refresh(db_movie)
+        permission_matrix.invalidate()
         return db_movie
     except Exception as e:
         # Nếu có lỗi, rollback transaction
@@ -6,6 +6,7 @@ from app.models.movies import Movies
 from fastapi import HTTPException
 from app.models.rooms import Rooms
 from app.schemas.showtimes import ShowtimesCreate, ShowtimesResponse
+from app.services.pricing_service import ticket_pricing
 from typing import Optional
 from datetime import datetime, date
 
@@ -155,6 +156,7 @@ def delete_showtime(db: Session, showtime_id: int):
             raise HTTPException(status_code=404, detail="Showtime not found")
         db.delete(showtime)
         db.commit()
+        ticket_pricing.invalidate_showtime(showtime_id)
         return True
     except Exception as e:
         db.rollback()
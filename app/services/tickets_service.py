@@ -1,8 +1,11 @@
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 from fastapi import HTTPException,status
-from sqlalchemy import  func
+from sqlalchemy import  String, cast, func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from app.models.movies import Movies
+from app.models.rooms import Rooms
 from app.models.seat_reservations import SeatReservations
-from app.models.seat_templates import SeatTypeEnum
 from app.models.seats import Seats
 from app.models.showtimes import Showtimes
 from app.models.transactions import TransactionStatus, Transaction
@@ -14,131 +17,136 @@ from app.schemas.tickets import (
     TicketVerifyResponse,
 )
 from sqlalchemy.orm import Session
-from app.models.tickets import Tickets
+from app.models.tickets import Tickets, TicketStatusEnum
+from app.models.users import Users
 from app.core.token_utils import create_token
 from datetime import timedelta
 from jose import jwt, JWTError
 from app.core.config import settings
+from app.services.pricing_service import ticket_pricing
+from app.utils.helpers import decode_cursor, encode_cursor
 
 
-def get_all_bookings(db: Session):
-    """Return bookings grouped by booking_code with summary fields suitable for admin/print views."""
-    try:
-        tickets = db.query(Tickets).all()
-        grouped = {}
-        for t in tickets:
-            code = getattr(t, 'booking_code', None) or 'NO_CODE'
-            if code not in grouped:
-                grouped[code] = {
-                    'code': code,
-                    'tickets': [],
-                    'customer': None,
-                    'phone': None,
-                    'email': None,
-                    'movie': None,
-                    'showtime': None,
-                    'date': None,
-                    'status': None,
-                    'printed': False,
-                    'received': False,
-                    'refunded': False,
-                    'qr': code,
-                }
-            # seat code/type
-            seat_code = getattr(t.seat, 'seat_code', None)
-            seat_type = getattr(t.seat, 'seat_type', None)
-            grouped[code]['tickets'].append({
-                'ticket_id': t.ticket_id,
-                'seat': seat_code,
-                'type': str(seat_type) if seat_type else None,
-                'price': float(t.price) if t.price is not None else None,
-            })
-            # populate customer/email/phone if available from user
-            if t.user:
-                grouped[code]['customer'] = t.user.full_name
-                grouped[code]['email'] = t.user.email
-                grouped[code]['phone'] = t.user.phone
-            # showtime/movie
-            if t.showtime and t.showtime.movie:
-                grouped[code]['movie'] = t.showtime.movie.title
-                # format showtime
-                try:
-                    dt = t.showtime.show_datetime
-                    room = getattr(t.showtime.room, 'room_name', None)
-                    grouped[code]['showtime'] = f"{dt.strftime('%H:%M')} - {room}" if dt else None
-                    grouped[code]['date'] = dt.strftime('%Y-%m-%d') if dt else None
-                except Exception:
-                    pass
-            # status inference: if any ticket is refunded/cancelled
-            if str(t.status) == 'cancelled':
-                grouped[code]['refunded'] = True
+# Số booking tối đa trên một trang
+BOOKING_PAGE_MAX_LIMIT = 100
+
+
+def _booking_summary_query(page_codes=None):
+    """Gộp vé theo booking_code ngay trong SQL: danh sách ghế, tổng tiền, khách hàng, phim, suất chiếu"""
+    ticket_items = func.json_agg(aggregate_order_by(
+        func.json_build_object(
+            'ticket_id', Tickets.ticket_id,
+            'seat', Seats.seat_code,
+            'type', cast(Seats.seat_type, String),
+            'price', Tickets.price,
+        ),
+        Seats.seat_code,
+    ))
+    query = (
+        select(
+            Tickets.booking_code.label('code'),
+            ticket_items.label('tickets'),
+            func.string_agg(Seats.seat_code, aggregate_order_by(literal_column("', '"), Seats.seat_code)).label('seats'),
+            func.sum(Tickets.price).label('total_price'),
+            func.max(Users.full_name).label('customer'),
+            func.max(Users.email).label('email'),
+            func.max(Users.phone).label('phone'),
+            func.max(Movies.title).label('movie'),
+            func.max(Showtimes.show_datetime).label('show_datetime'),
+            func.max(Rooms.room_name).label('room'),
+            func.bool_or(Tickets.status == TicketStatusEnum.cancelled).label('refunded'),
+        )
+        .join(Seats, Seats.seat_id == Tickets.seat_id)
+        .join(Showtimes, Showtimes.showtime_id == Tickets.showtime_id)
+        .join(Movies, Movies.movie_id == Showtimes.movie_id)
+        .join(Rooms, Rooms.room_id == Showtimes.room_id)
+        .outerjoin(Users, Users.user_id == Tickets.user_id)
+        .group_by(Tickets.booking_code)
+    )
+    if page_codes is not None:
+        query = (
+            query.join(page_codes, page_codes.c.booking_code == Tickets.booking_code)
+            .add_columns(page_codes.c.last_ticket_id)
+            .group_by(page_codes.c.last_ticket_id)
+            .order_by(page_codes.c.last_ticket_id.desc())
+        )
+    return query
+
+
+def _booking_from_row(row) -> dict:
+    dt = row.show_datetime
+    return {
+        'code': row.code,
+        'tickets': row.tickets,
+        'customer': row.customer,
+        'phone': row.phone,
+        'email': row.email,
+        'movie': row.movie,
+        'showtime': f"{dt.strftime('%H:%M')} - {row.room}" if dt else None,
+        'date': dt.strftime('%Y-%m-%d') if dt else None,
+        'status': 'Đã thanh toán',
+        'printed': False,
+        'received': False,
+        'refunded': bool(row.refunded),
+        'qr': row.code,
+        'seats': row.seats or '',
+        'total_price': float(row.total_price or 0),
+    }
 
-        # Convert to list
-        result = []
-        for code, item in grouped.items():
-            # compute seats string
-            seats = [ti['seat'] for ti in item['tickets'] if ti.get('seat')]
-            item['seats'] = ', '.join(seats)
-            # status aggregation
-            item['status'] = 'Đã thanh toán' if any(True for ti in item['tickets']) else 'unknown'
-            result.append(item)
-        return result
+
+def get_bookings_page(
+    db: Session,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    show_date: Optional[date] = None,
+    showtime_id: Optional[int] = None,
+    ticket_status: Optional[TicketStatusEnum] = None,
+):
+    """Danh sách booking (mới nhất trước) phân trang theo keyset: một truy vấn cho cả trang.
+    Cursor là ticket_id lớn nhất của booking cuối trang trước."""
+    limit = max(1, min(limit, BOOKING_PAGE_MAX_LIMIT))
+    last_ticket_id = func.max(Tickets.ticket_id)
+    # Chọn booking_code của trang hiện tại chỉ trên bảng tickets, sau đó mới join để gộp dữ liệu
+    page_codes = select(Tickets.booking_code, last_ticket_id.label('last_ticket_id')).group_by(Tickets.booking_code)
+    if showtime_id is not None:
+        page_codes = page_codes.where(Tickets.showtime_id == showtime_id)
+    if ticket_status is not None:
+        page_codes = page_codes.where(Tickets.status == ticket_status)
+    if show_date is not None:
+        day_start = datetime.combine(show_date, datetime.min.time())
+        page_codes = page_codes.join(Showtimes, Showtimes.showtime_id == Tickets.showtime_id).where(
+            Showtimes.show_datetime >= day_start,
+            Showtimes.show_datetime < day_start + timedelta(days=1),
+        )
+    if cursor:
+        after = decode_cursor(cursor).get('last_ticket_id')
+        if not isinstance(after, int):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        page_codes = page_codes.having(last_ticket_id < after)
+    page_codes = page_codes.order_by(last_ticket_id.desc()).limit(limit + 1).cte('page_codes')
+
+    try:
+        rows = db.execute(_booking_summary_query(page_codes)).all()
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'items': [_booking_from_row(row) for row in rows],
+        'limit': limit,
+        'next_cursor': encode_cursor({'last_ticket_id': rows[-1].last_ticket_id}) if has_more else None,
+    }
+
 
 def get_booking_by_code(db: Session, booking_code: str):
     try:
-        tickets = db.query(Tickets).filter(Tickets.booking_code == booking_code).all()
-        if not tickets:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Booking not found')
-        # reuse grouping logic but only for one code
-        grouped = {
-            'code': booking_code,
-            'tickets': [],
-            'customer': None,
-            'phone': None,
-            'email': None,
-            'movie': None,
-            'showtime': None,
-            'date': None,
-            'status': None,
-            'printed': False,
-            'received': False,
-            'refunded': False,
-            'qr': booking_code,
-        }
-        for t in tickets:
-            seat_code = getattr(t.seat, 'seat_code', None)
-            seat_type = getattr(t.seat, 'seat_type', None)
-            grouped['tickets'].append({
-                'ticket_id': t.ticket_id,
-                'seat': seat_code,
-                'type': str(seat_type) if seat_type else None,
-                'price': float(t.price) if t.price is not None else None,
-            })
-            if t.user:
-                grouped['customer'] = t.user.full_name
-                grouped['email'] = t.user.email
-                grouped['phone'] = t.user.phone
-            if t.showtime and t.showtime.movie:
-                try:
-                    dt = t.showtime.show_datetime
-                    room = getattr(t.showtime.room, 'room_name', None)
-                    grouped['showtime'] = f"{dt.strftime('%H:%M')} - {room}" if dt else None
-                    grouped['date'] = dt.strftime('%Y-%m-%d') if dt else None
-                    grouped['movie'] = t.showtime.movie.title
-                except Exception:
-                    pass
-            if str(t.status) == 'cancelled':
-                grouped['refunded'] = True
-        grouped['seats'] = ', '.join([ti['seat'] for ti in grouped['tickets'] if ti.get('seat')])
-        grouped['status'] = 'Đã thanh toán'
-        return grouped
-    except HTTPException:
-        raise
+        row = db.execute(_booking_summary_query().where(Tickets.booking_code == booking_code)).first()
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Booking not found')
+    return _booking_from_row(row)
 
 
 # Nhân viên tạo vé trực tiếp tại quầy
@@ -163,19 +171,13 @@ def create_ticket_directly(db : Session, ticket_in : TicketsCreate):
         if reversed_seat:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Seat is reserved and cannot be booked directly.")
         
-        showtime = db.query(Showtimes).filter(
-            Showtimes.showtime_id == ticket_in.showtime_id,
-            Showtimes.status == 'active'
-        ).first()
+        # Tính giá vé dựa trên loại ghế (suất chiếu phải đang hoạt động)
+        base_price = ticket_pricing.price_cart_sync(
+            db, [(ticket_in.seat_id, ticket_in.showtime_id)], require_active=True
+        )[0]
         seat = db.query(Seats).filter(
             Seats.seat_id == ticket_in.seat_id
         ).first()
-        # Tính giá vé dựa trên loại ghế
-        base_price = float(showtime.ticket_price)
-        if seat.seat_type == SeatTypeEnum.vip:
-            base_price *= 1.5
-        elif seat.seat_type == SeatTypeEnum.couple:
-            base_price *= 2
 
         db_transaction = Transaction(
             user_id=ticket_in.user_id,
@@ -3,13 +3,16 @@ from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from app.models.users import Users, UserStatusEnum
 from app.schemas.users import UserResponse, UserCreate, UserUpdate
-from passlib.context import CryptContext
+from app.core.password_hasher import password_hasher
+from app.core.principal_cache import principal_cache
+from app.utils.pagination import paginate
 from app.models.ranks import Ranks  # Import mô hình Ranks
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Lấy danh sách người dùng với phân trang và tìm kiếm
-def get_all_users(db: Session, skip: int = 0, limit: int = 10, search_query: Optional[str] = None) -> dict:
+def get_all_users(
+    db: Session, skip: int = 0, limit: int = 10, search_query: Optional[str] = None,
+    cursor: Optional[str] = None, count: str = "exact",
+) -> dict:
     try:
         query = db.query(Users).options(joinedload(Users.rank))
         if search_query:
@@ -18,19 +21,18 @@ def get_all_users(db: Session, skip: int = 0, limit: int = 10, search_query: Opt
                 (Users.full_name.ilike(search)) |
                 (Users.email.ilike(search))
             )
-        total = query.count()
-        users = query.offset(skip).limit(limit).all()
+        # Người dùng mới nhất trước, keyset theo user_id
+        page = paginate(query, Users.user_id, skip=skip, limit=limit, cursor=cursor, count=count, filters=(search_query,))
         # Ánh xạ rank_name vào response
-        user_responses = [
+        page["items"] = [
             UserResponse(
                 **UserResponse.from_orm(u).dict(exclude={'rank', 'rank_name'}),
                 rank_name=u.rank.rank_name if u.rank else None
-            ) for u in users
+            ) for u in page["items"]
         ]
-        return {
-            "items": user_responses,
-            "total": total
-        }
+        return page
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi khi lấy danh sách người dùng: {str(e)}")
 
@@ -67,7 +69,7 @@ def create_user(db: Session, user_in: UserCreate):
         if get_user_by_email(db, user_in.email):
             raise HTTPException(status_code=400, detail="Email đã được đăng ký")
         
-        hashed_password = pwd_context.hash(user_in.password)
+        hashed_password = password_hasher.hash(user_in.password)
         user = Users(
             full_name=user_in.full_name,
             email=user_in.email,
@@ -90,6 +92,10 @@ def create_user(db: Session, user_in: UserCreate):
             **UserResponse.from_orm(user).dict(exclude={'rank', 'rank_name'}),
             rank_name=user.rank.rank_name if user.rank else None
         )
+    except HTTPException:
+        # Giữ nguyên mã lỗi (400 email trùng, 503 khi hàng đợi băm mật khẩu đầy)
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Lỗi khi tạo người dùng: {str(e)}")
@@ -102,6 +108,7 @@ def delete_user(db: Session, user_id: int):
             raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
         db.delete(user)
         db.commit()
+        principal_cache.invalidate_user(user_id)
         return {"message": "Xóa người dùng thành công"}
     except Exception as e:
         db.rollback()
@@ -117,6 +124,7 @@ def update_user(db: Session, user_id: int, user_in: UserUpdate):
         for key, value in updated_user.items():
             setattr(user, key, value)
         db.commit()
+        principal_cache.invalidate_user(user_id)
         db.refresh(user)
         return UserResponse(
             **UserResponse.from_orm(user).dict(exclude={'rank', 'rank_name'}),
@@ -134,6 +142,7 @@ def update_user_status(db: Session, user_id: int, status: UserStatusEnum):
             raise HTTPException(status_code=404, detail="Không tìm thấy người dùng")
         user.status = status
         db.commit()
+        principal_cache.invalidate_user(user_id)
         db.refresh(user)
         return UserResponse(
             **UserResponse.from_orm(user).dict(exclude={'rank', 'rank_name'}),
@@ -167,6 +176,7 @@ def update_loyalty_points(db: Session, user_id: int, points: int):
         if user.loyalty_points < 0:
             user.loyalty_points = 0
         db.commit()
+        principal_cache.invalidate_user(user_id)
         db.refresh(user)
         return UserResponse(
             **UserResponse.from_orm(user).dict(exclude={'rank', 'rank_name'}),
@@ -192,6 +202,7 @@ def update_total_spent(db: Session, user_id: int, amount: float):
         user.rank_id = rank.rank_id
         
         db.commit()
+        principal_cache.invalidate_user(user_id)
         db.refresh(user)
         return UserResponse(
             **UserResponse.from_orm(user).dict(exclude={'rank', 'rank_name'}),
@@ -0,0 +1,94 @@
+"""
+Kiểm tra luồng đăng nhập trên database thật (AsyncSession/asyncpg)
+Tạo một người dùng tạm đã xác minh, gọi qua TestClient: sai mật khẩu, email không tồn tại,
+đăng nhập đúng (kiểm tra last_login được ghi), làm mới token và đăng xuất; xóa người dùng tạm
+khi xong. Trả mã thoát 1 nếu có bước sai kết quả.
+Cần database đã tạo schema (DATABASE_URL như khi chạy server, có vai trò 'user').
+"""
+
+import sys
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app.core.database import SessionLocal
+from app.core.password_hasher import password_hasher
+from app.main import app
+from app.models.refresh_tokens import RefreshToken
+from app.models.role import Role, UserRole
+from app.models.users import Users
+
+PASSWORD = "Login-check-1234"
+
+
+def create_user(email: str) -> int:
+    with SessionLocal() as db:
+        user = Users(
+            full_name="Login Check",
+            email=email,
+            password_hash=password_hasher.hash(PASSWORD),
+            is_verified=True,
+        )
+        db.add(user)
+        db.flush()
+        role = db.query(Role).filter(Role.role_name == "user").first()
+        if role is not None:
+            db.add(UserRole(user_id=user.user_id, role_id=role.role_id))
+        db.commit()
+        return user.user_id
+
+
+def delete_user(user_id: int):
+    with SessionLocal() as db:
+        db.query(RefreshToken).filter(RefreshToken.user_id == user_id).delete()
+        db.query(UserRole).filter(UserRole.user_id == user_id).delete()
+        db.query(Users).filter(Users.user_id == user_id).delete()
+        db.commit()
+
+
+def last_login(user_id: int):
+    with SessionLocal() as db:
+        return db.query(Users.last_login).filter(Users.user_id == user_id).scalar()
+
+
+def main():
+    email = f"login-check-{uuid.uuid4().hex[:12]}@example.com"
+    user_id = create_user(email)
+    failed = 0
+
+    def check(label, response, expected_status):
+        nonlocal failed
+        ok = response.status_code == expected_status
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {label}: {response.status_code} (expected {expected_status})")
+        if not ok:
+            print(f"   {response.text[:500]}")
+        return ok
+
+    try:
+        with TestClient(app, raise_server_exceptions=False) as client:
+            check("wrong password", client.post("/api/v1/login", json={"email": email, "password": "wrong"}), 401)
+            check(
+                "unknown email",
+                client.post("/api/v1/login", json={"email": f"missing-{email}", "password": PASSWORD}),
+                401,
+            )
+            response = client.post("/api/v1/login", json={"email": email, "password": PASSWORD})
+            if check("correct password", response, 200):
+                tokens = response.json()["data"]
+                if last_login(user_id) is None:
+                    failed += 1
+                    print("❌ last_login was not recorded")
+                response = client.post("/api/v1/refresh-token", params={"token": tokens["refresh_token"]})
+                if check("refresh token", response, 200):
+                    refresh_token = response.json()["data"]["refresh_token"]
+                    check("logout", client.post("/api/v1/logout", params={"token": refresh_token}), 200)
+    finally:
+        delete_user(user_id)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# python -m app.tests.auth_login_check
@@ -0,0 +1,91 @@
+"""
+Benchmark thông lượng gửi email: mở kết nối SMTP cho từng email so với hàng đợi EmailQueue
+có nhóm worker dùng lại kết nối. Chạy với SMTP giả lập cục bộ (aiosmtpd), lệnh EHLO bị
+làm chậm để mô phỏng chi phí STARTTLS + login của SMTP thật.
+"""
+
+import time
+
+from premailer import transform
+
+from app.core.email_queue import EmailQueue
+from app.services.email_service import VERIFICATION_EMAIL_TEMPLATE, EmailService, inline_template
+from app.tests.local_smtp_server import start_local_smtp
+
+MESSAGES = 200
+WORKERS = 4
+HANDSHAKE_DELAY = 0.05  # Giây, mô phỏng độ trễ bắt tay với SMTP thật
+PORT = 8025
+
+
+def make_service() -> EmailService:
+    return EmailService(
+        smtp_server="127.0.0.1",
+        smtp_port=PORT,
+        username="noreply@cineplus.local",
+        password="",
+        use_tls=False,
+    )
+
+
+def bench_template_inlining():
+    """So sánh premailer cho mỗi email với template đã inline được ghi nhớ"""
+    runs = 50
+    start = time.perf_counter()
+    for _ in range(runs):
+        transform(VERIFICATION_EMAIL_TEMPLATE)
+    uncached = (time.perf_counter() - start) / runs
+    inline_template(VERIFICATION_EMAIL_TEMPLATE)
+    start = time.perf_counter()
+    for _ in range(runs):
+        inline_template(VERIFICATION_EMAIL_TEMPLATE).safe_substitute(
+            verification_code="123456", sender_name="CinePlus", year=2025
+        )
+    cached = (time.perf_counter() - start) / runs
+    print(f"Template: premailer per send={uncached * 1000:.2f}ms, cached={cached * 1000:.3f}ms")
+
+
+def bench_connection_per_message(service: EmailService, handler):
+    """Cách cũ: mỗi email mở một kết nối SMTP mới, gửi tuần tự"""
+    handler.messages = handler.handshakes = 0
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        service.send_verification_email(f"user{i}@example.com", "123456")
+    elapsed = time.perf_counter() - start
+    print(f"Connection per message: {MESSAGES / elapsed:.1f} msg/s, handshakes={handler.handshakes}")
+
+
+def bench_queue(service: EmailService, handler):
+    """Hàng đợi: request chỉ enqueue, worker gửi qua kết nối dùng lại"""
+    handler.messages = handler.handshakes = 0
+    email_queue = EmailQueue(service, workers=WORKERS, maxsize=MESSAGES, max_retries=3, idle_timeout=30.0)
+    email_queue.start()
+
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        email_queue.queue_verification_email(f"user{i}@example.com", "123456")
+    enqueue_elapsed = time.perf_counter() - start
+    email_queue.queue.join()
+    elapsed = time.perf_counter() - start
+    email_queue.stop()
+
+    print(f"Queued ({WORKERS} workers): enqueue per request={enqueue_elapsed / MESSAGES * 1e6:.1f}us, "
+          f"{MESSAGES / elapsed:.1f} msg/s, handshakes={handler.handshakes}, "
+          f"sent={email_queue.sent_count}, failed={email_queue.failed_count}")
+
+
+def main():
+    controller, handler = start_local_smtp(port=PORT, handshake_delay=HANDSHAKE_DELAY)
+    try:
+        service = make_service()
+        bench_template_inlining()
+        bench_connection_per_message(service, handler)
+        bench_queue(service, handler)
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
+
+# python -m app.tests.email_throughput_benchmark
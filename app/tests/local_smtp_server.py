@@ -0,0 +1,53 @@
+"""
+SMTP giả lập cục bộ dùng aiosmtpd (pip install aiosmtpd)
+Nhận email và chỉ đếm, không gửi đi đâu. Có thể thêm độ trễ cho lệnh EHLO để mô phỏng
+chi phí bắt tay (STARTTLS + login) của SMTP thật.
+Khi dùng với ứng dụng: đặt EMAIL_HOST=127.0.0.1, EMAIL_PORT=8025, EMAIL_USE_TLS=false
+và để trống EMAIL_PASSWORD.
+"""
+
+import asyncio
+import time
+
+from aiosmtpd.controller import Controller
+
+
+class CountingHandler:
+    """Handler aiosmtpd: đếm số email và số lần bắt tay nhận được"""
+
+    def __init__(self, handshake_delay: float = 0.0):
+        self.handshake_delay = handshake_delay
+        self.messages = 0
+        self.handshakes = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.handshakes += 1
+        if self.handshake_delay:
+            await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return "250 Message accepted for delivery"
+
+
+def start_local_smtp(host: str = "127.0.0.1", port: int = 8025, handshake_delay: float = 0.0):
+    """Khởi động SMTP giả lập trong thread riêng, trả về (controller, handler)"""
+    handler = CountingHandler(handshake_delay)
+    controller = Controller(handler, hostname=host, port=port)
+    controller.start()
+    return controller, handler
+
+
+if __name__ == "__main__":
+    controller, handler = start_local_smtp()
+    print(f"SMTP giả lập đang chạy tại {controller.hostname}:{controller.port} (Ctrl+C để dừng)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Đã nhận {handler.messages} email, {handler.handshakes} lần bắt tay")
+    except KeyboardInterrupt:
+        controller.stop()
+
+# python -m app.tests.local_smtp_server
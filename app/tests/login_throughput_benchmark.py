@@ -0,0 +1,111 @@
+"""
+Benchmark thông lượng đăng nhập qua threadpool của ASGI theo cách chạy route và số worker băm mật khẩu
+Mô phỏng một đợt đăng nhập dồn dập trên một event loop, với threadpool LOGIN_THREADS thread
+như threadpool mà Starlette dùng cho route def (run_in_threadpool). So sánh:
+- def route, inline (cũ): bcrypt chạy ngay trên thread của threadpool
+- def route, pool: thread của threadpool chờ Future của PasswordHasher
+- async def route, pool: request chờ PasswordHasher trên event loop (verify_async)
+Song song đó một "route def khác" (sơ đồ ghế) gửi việc nhỏ vào cùng threadpool mỗi 10ms, đo độ
+trễ phản hồi: nếu đăng nhập chiếm hết thread, mọi route def khác phải xếp hàng.
+Không cần database hay mạng.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import statistics
+import time
+
+from app.core.password_hasher import PasswordHasher, build_crypt_context
+
+ROUNDS = 12
+LOGINS = 64
+LOGIN_THREADS = 40  # Mặc định của threadpool anyio (run_in_threadpool của Starlette)
+QUEUE_SIZE = 64  # Mặc định PASSWORD_HASH_QUEUE_SIZE
+WORKER_COUNTS = [2, os.cpu_count() or 4]
+PASSWORD = "correct horse battery staple"
+
+
+def seat_map_work():
+    sum(i * i for i in range(2000))  # Dựng payload sơ đồ ghế
+
+
+def p99(values):
+    return values[min(len(values) - 1, int(len(values) * 0.99))] if values else 0.0
+
+
+async def sync_route_probe(threadpool, stop: asyncio.Event, latencies: list, interval: float = 0.01):
+    """Route def khác: mỗi interval gửi một việc nhỏ vào threadpool, ghi lại thời gian phản hồi"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = time.perf_counter()
+        await loop.run_in_executor(threadpool, seat_map_work)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def run(label, login_route):
+    """login_route(threadpool) -> coroutine của một request đăng nhập"""
+    latencies, probe_latencies = [], []
+    rejected = 0
+    threadpool = ThreadPoolExecutor(max_workers=LOGIN_THREADS)
+    stop = asyncio.Event()
+    probe = asyncio.create_task(sync_route_probe(threadpool, stop, probe_latencies))
+
+    async def login():
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            assert await login_route(threadpool)
+        except Exception as e:
+            if getattr(e, "status_code", None) != 503:
+                raise
+            rejected += 1
+            return
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    threadpool.shutdown(wait=True)
+
+    latencies.sort()
+    probe_latencies.sort()
+    print(
+        f"{label:<30} {len(latencies) / elapsed:6.1f} logins/s  rejected={rejected:<3} "
+        f"login p50={statistics.median(latencies) if latencies else 0:7.0f}ms p99={p99(latencies):7.0f}ms  "
+        f"other def routes p99={p99(probe_latencies):7.1f}ms"
+    )
+
+
+async def main():
+    context = build_crypt_context(ROUNDS)
+    password_hash = context.hash(PASSWORD)
+    loop = asyncio.get_running_loop()
+    print(f"bcrypt rounds={ROUNDS}, {LOGINS} logins, {LOGIN_THREADS} threadpool threads, {os.cpu_count()} CPUs")
+
+    await run(
+        "def route, inline (old)",
+        lambda threadpool: loop.run_in_executor(threadpool, context.verify, PASSWORD, password_hash),
+    )
+    for workers in WORKER_COUNTS:
+        hasher = PasswordHasher(context, workers=workers, max_queue=QUEUE_SIZE)
+        await run(
+            f"def route, pool workers={workers}",
+            lambda threadpool: loop.run_in_executor(threadpool, hasher.verify, PASSWORD, password_hash),
+        )
+        hasher.reset()
+        await run(
+            f"async route, pool workers={workers}",
+            lambda threadpool: hasher.verify_async(PASSWORD, password_hash),
+        )
+        print(f"{'':<30} peak pending={hasher.stats()['peak_pending']}, wait p99={hasher.stats()['wait_ms']['p99']}ms")
+        hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+# python -m app.tests.login_throughput_benchmark
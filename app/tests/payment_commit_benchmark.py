@@ -0,0 +1,108 @@
+"""
+Benchmark số lần commit và độ trễ khi tạo thanh toán
+So sánh luồng cũ của PaymentService.create_payment (4 lần commit: payment, gán payment_id
+cho ghế, transaction, payment_url) với luồng mới (flush lấy payment_id, commit một lần).
+Chạy trên Postgres cục bộ với các bảng benchmark riêng, dùng cùng dạng câu lệnh với service;
+không dùng TEMP TABLE để mỗi commit thật sự phải ghi WAL như bảng thật.
+"""
+
+import asyncio
+import statistics
+import time
+import uuid
+
+from sqlalchemy import event, text
+
+from app.core.database import async_engine
+
+PAYMENTS = 200
+SEATS_PER_PAYMENT = 4
+
+SETUP = [
+    "CREATE TABLE bench_payments (payment_id SERIAL PRIMARY KEY, order_id TEXT, amount INTEGER, payment_url TEXT)",
+    "CREATE TABLE bench_reservations (reservation_id SERIAL PRIMARY KEY, session_id TEXT, payment_id INTEGER)",
+    "CREATE INDEX ON bench_reservations (session_id)",
+    "CREATE TABLE bench_transactions (transaction_id SERIAL PRIMARY KEY, payment_id INTEGER, total_amount INTEGER)",
+]
+TEARDOWN = "DROP TABLE IF EXISTS bench_payments, bench_reservations, bench_transactions"
+
+INSERT_PAYMENT = text(
+    "INSERT INTO bench_payments (order_id, amount, payment_url) VALUES (:order_id, :amount, :url) RETURNING payment_id"
+)
+ASSIGN_SEATS = text("UPDATE bench_reservations SET payment_id = :payment_id WHERE session_id = :session_id")
+INSERT_TRANSACTION = text("INSERT INTO bench_transactions (payment_id, total_amount) VALUES (:payment_id, :amount)")
+SET_URL = text("UPDATE bench_payments SET payment_url = :url WHERE payment_id = :payment_id")
+
+
+async def hold_seats(conn, session_id):
+    await conn.execute(
+        text("INSERT INTO bench_reservations (session_id) SELECT :session_id FROM generate_series(1, :n)"),
+        {"session_id": session_id, "n": SEATS_PER_PAYMENT},
+    )
+    await conn.commit()
+
+
+async def create_payment_four_commits(conn, session_id):
+    order_id = str(uuid.uuid4())
+    payment_id = (await conn.execute(INSERT_PAYMENT, {"order_id": order_id, "amount": 90000, "url": None})).scalar()
+    await conn.commit()
+    await conn.execute(ASSIGN_SEATS, {"payment_id": payment_id, "session_id": session_id})
+    await conn.commit()
+    await conn.execute(INSERT_TRANSACTION, {"payment_id": payment_id, "amount": 90000})
+    await conn.commit()
+    await conn.execute(SET_URL, {"payment_id": payment_id, "url": f"https://pay.example/{order_id}"})
+    await conn.commit()
+
+
+async def create_payment_single_commit(conn, session_id):
+    order_id = str(uuid.uuid4())
+    url = f"https://pay.example/{order_id}"
+    payment_id = (await conn.execute(INSERT_PAYMENT, {"order_id": order_id, "amount": 90000, "url": url})).scalar()
+    await conn.execute(ASSIGN_SEATS, {"payment_id": payment_id, "session_id": session_id})
+    await conn.execute(INSERT_TRANSACTION, {"payment_id": payment_id, "amount": 90000})
+    await conn.commit()
+
+
+async def run(conn, label, create_payment, counter):
+    latencies = []
+    for _ in range(PAYMENTS):
+        session_id = uuid.uuid4().hex
+        await hold_seats(conn, session_id)
+        counter["commits"] = 0
+        start = time.perf_counter()
+        await create_payment(conn, session_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+        commits = counter["commits"]
+    latencies.sort()
+    print(
+        f"{label}: {commits} commits/payment, "
+        f"p50={statistics.median(latencies):.2f}ms p95={latencies[int(len(latencies) * 0.95)]:.2f}ms "
+        f"({PAYMENTS / (sum(latencies) / 1000):.0f} payments/s)"
+    )
+
+
+async def main():
+    counter = {"commits": 0}
+
+    def on_commit(conn):
+        counter["commits"] += 1
+
+    event.listen(async_engine.sync_engine, "commit", on_commit)
+    async with async_engine.connect() as conn:
+        await conn.execute(text(TEARDOWN))
+        for statement in SETUP:
+            await conn.execute(text(statement))
+        await conn.commit()
+        try:
+            await run(conn, "Four commits (old)", create_payment_four_commits, counter)
+            await run(conn, "Single commit (new)", create_payment_single_commit, counter)
+        finally:
+            await conn.execute(text(TEARDOWN))
+            await conn.commit()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+# docker-compose up -d postgres && python -m app.tests.payment_commit_benchmark
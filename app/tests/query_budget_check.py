@@ -0,0 +1,48 @@
+"""
+Kiểm tra ngân sách truy vấn SQL của các route (chế độ enforce)
+Gọi các endpoint GET qua TestClient với QUERY_BUDGET_MODE=enforce, in số câu SQL / thời gian
+database từ header Server-Timing và trả mã thoát 1 nếu có route vượt ngân sách @query_budget.
+Cần database có dữ liệu (DATABASE_URL như khi chạy server).
+"""
+
+import os
+import sys
+
+os.environ["QUERY_BUDGET_MODE"] = "enforce"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+DEFAULT_PATHS = ["/api/v1/bookings"]
+
+
+def declared_budgets():
+    """Liệt kê các route đã khai báo @query_budget"""
+    for route in app.routes:
+        budget = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+        if budget is not None:
+            yield ",".join(sorted(route.methods)), route.path, budget
+
+
+def main(paths):
+    print("Declared budgets:")
+    for methods, path, budget in declared_budgets():
+        print(f"  {methods:6} {path} <= {budget} queries")
+
+    failed = 0
+    with TestClient(app) as client:
+        for path in paths:
+            response = client.get(path)
+            timing = response.headers.get("server-timing", "-")
+            print(f"GET {path}: {response.status_code} [{timing}]")
+            if response.status_code == 500 and response.json().get("code") == "QUERY_BUDGET_EXCEEDED":
+                print(f"  ❌ {response.json()['message']}")
+                failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or DEFAULT_PATHS))
+
+# python -m app.tests.query_budget_check /api/v1/bookings /api/v1/bookings/ABC123
@@ -0,0 +1,68 @@
+"""
+Microbenchmark xác thực chữ ký IPN VNPay
+So sánh cách cũ (ghép chuỗi bằng +, tạo HMAC mới từ khóa cho mỗi lần, so sánh ==)
+với VNPay.verify (ghép query string một lượt, .copy() HMAC đã nạp khóa, hmac.compare_digest).
+Không cần database hay mạng.
+"""
+
+import hashlib
+import hmac
+import time
+import urllib.parse
+
+from app.payments.vnpay import VNPay
+
+SECRET_KEY = "DEMOSECRETKEYDEMOSECRETKEY123456"
+ITERATIONS = 50000
+
+IPN_PARAMS = {
+    "vnp_Amount": "18000000",
+    "vnp_BankCode": "NCB",
+    "vnp_BankTranNo": "VNP14567890",
+    "vnp_CardType": "ATM",
+    "vnp_OrderInfo": "Thanh toan ve xem phim CinePlus - 2 ghe",
+    "vnp_PayDate": "20251021193000",
+    "vnp_ResponseCode": "00",
+    "vnp_TmnCode": "CINEPLUS",
+    "vnp_TransactionNo": "14567890",
+    "vnp_TransactionStatus": "00",
+    "vnp_TxnRef": "5f0c7a52-8a57-4a4c-9d0c-2f7b8f1f3e21",
+}
+
+
+def legacy_verify(params, secret_key):
+    """Cách xác thực cũ của VNPay.validate_response (giữ lại để so sánh)"""
+    data = {k: v for k, v in params.items() if k.startswith("vnp_") and k not in ("vnp_SecureHash", "vnp_SecureHashType")}
+    has_data = ""
+    seq = 0
+    for key, val in sorted(data.items()):
+        if seq == 1:
+            has_data = has_data + "&" + str(key) + "=" + urllib.parse.quote_plus(str(val))
+        else:
+            seq = 1
+            has_data = str(key) + "=" + urllib.parse.quote_plus(str(val))
+    hash_value = hmac.new(secret_key.encode("utf-8"), has_data.encode("utf-8"), hashlib.sha512).hexdigest()
+    return params["vnp_SecureHash"].lower() == hash_value.lower()
+
+
+def bench(label, verify):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        assert verify()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {ITERATIONS / elapsed:,.0f} verifications/s ({elapsed / ITERATIONS * 1e6:.2f}us each)")
+
+
+def main():
+    vnpay = VNPay(SECRET_KEY, "https://sandbox.vnpayment.vn/paymentv2/vpcpay.html")
+    params = dict(IPN_PARAMS, vnp_SecureHash=vnpay.sign(vnpay.encode(IPN_PARAMS)))
+    assert legacy_verify(params, SECRET_KEY), "Chữ ký của hai cách phải giống nhau"
+
+    bench("Legacy validate_response", lambda: legacy_verify(params, SECRET_KEY))
+    bench("VNPay.verify", lambda: vnpay.verify(params))
+
+
+if __name__ == "__main__":
+    main()
+
+# python -m app.tests.vnpay_verify_benchmark
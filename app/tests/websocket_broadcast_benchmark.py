@@ -0,0 +1,97 @@
+"""
+Benchmark phát sóng WebSocket: mô phỏng 5.000 kết nối với độ trễ hỗn hợp
+So sánh cách gửi tuần tự cũ với broadcast_to_showtime qua hàng đợi riêng của từng kết nối.
+"""
+
+import asyncio
+import random
+import time
+
+from app.core.websocket_manager import WebSocketManager
+
+SHOWTIME_ID = 1
+CONNECTIONS = 5000
+
+
+class FakeWebSocket:
+    """WebSocket giả lập với độ trễ gửi cố định"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.latency)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_connections():
+    # 90% client nhanh, 9% mạng di động chậm, 1% client gần như treo
+    random.seed(42)
+    connections = []
+    for _ in range(CONNECTIONS):
+        r = random.random()
+        if r < 0.90:
+            latency = random.uniform(0.0005, 0.005)
+        elif r < 0.99:
+            latency = random.uniform(0.05, 0.3)
+        else:
+            latency = 10.0
+        connections.append(FakeWebSocket(latency))
+    return connections
+
+
+async def sequential_broadcast(connections, message: str, per_send_timeout: float):
+    """Cách cũ: await lần lượt từng kết nối (có thêm timeout để benchmark kết thúc được)"""
+    for connection in connections:
+        try:
+            await asyncio.wait_for(connection.send_text(message), timeout=per_send_timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main():
+    manager = WebSocketManager()
+    connections = make_connections()
+    for connection in connections:
+        await manager.connect(connection, SHOWTIME_ID)
+    fast_connections = [c for c in connections if c.latency < 1.0]
+
+    message = {"type": "seats_reserved", "showtime_id": SHOWTIME_ID, "data": {"seat_ids": [1, 2, 3]}}
+
+    # Thời gian đến khi mọi client không bị treo đã nhận được tin
+    start = time.perf_counter()
+    await manager.broadcast_to_showtime(message, SHOWTIME_ID)
+    enqueue_elapsed = time.perf_counter() - start
+    while sum(c.received for c in fast_connections) < len(fast_connections):
+        await asyncio.sleep(0.005)
+    concurrent_elapsed = time.perf_counter() - start
+    print(f"Queued fan-out: enqueue={enqueue_elapsed:.3f}s, "
+          f"all responsive clients delivered after {concurrent_elapsed:.3f}s")
+
+    # Chờ quá thời gian gửi để các client treo bị ngắt kết nối
+    await asyncio.sleep(3)
+    remaining = manager.get_connection_count(SHOWTIME_ID)
+    print(f"Dropped slow consumers: {CONNECTIONS - remaining}")
+
+    # Baseline tuần tự chỉ chạy trên 500 kết nối đầu tiên rồi ngoại suy, vì chạy hết mất nhiều phút
+    sample = connections[:500]
+    start = time.perf_counter()
+    await sequential_broadcast(sample, "{}", per_send_timeout=2.0)
+    sequential_elapsed = (time.perf_counter() - start) * (CONNECTIONS / len(sample))
+    print(f"Sequential (extrapolated): {sequential_elapsed:.3f}s")
+
+    for connection in list(manager.connection_info):
+        await manager.disconnect(connection)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+# python -m app.tests.websocket_broadcast_benchmark
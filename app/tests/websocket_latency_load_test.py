@@ -0,0 +1,126 @@
+"""
+Load test: độ trễ ping/pong WebSocket trong khi có lưu lượng đặt/hủy ghế
+Chạy với server đang hoạt động (uvicorn app.main:app). Giai đoạn 1 chỉ đo ping/pong,
+giai đoạn 2 đo tiếp trong khi nhiều client gọi liên tục /reservations/multiple và
+/reservations/cancel. Với tầng database bất đồng bộ, độ trễ WebSocket phải gần như không đổi.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import websockets
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(label, latencies):
+    if not latencies:
+        print(f"{label}: no samples")
+        return
+    print(
+        f"{label}: n={len(latencies)} "
+        f"p50={statistics.median(latencies):.1f}ms "
+        f"p95={percentile(latencies, 95):.1f}ms "
+        f"p99={percentile(latencies, 99):.1f}ms "
+        f"max={max(latencies):.1f}ms"
+    )
+
+
+async def ping_client(ws_url, stop_event, latencies):
+    """Client WebSocket gửi ping mỗi 100ms và đo thời gian đến khi nhận pong"""
+    async with websockets.connect(ws_url) as websocket:
+        await websocket.recv()  # initial_data
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            await websocket.send(json.dumps({"type": "ping"}))
+            # Bỏ qua các frame sự kiện ghế cho đến khi nhận pong
+            while True:
+                message = json.loads(await websocket.recv())
+                if message.get("type") == "pong":
+                    break
+            latencies.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.1)
+
+
+def booking_worker(base_url, showtime_id, seat_ids, stop_time, counters):
+    """Client HTTP: giữ một nhóm ghế rồi hủy, lặp lại đến hết thời gian"""
+    session = requests.Session()
+    while time.time() < stop_time:
+        session_id = f"load-{uuid.uuid4().hex[:8]}"
+        payload = [
+            {"seat_id": seat_id, "showtime_id": showtime_id, "session_id": session_id}
+            for seat_id in seat_ids
+        ]
+        response = session.post(f"{base_url}/api/v1/reservations/multiple", json=payload)
+        counters["holds"] += 1
+        if response.status_code == 200:
+            session.post(f"{base_url}/api/v1/reservations/cancel", json={
+                "showtime_id": showtime_id,
+                "seat_ids": seat_ids,
+                "session_id": session_id
+            })
+            counters["cancels"] += 1
+        else:
+            counters["conflicts"] += 1
+
+
+async def measure(ws_url, clients, duration):
+    latencies = []
+    stop_event = asyncio.Event()
+    tasks = [asyncio.create_task(ping_client(ws_url, stop_event, latencies)) for _ in range(clients)]
+    await asyncio.sleep(duration)
+    stop_event.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies
+
+
+async def main(args):
+    ws_base = args.base_url.replace("http://", "ws://").replace("https://", "wss://")
+    ws_url = f"{ws_base}/api/v1/ws/seats/{args.showtime_id}"
+
+    baseline = await measure(ws_url, args.ws_clients, args.duration)
+    report("WebSocket latency (idle)", baseline)
+
+    # Mỗi worker đặt một nhóm ghế riêng để tránh xung đột giữa các worker
+    counters = {"holds": 0, "cancels": 0, "conflicts": 0}
+    stop_time = time.time() + args.duration
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=args.booking_clients) as executor:
+        futures = [
+            loop.run_in_executor(
+                executor, booking_worker, args.base_url, args.showtime_id,
+                [args.first_seat_id + i * args.seats_per_hold + j for j in range(args.seats_per_hold)],
+                stop_time, counters
+            )
+            for i in range(args.booking_clients)
+        ]
+        loaded = await measure(ws_url, args.ws_clients, args.duration)
+        await asyncio.gather(*futures)
+    report("WebSocket latency (booking load)", loaded)
+    print(f"Booking traffic: {counters['holds']} holds, {counters['cancels']} cancels, "
+          f"{counters['conflicts']} rejected ({counters['holds'] / args.duration:.1f} holds/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--showtime-id", type=int, default=7)
+    parser.add_argument("--first-seat-id", type=int, default=1)
+    parser.add_argument("--seats-per-hold", type=int, default=2)
+    parser.add_argument("--ws-clients", type=int, default=50)
+    parser.add_argument("--booking-clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0)
+    asyncio.run(main(parser.parse_args()))
+
+# python -m app.tests.websocket_latency_load_test --showtime-id 7 --first-seat-id 1
@@ -1 +1,22 @@
- 
\ No newline at end of file
+import base64
+import json
+
+from fastapi import HTTPException, status
+
+
+# Mã hóa vị trí trang (keyset) thành chuỗi cursor gửi cho client
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# Giải mã cursor do encode_cursor tạo ra, cursor không hợp lệ trả về lỗi 400
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
@@ -0,0 +1,138 @@
+"""
+Phân trang dùng chung cho các danh sách quản trị (phim, người dùng, hạng, combo)
+- Keyset: cursor mờ mã hóa (sort_key, id) của dòng cuối trang trước, truy vấn trang sau bằng
+  so sánh bộ (sort_key, id) nên chi phí không tăng theo độ sâu trang như OFFSET.
+- Offset (skip/limit) giữ lại làm phương án dự phòng; trang offset cũng trả về next_cursor để
+  client chuyển sang keyset từ trang thứ hai.
+- Đếm tổng: exact (COUNT như cũ), estimated (pg_class.reltuples khi không lọc, COUNT có cache
+  khi có lọc) hoặc none (bỏ qua COUNT).
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Hashable, Optional, Tuple
+import threading
+import time
+
+from fastapi import HTTPException, status
+from sqlalchemy import text, tuple_
+from sqlalchemy.orm import Query
+
+from app.core.config import settings
+from app.utils.helpers import decode_cursor, encode_cursor
+
+COUNT_MODES = ("exact", "estimated", "none")
+# Số kết quả COUNT (theo bảng + bộ lọc) giữ trong cache tối đa
+MAX_CACHED_COUNTS = 1024
+
+_count_cache: Dict[Hashable, Tuple[int, float]] = {}
+_count_cache_lock = threading.Lock()
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _parse_key(column, raw: Any) -> Any:
+    """Chuyển giá trị sort_key trong cursor (JSON) về kiểu của cột"""
+    try:
+        python_type = column.expression.type.python_type
+        if python_type in (datetime, date):
+            return python_type.fromisoformat(raw)
+        if isinstance(raw, python_type):
+            return raw
+        return python_type(raw)
+    except (TypeError, ValueError, NotImplementedError):
+        raise _invalid_cursor()
+
+
+def _estimated_count(query: Query, table_name: str, filtered: bool, cache_key: Hashable) -> int:
+    """Số dòng ước lượng: reltuples khi không lọc, COUNT có cache PAGINATION_COUNT_CACHE_TTL giây khi có lọc"""
+    if not filtered:
+        estimate = query.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"),
+            {"table_name": table_name},
+        ).scalar()
+        # reltuples = -1 khi bảng chưa từng được ANALYZE
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(cache_key)
+    if cached is not None and now - cached[1] < settings.PAGINATION_COUNT_CACHE_TTL:
+        return cached[0]
+    total = query.order_by(None).count()
+    with _count_cache_lock:
+        if len(_count_cache) >= MAX_CACHED_COUNTS:
+            _count_cache.clear()
+        _count_cache[cache_key] = (total, now)
+    return total
+
+
+def paginate(
+    query: Query,
+    id_column,
+    sort_column=None,
+    *,
+    descending: bool = True,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    count: str = "exact",
+    filters: Tuple = (),
+) -> dict:
+    """Phân trang query đã lọc theo (sort_column, id_column), hoặc chỉ id_column nếu không có sort_column.
+    Có cursor thì dùng keyset (bỏ qua skip), không thì OFFSET. `filters` là các giá trị lọc đã áp
+    dụng, dùng làm khóa cache cho count="estimated"."""
+    if count not in COUNT_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"count must be one of {', '.join(COUNT_MODES)}",
+        )
+    limit = max(1, limit)
+    skip = max(0, skip)
+    key_columns = (sort_column, id_column) if sort_column is not None else (id_column,)
+
+    total = None
+    if count == "exact":
+        total = query.order_by(None).count()
+    elif count == "estimated":
+        table_name = id_column.class_.__tablename__
+        total = _estimated_count(query, table_name, any(f is not None for f in filters), (table_name, filters))
+
+    order = [column.desc() if descending else column.asc() for column in key_columns]
+    page_query = query.order_by(None).order_by(*order)
+    if cursor:
+        values = decode_cursor(cursor)
+        if not isinstance(values.get("id"), int) or (sort_column is not None and "k" not in values):
+            raise _invalid_cursor()
+        if sort_column is not None:
+            bound = tuple_(sort_column, id_column)
+            after = tuple_(_parse_key(sort_column, values["k"]), values["id"])
+        else:
+            bound, after = id_column, values["id"]
+        page_query = page_query.filter(bound < after if descending else bound > after)
+        skip = 0
+    else:
+        page_query = page_query.offset(skip)
+
+    rows = page_query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        values = {"id": getattr(last, id_column.key)}
+        if sort_column is not None:
+            values["k"] = getattr(last, sort_column.key)
+        next_cursor = encode_cursor(values)
+
+    return {
+        "items": rows,
+        "total": total,
+        "total_estimated": count == "estimated",
+        "skip": skip,
+        "limit": limit,
+        "next_cursor": next_cursor,
+    }
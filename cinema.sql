@@ -379,6 +379,28 @@ CREATE TABLE email_verifications (
         TIME ZONE NOT NULL
 );
 
+-- Bảng RefreshTokens (Refresh token đã cấp, xoay vòng theo họ token)
+CREATE TABLE refresh_tokens (
+    "token_id" SERIAL PRIMARY KEY,
+    "jti" VARCHAR(64) NOT NULL UNIQUE,
+    "family_id" VARCHAR(64) NOT NULL,
+    "parent_jti" VARCHAR(64),
+    "user_id" INTEGER NOT NULL,
+    "issued_at" TIMESTAMP
+    WITH
+        TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        "expires_at" TIMESTAMP
+    WITH
+        TIME ZONE NOT NULL,
+        "used_at" TIMESTAMP
+    WITH
+        TIME ZONE,
+        "revoked_at" TIMESTAMP
+    WITH
+        TIME ZONE,
+        "revoked_reason" VARCHAR(50)
+);
+
 -- Phần 3: Tạo Indexes (Chỉ mục)
 -- Các chỉ mục giúp tăng tốc độ truy vấn
 
@@ -392,6 +414,9 @@ CREATE INDEX idx_ranks_name ON ranks (rank_name);
 
 CREATE INDEX idx_ranks_is_default ON ranks (is_default);
 
+-- Phân trang keyset danh sách hạng theo (spending_target, rank_id)
+CREATE INDEX idx_ranks_spending_target_rank_id ON ranks (spending_target, rank_id);
+
 CREATE INDEX idx_movies_title ON movies (title);
 
 CREATE INDEX idx_movies_status ON movies (status);
@@ -442,6 +467,12 @@ CREATE INDEX idx_payments_user_id ON payments (user_id);
 
 CREATE INDEX idx_payments_created_at ON payments (created_at);
 
+CREATE INDEX idx_refresh_tokens_family_id ON refresh_tokens (family_id);
+
+CREATE INDEX idx_refresh_tokens_user_id ON refresh_tokens (user_id);
+
+CREATE INDEX idx_refresh_tokens_revoked_at ON refresh_tokens (revoked_at) WHERE revoked_at IS NOT NULL;
+
 -- Phần 4: Thêm các Ràng buộc Khóa ngoại (Foreign Keys)
 -- Đảm bảo các bảng đã được tạo trước khi thêm FK
 
@@ -534,6 +565,9 @@ ADD CONSTRAINT fk_payments_transaction_id FOREIGN KEY (transaction_id) REFERENCE
 ALTER TABLE payments
 ADD CONSTRAINT fk_payments_user_id FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE SET NULL;
 
+ALTER TABLE refresh_tokens
+ADD CONSTRAINT fk_refresh_tokens_user_id FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE;
+
 -- Phần 5: Thêm các Ràng buộc CHECK (Kiểm tra dữ liệu)
 
 -- Thêm các ràng buộc CHECK cho bảng ranks